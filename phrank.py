@@ -14,8 +14,16 @@ from pyphrank.containers.union import Union
 from pyphrank.containers.ida_struc_wrapper import IdaStrucWrapper
 from pyphrank.containers.vtable import Vtable
 from pyphrank.type_flow_graph import TFG
+from pyphrank.vtable_scanner import VtableScanner
+from pyphrank.type_constructors.vtable_analyzer import VtableAnalyzer
+from pyphrank.rtti import RttiParser
 from pyphrank.ida_plugin import IDAPlugin
 from pyphrank.analysis_state import AnalysisState
+from pyphrank.analysis_diff import AnalysisDiff
+from pyphrank.type_cache import get_type_caches
+from pyphrank.call_graph import export_call_graph
+from pyphrank.tfg_store import TFGStore
+from pyphrank.call_graph_format import CallGraph
 import pyphrank.settings as settings
 
 from pyphrank.utils import *
@@ -30,9 +38,23 @@ def get_plugin_state() -> AnalysisState:
 	return get_plugin_instance().type_analyzer.state
 
 
-def apply_plugin_state():
+def apply_plugin_state(dry_run=False) -> AnalysisDiff:
+	"""Apply plugin analysis state, in dry run only get changes without applying them"""
 	plugin = get_plugin_instance()
-	plugin.type_analyzer.apply_analysis()
+	return plugin.type_analyzer.apply_analysis(dry_run=dry_run)
+
+
+def analyze_all_functions(dry_run=False) -> AnalysisDiff:
+	"""Analyze arguments and return values of all functions and apply results, in dry run only get changes"""
+	plugin = get_plugin_instance()
+	plugin.type_analyzer.analyze_everything()
+	return plugin.type_analyzer.apply_analysis(dry_run=dry_run)
+
+
+def print_type_cache_stats():
+	"""Print hit rates of type lookup caches"""
+	for cache in get_type_caches():
+		print(cache)
 
 
 def get_type_flow_graph(addr:int) -> TFG|None:
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+
+import idaapi
+
+from pyphrank.type_flow_graph_parts import Var
+from pyphrank.containers.structure import Structure
+import pyphrank.utils as utils
+
+
+def var2dict(var:Var) -> dict:
+	if var.is_local():
+		return {
+			"func_ea": hex(var.func_ea),
+			"func_name": idaapi.get_name(var.func_ea),
+			"lvar_id": var.lvar_id,
+		}
+	else:
+		return {
+			"obj_ea": hex(var.obj_ea),
+			"name": idaapi.get_name(var.obj_ea),
+		}
+
+def tif2str(tif:idaapi.tinfo_t) -> str|None:
+	if tif is utils.UNKNOWN_TYPE:
+		return None
+	return str(tif)
+
+def struct2dict(struct:Structure) -> dict:
+	members = []
+	for offset in struct.member_offsets():
+		members.append({
+			"offset": offset,
+			"name": struct.get_member_name(offset),
+			"type": tif2str(struct.get_member_type(offset) or utils.UNKNOWN_TYPE),
+			"size": struct.get_member_size(offset),
+		})
+	return {
+		"name": struct.name,
+		"size": struct.size,
+		"members": members,
+	}
+
+
+class AnalysisDiff:
+	""" Changes, that applying analysis makes to the database """
+	def __init__(self) -> None:
+		# var -> (current type, new type)
+		self.var_types : dict[Var, tuple[idaapi.tinfo_t, idaapi.tinfo_t]] = {}
+		# func_ea -> (current return type, new return type)
+		self.retvals : dict[int, tuple[idaapi.tinfo_t, idaapi.tinfo_t]] = {}
+		self.new_structs : list[Structure] = []
+		self.new_crefs : list[tuple[int, int]] = []
+
+	def is_empty(self) -> bool:
+		return len(self.var_types) == 0 and len(self.retvals) == 0 and len(self.new_structs) == 0 and len(self.new_crefs) == 0
+
+	def to_dict(self) -> dict:
+		var_types = []
+		for var, (old_type, new_type) in self.var_types.items():
+			var_types.append({
+				"var": var2dict(var),
+				"old": tif2str(old_type),
+				"new": tif2str(new_type),
+			})
+
+		retvals = []
+		for func_ea, (old_type, new_type) in self.retvals.items():
+			retvals.append({
+				"func_ea": hex(func_ea),
+				"func_name": idaapi.get_name(func_ea),
+				"old": tif2str(old_type),
+				"new": tif2str(new_type),
+			})
+
+		crefs = [{"from": hex(frm), "to": hex(to)} for frm, to in self.new_crefs]
+		return {
+			"var_types": var_types,
+			"retvals": retvals,
+			"new_structs": [struct2dict(s) for s in self.new_structs],
+			"new_crefs": crefs,
+		}
+
+	def to_json(self, indent:int|None=None) -> str:
+		return json.dumps(self.to_dict(), indent=indent)
+
+	def save(self, fname:str):
+		with open(fname, 'w') as f:
+			f.write(self.to_json(indent=1))
+
+	def __str__(self) -> str:
+		return f"AnalysisDiff(vars={len(self.var_types)},retvals={len(self.retvals)},structs={len(self.new_structs)},crefs={len(self.new_crefs)})"
@@ -1,7 +1,10 @@
 from __future__ import annotations
+from typing import Any
+
 import idaapi
 
 from pyphrank.type_flow_graph_parts import Var
+from pyphrank.function_summary import FunctionSummary
 import pyphrank.utils as utils
 
 
@@ -10,12 +13,79 @@ class AnalysisState:
 		self.vars : dict[Var, idaapi.tinfo_t] = {}
 		self.retvals : dict[int, idaapi.tinfo_t] = {}
 
+		# increased on every change of vars or retvals
+		self.version = 0
+		self._var_versions : dict[Var, int] = {}
+
+		# per-run cache of sexpr types, key -> (version, type)
+		self.sexpr_types : dict[Any, tuple[tuple[int, int, int], idaapi.tinfo_t]] = {}
+
+		# call site address -> (version, possible called addresses), empty if call is not resolved
+		self.call_targets : dict[int, tuple[tuple[int, int, int], frozenset[int]]] = {}
+
+		# function address -> summary of its cached tfg
+		self.summaries : dict[int, FunctionSummary] = {}
+		# function address -> summary, composed with summaries of called functions
+		self.composed_summaries : dict[int, FunctionSummary] = {}
+
 	def get_var(self, var:Var, default=utils.UNKNOWN_TYPE):
 		return self.vars.get(var, default)
 
+	def set_var(self, var:Var, var_type:idaapi.tinfo_t):
+		self.vars[var] = var_type
+		self.version += 1
+		self._var_versions[var] = self.version
+
+	def get_var_version(self, var:Var) -> int:
+		return self._var_versions.get(var, 0)
+
+	def set_retval(self, func_ea:int, retval_type:idaapi.tinfo_t):
+		self.retvals[func_ea] = retval_type
+		self.version += 1
+
+	def get_call_targets(self, call_ea:int, version:tuple[int, int, int]) -> frozenset[int]|None:
+		""" Returns None if call is not resolved yet or resolved with outdated analysis data """
+		cached = self.call_targets.get(call_ea)
+		if cached is None or cached[0] != version:
+			return None
+		return cached[1]
+
+	def set_call_targets(self, call_ea:int, version:tuple[int, int, int], targets:frozenset[int]):
+		self.call_targets[call_ea] = (version, targets)
+
+	def iterate_call_targets(self):
+		""" Resolved calls as (call site address, called address) """
+		for call_ea, (_, targets) in self.call_targets.items():
+			for target in targets:
+				yield call_ea, target
+
+	def get_summary(self, func_ea:int) -> FunctionSummary|None:
+		return self.summaries.get(func_ea)
+
+	def set_summary(self, func_ea:int, summary:FunctionSummary):
+		self.summaries[func_ea] = summary
+
+	def get_composed_summary(self, func_ea:int) -> FunctionSummary|None:
+		return self.composed_summaries.get(func_ea)
+
+	def set_composed_summary(self, func_ea:int, summary:FunctionSummary):
+		self.composed_summaries[func_ea] = summary
+
+	def drop_summary(self, func_ea:int):
+		""" Composed summaries of callers include dropped function, so they are dropped too """
+		self.summaries.pop(func_ea, None)
+		if func_ea in self.composed_summaries:
+			self.composed_summaries.clear()
+
 	def clear(self):
 		self.vars.clear()
 		self.retvals.clear()
+		self._var_versions.clear()
+		self.sexpr_types.clear()
+		self.call_targets.clear()
+		self.summaries.clear()
+		self.composed_summaries.clear()
+		self.version += 1
 
 	def print_type_locations(self, needle:str|int|idaapi.tinfo_t):
 		if isinstance(needle, int):
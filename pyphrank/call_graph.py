@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import time
+
+import idaapi
+import idautils
+import idc
+
+from pyphrank.call_graph_format import CallEdge, CallGraphWriter, EDGE_VIRTUAL, CONFIDENCE_ANALYSIS, CONFIDENCE_XREF
+from pyphrank.containers.vtable import Vtable
+from pyphrank.vtable_slots import VTABLE_SLOTS
+import pyphrank.utils as utils
+
+
+def get_vtable_sources() -> dict[int, int]:
+	""" Virtual function address -> address of first vtable, that has it """
+	sources : dict[int, int] = {}
+	for _, strucid, _ in idautils.Structs():
+		slots = VTABLE_SLOTS.get_slots(strucid)
+		if slots is None or len(slots) == 0:
+			continue
+
+		vtbl_ea = Vtable(strucid).get_ea()
+		if vtbl_ea == idaapi.BADADDR:
+			vtbl_ea = 0
+		for func_ea in slots.values():
+			current = sources.setdefault(func_ea, vtbl_ea)
+			if current == 0 or (vtbl_ea != 0 and vtbl_ea < current):
+				sources[func_ea] = vtbl_ea
+	return sources
+
+def is_direct_call(call_ea:int) -> bool:
+	return idc.get_operand_type(call_ea, 0) in (idc.o_near, idc.o_far)
+
+def get_func_call_edges(func_ea:int, resolved:dict[int, set[int]], vtable_sources:dict[int, int]) -> list[CallEdge]:
+	"""
+	Call edges from code references of function instructions
+	and from calls, that are resolved by analysis, but not yet added to database
+	"""
+	edges = []
+	for item in idautils.FuncItems(func_ea):
+		targets = set()
+		for x in idautils.XrefsFrom(item, 0):
+			if x.type != idaapi.fl_CN and x.type != idaapi.fl_CF:
+				continue
+			targets.add(x.to)
+
+		analysis_targets = resolved.get(item, set())
+		direct = is_direct_call(item)
+		for target in sorted(targets | analysis_targets):
+			if direct:
+				edge = CallEdge(item, target)
+			else:
+				confidence = CONFIDENCE_ANALYSIS if target in analysis_targets else CONFIDENCE_XREF
+				edge = CallEdge(item, target, EDGE_VIRTUAL, confidence, vtable_sources.get(target, 0))
+			edges.append(edge)
+	return edges
+
+def export_call_graph(fname:str, resolved_calls=()) -> tuple[int, int]:
+	"""
+	Write call graph of whole database, with direct and virtual calls, to file.
+	Resolved calls are (call site, called address) of current analysis.
+	Returns nodes and edges counts
+	"""
+	start = time.time()
+	resolved : dict[int, set[int]] = {}
+	for call_ea, target in resolved_calls:
+		resolved.setdefault(call_ea, set()).add(target)
+
+	vtable_sources = get_vtable_sources()
+	funcs = sorted(utils.iterate_all_functions())
+	with CallGraphWriter(fname, funcs) as writer:
+		for func_ea in funcs:
+			writer.add_node_edges(func_ea, get_func_call_edges(func_ea, resolved, vtable_sources))
+		edges_count = writer.edges_count
+
+	utils.log_info(f"exported call graph with {len(funcs)} functions and {edges_count} calls to {fname} in {time.time() - start:.2f}s")
+	return len(funcs), edges_count
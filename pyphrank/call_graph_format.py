@@ -0,0 +1,189 @@
+"""
+Binary format of exported call graph, does not depend on IDA.
+Graph is in CSR form: edges are grouped by caller, edges of node i
+are edges[offsets[i]:offsets[i + 1]].
+
+File layout (little endian):
+	header
+	edges, EDGE_FORMAT records
+	nodes, sorted function addresses, u64 each
+	offsets, nodes count + 1 of u64
+"""
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+
+
+MAGIC = b"PHCG"
+VERSION = 1
+# magic, version, nodes count, edges count, nodes position in file
+HEADER_FORMAT = "<4sIQQQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# call site, called address, vtable address, called node index, kind, confidence
+EDGE_FORMAT = "<QQQIBB2x"
+EDGE_SIZE = struct.calcsize(EDGE_FORMAT)
+
+# called address is not a function start in graph
+NO_NODE = 0xFFFFFFFF
+
+EDGE_DIRECT = 0
+EDGE_VIRTUAL = 1
+
+# direct calls from instruction operands
+CONFIDENCE_DIRECT = 100
+# virtual calls resolved by type analysis
+CONFIDENCE_ANALYSIS = 90
+# virtual calls from code references in database, e.g. from previous analyses
+CONFIDENCE_XREF = 60
+
+
+def u64s2bytes(values:array) -> bytes:
+	if sys.byteorder == "big":
+		values = array('Q', values)
+		values.byteswap()
+	return values.tobytes()
+
+def bytes2u64s(data:bytes) -> array:
+	values = array('Q')
+	values.frombytes(data)
+	if sys.byteorder == "big":
+		values.byteswap()
+	return values
+
+
+class CallEdge:
+	__slots__ = "call_ea", "target", "vtable", "kind", "confidence"
+
+	def __init__(self, call_ea:int, target:int, kind:int=EDGE_DIRECT, confidence:int=CONFIDENCE_DIRECT, vtable:int=0) -> None:
+		self.call_ea = call_ea
+		self.target = target
+		self.kind = kind
+		self.confidence = confidence
+		# address of vtable, that virtual function is taken from, 0 if unknown
+		self.vtable = vtable
+
+	def is_virtual(self) -> bool:
+		return self.kind == EDGE_VIRTUAL
+
+	def __eq__(self, other:object) -> bool:
+		if not isinstance(other, CallEdge):
+			return False
+		return (self.call_ea, self.target, self.vtable, self.kind, self.confidence) == \
+			(other.call_ea, other.target, other.vtable, other.kind, other.confidence)
+
+	def __repr__(self) -> str:
+		return f"CallEdge({hex(self.call_ea)}->{hex(self.target)},kind={self.kind},confidence={self.confidence},vtable={hex(self.vtable)})"
+
+
+class CallGraphWriter:
+	"""
+	Writes call graph edge by edge, only node offsets are kept in memory.
+	Edges of nodes must be added in order of nodes
+	"""
+	def __init__(self, fname:str, nodes:list[int]) -> None:
+		self.nodes = array('Q', sorted(nodes))
+		self.node_ids = {ea: i for i, ea in enumerate(self.nodes)}
+		self.offsets = array('Q', [0])
+		self.edges_count = 0
+		self.f = open(fname, "wb")
+		self.f.write(b"\x00" * HEADER_SIZE)
+
+	def __enter__(self) -> CallGraphWriter:
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def add_node_edges(self, node:int, edges:list[CallEdge]):
+		node_id = self.node_ids[node]
+		if node_id < len(self.offsets) - 1:
+			raise ValueError(f"edges of {hex(node)} are added out of order")
+
+		# nodes without edges in between
+		while len(self.offsets) <= node_id:
+			self.offsets.append(self.edges_count)
+
+		for edge in edges:
+			target_id = self.node_ids.get(edge.target, NO_NODE)
+			self.f.write(struct.pack(EDGE_FORMAT, edge.call_ea, edge.target, edge.vtable, target_id, edge.kind, edge.confidence))
+		self.edges_count += len(edges)
+		self.offsets.append(self.edges_count)
+
+	def close(self):
+		if self.f.closed:
+			return
+
+		while len(self.offsets) <= len(self.nodes):
+			self.offsets.append(self.edges_count)
+
+		nodes_pos = self.f.tell()
+		self.f.write(u64s2bytes(self.nodes))
+		self.f.write(u64s2bytes(self.offsets))
+		self.f.seek(0)
+		self.f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(self.nodes), self.edges_count, nodes_pos))
+		self.f.close()
+
+
+class CallGraph:
+	""" Loaded call graph, edges are stored in columns """
+	def __init__(self) -> None:
+		self.nodes = array('Q')
+		self.offsets = array('Q', [0])
+		self.call_eas = array('Q')
+		self.targets = array('Q')
+		self.vtables = array('Q')
+		self.target_ids = array('I')
+		self.kinds = array('B')
+		self.confidences = array('B')
+		self.node_ids : dict[int, int] = {}
+
+	@classmethod
+	def load(cls, fname:str) -> CallGraph:
+		graph = cls()
+		with open(fname, "rb") as f:
+			data = f.read()
+
+		magic, version, nodes_count, edges_count, nodes_pos = struct.unpack_from(HEADER_FORMAT, data)
+		if magic != MAGIC or version != VERSION:
+			raise ValueError(f"{fname} is not a call graph of version {VERSION}")
+
+		edges_end = HEADER_SIZE + edges_count * EDGE_SIZE
+		for call_ea, target, vtable, target_id, kind, confidence in struct.iter_unpack(EDGE_FORMAT, data[HEADER_SIZE:edges_end]):
+			graph.call_eas.append(call_ea)
+			graph.targets.append(target)
+			graph.vtables.append(vtable)
+			graph.target_ids.append(target_id)
+			graph.kinds.append(kind)
+			graph.confidences.append(confidence)
+
+		offsets_pos = nodes_pos + nodes_count * 8
+		graph.nodes = bytes2u64s(data[nodes_pos:offsets_pos])
+		graph.offsets = bytes2u64s(data[offsets_pos:offsets_pos + (nodes_count + 1) * 8])
+		graph.node_ids = {ea: i for i, ea in enumerate(graph.nodes)}
+		return graph
+
+	def __len__(self) -> int:
+		return len(self.nodes)
+
+	def edges_count(self) -> int:
+		return len(self.call_eas)
+
+	def get_edge(self, i:int) -> CallEdge:
+		return CallEdge(self.call_eas[i], self.targets[i], self.kinds[i], self.confidences[i], self.vtables[i])
+
+	def get_edges(self, func_ea:int) -> list[CallEdge]:
+		node_id = self.node_ids.get(func_ea)
+		if node_id is None:
+			return []
+		return [self.get_edge(i) for i in range(self.offsets[node_id], self.offsets[node_id + 1])]
+
+	def get_callees(self, func_ea:int) -> set[int]:
+		return set(e.target for e in self.get_edges(func_ea))
+
+	def iterate_edges(self):
+		""" Yields (caller, edge) for all edges """
+		for node_id, func_ea in enumerate(self.nodes):
+			for i in range(self.offsets[node_id], self.offsets[node_id + 1]):
+				yield func_ea, self.get_edge(i)
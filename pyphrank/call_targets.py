@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import idaapi
+import idc
+import ida_struct
+
+from pyphrank.vtable_slots import VTABLE_SLOTS
+import pyphrank.utils as utils
+from pyphrank.type_cache import register_close_invalidator
+
+
+NO_TARGETS : frozenset[int] = frozenset()
+
+
+class CallTargets:
+	"""
+	Possible called addresses of vtable slots, including overrides in derived classes.
+	Target sets are calculated once per (vtable strucid, slot) and shared between calls
+	"""
+	def __init__(self) -> None:
+		# vtable strucid -> strucids of vtables in derived classes, that replace it
+		self.overrides : dict[int, set[int]] = {}
+		# (vtable or vtables union strucid, slot offset) -> called addresses
+		self.targets : dict[tuple[int, int], frozenset[int]] = {}
+		# equal target sets are the same object
+		self._interned : dict[frozenset[int], frozenset[int]] = {NO_TARGETS: NO_TARGETS}
+		# increased, when calculated targets are dropped
+		self.generation = 0
+
+	def __len__(self) -> int:
+		return len(self.targets)
+
+	def add_override(self, base_strucid:int, derived_strucid:int):
+		if base_strucid == derived_strucid:
+			return
+
+		derived = self.overrides.setdefault(base_strucid, set())
+		if derived_strucid in derived:
+			return
+		derived.add(derived_strucid)
+		# targets of bases might change
+		self.invalidate()
+
+	def invalidate(self):
+		""" Drop calculated targets, e.g. when vtables union gets new member """
+		self.targets.clear()
+		self.generation += 1
+
+	def get_union_vtables(self, strucid:int) -> list[int]:
+		""" Vtables union has pointers to vtables as members """
+		vtables = []
+		sptr = ida_struct.get_struc(strucid)
+		# union members are addressed by their index
+		for member_idx in range(idc.get_member_qty(strucid)):
+			mptr = ida_struct.get_member(sptr, member_idx)
+			mtif = idaapi.tinfo_t()
+			if mptr is None or not ida_struct.get_member_tinfo(mtif, mptr) or not mtif.is_ptr():
+				continue
+			vtbl_strucid = utils.tif2strucid(mtif.get_pointed_object())
+			if vtbl_strucid != -1:
+				vtables.append(vtbl_strucid)
+		return vtables
+
+	def get_vtables(self, strucid:int) -> list[int]:
+		""" Vtable itself and all vtables, that replace it in derived classes """
+		if idc.is_union(strucid):
+			queue = self.get_union_vtables(strucid)
+		else:
+			queue = [strucid]
+
+		vtables = []
+		visited = set(queue)
+		while len(queue) != 0:
+			vtbl_strucid = queue.pop(0)
+			vtables.append(vtbl_strucid)
+			for derived in self.overrides.get(vtbl_strucid, ()):
+				if derived in visited:
+					continue
+				visited.add(derived)
+				queue.append(derived)
+		return vtables
+
+	def get_targets(self, strucid:int, slot:int) -> frozenset[int]|None:
+		""" Returns None, if none of the vtables is indexed """
+		key = (strucid, slot)
+		targets = self.targets.get(key)
+		if targets is not None:
+			return targets
+
+		is_indexed = False
+		addrs = set()
+		for vtbl_strucid in self.get_vtables(strucid):
+			addr = VTABLE_SLOTS.get(vtbl_strucid, slot)
+			if addr is None:
+				continue
+			is_indexed = True
+			if addr != -1:
+				addrs.add(addr)
+
+		if not is_indexed:
+			return None
+
+		targets = frozenset(addrs)
+		targets = self._interned.setdefault(targets, targets)
+		self.targets[key] = targets
+		return targets
+
+	def clear(self):
+		self.overrides.clear()
+		self.targets.clear()
+		self._interned = {NO_TARGETS: NO_TARGETS}
+		self.generation += 1
+
+
+CALL_TARGETS = CallTargets()
+register_close_invalidator(CALL_TARGETS.clear)
@@ -1,27 +1,108 @@
 from __future__ import annotations
 
-import idc
 import idaapi
 
 from pyphrank.containers.structure import Structure
+from pyphrank.containers.struct_layout import get_layout, register_layout, unregister_layout
+from pyphrank.containers.struct_decls import StructDeclBatch
+from pyphrank.type_flow_graph_parts import TRANSFORM_CACHE
+from pyphrank.type_cache import invalidate_struc
+from pyphrank.vtable_slots import VTABLE_SLOTS
 
+import pyphrank.settings as settings
 import pyphrank.utils as utils
 
 
 class ContainerManager:
 	def __init__(self) -> None:
 		self.new_types : dict[int, Structure] = {}
+		# increased on every modification of new types
+		self.version = 0
 
 	def delete_containers(self):
-		for t in self.new_types:
-			idc.del_struc(t)
+		for struct in self.new_types.values():
+			struct.delete()
 		self.new_types.clear()
+		TRANSFORM_CACHE.clear()
+		self.version += 1
 
 	def clear(self):
 		self.new_types.clear()
+		TRANSFORM_CACHE.clear()
+		self.version += 1
+
+	def flush_containers(self):
+		"""
+		Create members of new types in database.
+		Structures, that are nested in other structures, are flushed first,
+		so that their sizes are known when they are set as member types
+		"""
+		ordered : list[Structure] = []
+		visited = set()
+		def visit(struct:Structure):
+			if struct.strucid in visited:
+				return
+			visited.add(struct.strucid)
+
+			for offset in struct.member_offsets():
+				mtif = struct.get_member_type(offset)
+				if mtif is None or not mtif.is_struct():
+					continue
+				nested = self.new_types.get(utils.tif2strucid(mtif))
+				if nested is not None:
+					visit(nested)
+			ordered.append(struct)
+
+		for struct in self.new_types.values():
+			visit(struct)
+
+		if settings.CREATE_TYPES_FROM_DECLS:
+			self.flush_from_decls(ordered)
+
+		# structures, that failed to be created from declarations, are flushed one by one
+		for struct in ordered:
+			struct.flush()
+
+	def flush_from_decls(self, structs:list[Structure]):
+		batch = StructDeclBatch()
+		for struct in structs:
+			if struct.layout is not None:
+				batch.add_layout(struct.name, struct.layout)
+
+		strucids = batch.create()
+		for struct in structs:
+			strucid = strucids.get(struct.name, -1)
+			if strucid == -1:
+				continue
+
+			struct.drop_layout()
+			if strucid != struct.strucid:
+				utils.log_warn(f"{struct.name} changed id from {hex(struct.strucid)} to {hex(strucid)} on creation")
+				self.remap_struct(struct, strucid)
+
+	def remap_struct(self, struct:Structure, strucid:int):
+		"""
+		Move new structure to new strucid. Layout and vtable slots are moved too,
+		other data kept by old strucid is dropped
+		"""
+		old_strucid = struct.strucid
+		self.new_types.pop(old_strucid, None)
+		struct.strucid = strucid
+		self.new_types[strucid] = struct
+		if (layout := get_layout(old_strucid)) is not None:
+			unregister_layout(old_strucid)
+			register_layout(strucid, layout)
+		VTABLE_SLOTS.move(old_strucid, strucid)
+		invalidate_struc(old_strucid)
+		self.version += 1
+
+	def struct_modified(self, strucid:int):
+		TRANSFORM_CACHE.invalidate_struct(strucid)
+		self.version += 1
 
 	def add_struct(self, struc:Structure):
 		self.new_types[struc.strucid] = struc
+		self.version += 1
 
 	def get_struct(self, strucid:int) -> Structure|None:
 		return self.new_types.get(strucid)
@@ -36,11 +117,20 @@ class ContainerManager:
 		if lvar_struct is None:
 			return
 
+		# in-memory structures record name together with use of the member
+		layout = lvar_struct.layout
+		if layout is not None:
+			layout.add_evidence(offset)
+			layout.set_member_name(offset, name)
+			self.struct_modified(strucid)
+			return
+
 		# use of the member exists, thus there should be the field
 		if not lvar_struct.member_exists(offset):
 			lvar_struct.add_member(offset)
 
 		lvar_struct.set_member_name(offset, name)
+		self.struct_modified(strucid)
 
 	def add_member_type(self, strucid:int, offset:int, member_type:idaapi.tinfo_t):
 		# rogue shifted struct
@@ -52,42 +142,55 @@ class ContainerManager:
 		if lvar_struct is None:
 			return
 
+		# in-memory structures collect all uses and resolve members at once
+		layout = lvar_struct.layout
+		if layout is not None:
+			if member_type is utils.UNKNOWN_TYPE:
+				is_new = layout.add_evidence(offset)
+			else:
+				nested = None
+				if member_type.is_struct():
+					nested = get_layout(utils.tif2strucid(member_type))
+				is_new = layout.add_evidence(offset, member_type, utils.get_tif_size(member_type), nested)
+			if is_new:
+				self.struct_modified(strucid)
+			return
+
 		# use of the member exists, thus there should be the field
 		if not lvar_struct.member_exists(offset):
 			if not lvar_struct.add_member(offset):
 				return
+			self.struct_modified(strucid)
 
 		# if unknown, then simply creating new member is enough
 		if member_type is utils.UNKNOWN_TYPE:
 			return
 
 		next_offset = lvar_struct.get_next_member_offset(offset)
-		if next_offset != -1 and offset + member_type.get_size() > next_offset:
-			# TODO remove when struct sizes are remembered
-			# currently struct size is set by adding 1byte int at the end
-			# if that is the case, then allow member type setting
-			if lvar_struct.get_member_size(next_offset) != 1 or lvar_struct.size != next_offset + 1:
-				utils.log_warn(
-					f"failed to change type of "\
-					f"{lvar_struct.name} at {hex(offset)} "\
-					f"to {str(member_type)} "\
-					f"because it overwrites next field at "\
-					f"{hex(next_offset)} skipping member type change"
-				)
-				return
+		if next_offset != -1 and offset + utils.get_tif_size(member_type) > next_offset:
+			utils.log_warn(
+				f"failed to change type of "\
+				f"{lvar_struct.name} at {hex(offset)} "\
+				f"to {str(member_type)} "\
+				f"because it overwrites next field at "\
+				f"{hex(next_offset)} skipping member type change"
+			)
+			return
 
 		member_offset = lvar_struct.get_member_start(offset)
 		current_type = lvar_struct.get_member_type(offset)
 		if current_type is None:
 			lvar_struct.set_member_type(offset, member_type)
+			self.struct_modified(strucid)
 			return
 
-		if current_type.is_integral() and current_type.get_size() <= member_type.get_size() and member_type.is_ptr():
+		if current_type.is_integral() and current_type.get_size() <= utils.get_tif_size(member_type) and member_type.is_ptr():
 			lvar_struct.set_member_type(offset, member_type)
+			self.struct_modified(strucid)
 			return
 
 		if current_type.is_struct() and \
-			current_type.get_size() > member_type.get_size():
+			utils.get_tif_size(current_type) > utils.get_tif_size(member_type):
 
 			strucid = utils.tif2strucid(current_type)
 			self.add_member_type(strucid, offset - member_offset, member_type)
\ No newline at end of file
@@ -7,7 +7,6 @@ import pyphrank.utils as utils
 from pyphrank.containers.structure import Structure
 from pyphrank.containers.vtables_union import VtablesUnion
 from pyphrank.containers.vtable import Vtable
-from pyphrank.type_flow_graph import TFG, ASTCtx
 
 
 class CppClass(Structure):
@@ -113,9 +112,23 @@ class CppClass(Structure):
 			else:
 				mname = "vtable_" + hex(offset)[2:]
 			self.set_member_name(offset, mname)
-			self.set_member_type(offset, vtbl.get_name() + '*')
+			self.set_member_type(offset, vtbl.name + '*')
 			return None
 
+	def get_shifted_member_ptr_tinfo(self, offset:int) -> idaapi.tinfo_t:
+		""" Type of this pointer for methods of subobject at offset """
+		if offset == 0:
+			return self.ptr_tinfo
+
+		parent, parent_offset = self.get_parent_offset(offset)
+		if parent is not None and parent_offset == offset:
+			inner = parent.tinfo
+		else:
+			inner = self.get_member_type(offset)
+			if inner is None:
+				inner = utils.str2tif("char")
+		return utils.make_shifted_ptr(self.tinfo, inner, offset)
+
 	def get_parent_vtable(self, offset):
 		parent, parent_offset = self.get_parent_offset(offset)
 		if parent is None:
@@ -126,26 +139,16 @@ class CppClass(Structure):
 
 class CDtor(object):
 	__slots__ = "_fea", "_is_ctor", "_is_dtor", "_cpp_class", "_vtbl_writes"
-	def __init__(self, fea) -> None:
+	def __init__(self, fea, vtbl_writes:dict[int, list[Vtable]]|None=None) -> None:
 		self._fea : int = fea
 		self._is_ctor : bool = False
 		self._is_dtor : bool = False
 		self._cpp_class : CppClass|None = None
 
-		factory = VtableAnalyzer()
-		self._vtbl_writes : dict[int,list] = {}
-		ctx = ASTCtx(fea)
-		for write in TFG(ctx).get_writes_into_var(0):
-			int_write_val = write.get_int()
-			if int_write_val is None:
-				continue
-
-			vtbl = Vtable.get_vtable_at_address(int_write_val)
-			if vtbl is None:
-				continue
-
-			vtbl_writes = self._vtbl_writes.setdefault(write.get_offset(), [])
-			vtbl_writes.append(vtbl)
+		# offset in this -> vtables written there, in order of writes
+		self._vtbl_writes : dict[int, list[Vtable]] = {}
+		if vtbl_writes is not None:
+			self._vtbl_writes.update(vtbl_writes)
 
 	def get_main_vtables(self) -> dict[int,Vtable]:
 		main_vtables: dict[int, Vtable] = {}
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import idaapi
+import idc
+import ida_struct
+
+from pyphrank.containers.struct_layout import StructLayout, to_identifier
+import pyphrank.utils as utils
+
+
+# C types of members without type, by member size
+UNTYPED_MEMBER_TYPES = {1: "__int8", 2: "__int16", 4: "__int32", 8: "__int64"}
+
+def untyped_member_decl(name:str, size:int) -> str:
+	type_name = UNTYPED_MEMBER_TYPES.get(size)
+	if type_name is None:
+		return f"char {name}[{size}];"
+	return f"{type_name} {name};"
+
+def member_decl(name:str, tif:idaapi.tinfo_t|None, size:int) -> str:
+	if tif is None:
+		return untyped_member_decl(name, size)
+
+	# print_tinfo places name correctly for arrays and function pointers
+	decl = idaapi.print_tinfo("", 0, 0, idaapi.PRTYPE_1LINE, tif, name, "")
+	if not decl:
+		utils.log_warn(f"failed to print {str(tif)} for member {name}, creating it without type")
+		return untyped_member_decl(name, size)
+	return decl + ";"
+
+
+class StructDeclBatch:
+	"""
+	Creates many structures at once.
+	Structures are rendered as C declarations and imported into local types
+	with one parse, which is much faster than adding members one by one
+	"""
+	def __init__(self) -> None:
+		# struct name -> declaration, in order of creation
+		self.decls : dict[str, str] = {}
+		self.sizes : dict[str, int] = {}
+		self.comments : dict[str, list[tuple[int, str]]] = {}
+
+	def __len__(self) -> int:
+		return len(self.decls)
+
+	def add_struct(self, name:str, members:list[tuple[int, str, idaapi.tinfo_t|None, int]], size:int=0):
+		"""
+		Members are (offset, name, type, size) sorted by offset and not overlapping,
+		type is None for members without type. Holes are filled with gaps
+		"""
+		lines = []
+		used_names = set()
+		end = 0
+		for offset, member_name, member_type, member_size in members:
+			if offset > end:
+				lines.append(f"char gap{offset:X}[{offset - end}];")
+			member_name = to_identifier(member_name)
+			if member_name in used_names:
+				member_name = member_name + "_" + hex(offset)[2:]
+			used_names.add(member_name)
+			lines.append(member_decl(member_name, member_type, member_size))
+			end = offset + member_size
+
+		size = max(size, end)
+		if size > end:
+			lines.append(f"char gap{end:X}[{size - end}];")
+
+		body = "\n\t".join(lines)
+		self.decls[name] = f"struct {name}\n{{\n\t{body}\n}};"
+		self.sizes[name] = size
+
+	def add_layout(self, name:str, layout:StructLayout):
+		members = [(m.offset, m.name, m.tif, m.size) for m in layout.iterate_members()]
+		self.add_struct(name, members, layout.size)
+		comments = [(m.offset, m.comment) for m in layout.iterate_members() if m.comment]
+		if len(comments) != 0:
+			self.add_comments(name, comments)
+
+	def add_comments(self, name:str, comments:list[tuple[int, str]]):
+		self.comments.setdefault(name, []).extend(comments)
+
+	def render(self) -> str:
+		# forward declarations allow pointers to any structure in batch
+		forwards = [f"struct {name};" for name in self.decls]
+		return "\n".join(forwards) + "\n" + "\n".join(self.decls.values()) + "\n"
+
+	def create(self) -> dict[str, int]:
+		""" Parse all declarations, returns struct name -> strucid, -1 if failed """
+		if len(self.decls) == 0:
+			return {}
+
+		errors = idaapi.parse_decls(None, self.render(), None, idaapi.HTI_PAK1 | idaapi.HTI_DCL)
+		if errors != 0:
+			utils.log_warn(f"{errors} errors when parsing declarations of {len(self.decls)} structures")
+
+		strucids = {}
+		for name, size in self.sizes.items():
+			strucid = utils.str2strucid(name)
+			if strucid != -1 and ida_struct.get_struc_size(strucid) != size:
+				utils.log_warn(f"{name} was created with wrong size {ida_struct.get_struc_size(strucid)} instead of {size}")
+				strucid = -1
+			strucids[name] = strucid
+
+			if strucid == -1:
+				continue
+
+			for offset, comment in self.comments.get(name, []):
+				idc.set_member_cmt(strucid, offset, comment, 0)
+		return strucids
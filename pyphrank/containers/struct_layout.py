@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import bisect
+import re
+from typing import Any
+
+
+def to_identifier(name:str) -> str:
+	""" Make C identifier from IDA name """
+	name = re.sub(r"[^0-9A-Za-z_]", "_", name)
+	if name == "" or name[0].isdigit():
+		name = "_" + name
+	return name
+
+
+class LayoutMember:
+	__slots__ = "offset", "size", "name", "tif", "comment", "nested"
+
+	def __init__(self, offset:int, size:int, name:str) -> None:
+		self.offset = offset
+		self.size = size
+		self.name = name
+		self.tif : Any = None
+		self.comment = ""
+		self.nested : StructLayout|None = None
+
+	@property
+	def end(self) -> int:
+		return self.offset + self.size
+
+
+class Evidence:
+	""" Observed use of structure member: type (None if unknown) and size """
+	__slots__ = "tif", "size", "nested"
+
+	def __init__(self, tif:Any, size:int, nested:StructLayout|None=None) -> None:
+		self.tif = tif
+		self.size = size
+		# layout of new structure, if tif is that structure
+		self.nested = nested
+
+	def is_typed(self) -> bool:
+		return self.tif is not None
+
+
+class StructLayout:
+	"""
+	In-memory layout of new structure.
+	All member uses are collected as evidence and members are resolved
+	from evidence, when layout is read. Only members around changed
+	evidence are resolved again. Mimics ida_struct semantics: member
+	at offset is the member, that contains this offset, structure size
+	is the end of last member or recorded size, if bigger
+	"""
+	def __init__(self) -> None:
+		self.evidence : dict[int, list[Evidence]] = {}
+		self.evidence_offsets : list[int] = []
+		self.typed_offsets : list[int] = []
+		# member names are C identifiers, so that structure is created
+		# with the same names from declaration or member by member
+		self.names : dict[int, str] = {}
+		# member name -> offset of named member
+		self.name_offsets : dict[str, int] = {}
+		self.comments : dict[int, str] = {}
+		# offsets of typed evidence, that did not fit into resolved layout
+		self._conflicts : list[int] = []
+		# evidence, that was already forwarded to nested structures
+		self._forwarded : set[int] = set()
+
+		self._members : dict[int, LayoutMember] = {}
+		self._offsets : list[int] = []
+		self._size = 0
+		# range of offsets with changed evidence since last resolve, None if resolved
+		self._dirty_from : int|None = None
+		self._dirty_to = 0
+		# intended size, materialized in database only on flush
+		self.recorded_size = 0
+
+	def mark_dirty(self, start:int, end:int):
+		if self._dirty_from is None:
+			self._dirty_from, self._dirty_to = start, end
+		else:
+			self._dirty_from = min(self._dirty_from, start)
+			self._dirty_to = max(self._dirty_to, end)
+
+	def get_prev_typed(self, offset:int) -> int:
+		""" Members from previous typed offset are bounded by typed evidence at offset """
+		idx = bisect.bisect_left(self.typed_offsets, offset)
+		if idx == 0:
+			return 0
+		return self.typed_offsets[idx - 1]
+
+	def add_evidence(self, offset:int, tif:Any=None, size:int=1, nested:StructLayout|None=None) -> bool:
+		""" Returns True if evidence is new """
+		if offset < 0 or size <= 0:
+			return False
+
+		entries = self.evidence.get(offset)
+		if entries is None:
+			entries = self.evidence[offset] = []
+			bisect.insort(self.evidence_offsets, offset)
+
+		for e in entries:
+			if e.size == size and (e.tif is tif or (e.tif is not None and tif is not None and e.tif == tif)):
+				return False
+
+		if tif is not None and not any(e.is_typed() for e in entries):
+			self.mark_dirty(self.get_prev_typed(offset), offset)
+			bisect.insort(self.typed_offsets, offset)
+		else:
+			self.mark_dirty(offset, offset)
+		entries.append(Evidence(tif, size, nested))
+		return True
+
+	def resolve(self):
+		""" Resolve members from all evidence """
+		self._members = {}
+		self._offsets = []
+		self._conflicts = []
+		self._dirty_from, self._dirty_to = 0, 0
+		self._resolve_dirty()
+
+	def _resolve_dirty(self):
+		"""
+		Resolve members in one pass over sorted offsets, starting from member,
+		that contains first changed offset, until resolved members are the same
+		as before. Typed evidence wins over unknown one, pointer wins over integral
+		of lesser or equal size, otherwise first evidence wins. Typed member
+		can not overlap start of other typed evidence, evidence inside
+		new nested structure is forwarded to it
+		"""
+		dirty_from, dirty_to = self._dirty_from, self._dirty_to
+		if dirty_from is None:
+			return
+		self._dirty_from = None
+
+		old_offsets = self._offsets
+		keep_idx = bisect.bisect_right(old_offsets, dirty_from) - 1
+		if keep_idx >= 0 and self._members[old_offsets[keep_idx]].end > dirty_from:
+			restart = old_offsets[keep_idx]
+		else:
+			keep_idx += 1
+			restart = dirty_from
+		current = self._members[old_offsets[keep_idx - 1]] if keep_idx > 0 else None
+
+		members : dict[int, LayoutMember] = {}
+		offsets = []
+		conflicts = []
+		# old members starting from stop_idx are kept
+		stop_idx = len(old_offsets)
+		for offset in self.evidence_offsets[bisect.bisect_left(self.evidence_offsets, restart):]:
+			if offset > dirty_to and (current is None or offset >= current.end) and offset in self._members:
+				stop_idx = bisect.bisect_left(old_offsets, offset)
+				break
+
+			entries = self.evidence[offset]
+			if current is not None and offset < current.end:
+				if current.nested is not None:
+					self.forward_evidence(current, offset, entries)
+				elif any(e.is_typed() for e in entries):
+					conflicts.append(offset)
+				continue
+
+			idx = bisect.bisect_right(self.typed_offsets, offset)
+			if idx < len(self.typed_offsets):
+				next_typed = self.typed_offsets[idx]
+			else:
+				next_typed = -1
+
+			chosen = None
+			for e in self.order_candidates(entries):
+				if e.nested is not None or next_typed == -1 or offset + e.size <= next_typed:
+					chosen = e
+					break
+
+			if chosen is None:
+				if any(e.is_typed() for e in entries):
+					conflicts.append(offset)
+				size = max([e.size for e in entries if not e.is_typed()], default=1)
+				if next_typed != -1:
+					size = min(size, next_typed - offset)
+				tif, nested = None, None
+			else:
+				size, tif, nested = chosen.size, chosen.tif, chosen.nested
+
+			name = self.names.get(offset, "field_" + hex(offset)[2:])
+			current = LayoutMember(offset, size, name)
+			current.tif = tif
+			current.nested = nested
+			current.comment = self.comments.get(offset, "")
+			members[offset] = current
+			offsets.append(offset)
+
+		for offset in old_offsets[keep_idx:stop_idx]:
+			del self._members[offset]
+		self._members.update(members)
+		self._offsets = old_offsets[:keep_idx] + offsets + old_offsets[stop_idx:]
+
+		if stop_idx < len(old_offsets):
+			stop = old_offsets[stop_idx]
+			kept_conflicts = [c for c in self._conflicts if c < restart or c >= stop]
+		else:
+			kept_conflicts = [c for c in self._conflicts if c < restart]
+		self._conflicts = sorted(kept_conflicts + conflicts)
+
+		if len(self._offsets) == 0:
+			self._size = 0
+		else:
+			self._size = self._members[self._offsets[-1]].end
+
+	@staticmethod
+	def order_candidates(entries:list[Evidence]) -> list[Evidence]:
+		typed = [e for e in entries if e.is_typed()]
+		if len(typed) < 2:
+			return typed
+
+		first = typed[0]
+		if first.tif.is_integral():
+			for e in typed:
+				if e.tif.is_ptr() and e.size >= first.size:
+					typed.remove(e)
+					typed.insert(0, e)
+					break
+		return typed
+
+	def forward_evidence(self, member:LayoutMember, offset:int, entries:list[Evidence]):
+		for e in entries:
+			if not e.is_typed() or id(e) in self._forwarded:
+				continue
+			self._forwarded.add(id(e))
+			member.nested.add_evidence(offset - member.offset, e.tif, e.size, e.nested) # type:ignore
+
+	def _resolved(self):
+		if self._dirty_from is not None:
+			self._resolve_dirty()
+
+	@property
+	def size(self) -> int:
+		self._resolved()
+		return max(self._size, self.recorded_size)
+
+	@property
+	def members_end(self) -> int:
+		self._resolved()
+		return self._size
+
+	def set_size(self, size:int):
+		self.recorded_size = size
+
+	@property
+	def conflicts(self) -> list[int]:
+		self._resolved()
+		return self._conflicts
+
+	@property
+	def offsets(self) -> list[int]:
+		self._resolved()
+		return self._offsets
+
+	def __len__(self) -> int:
+		return len(self.offsets)
+
+	def iterate_members(self):
+		for offset in self.offsets:
+			yield self._members[offset]
+
+	def get_member(self, offset:int) -> LayoutMember|None:
+		offsets = self.offsets
+		idx = bisect.bisect_right(offsets, offset) - 1
+		if idx < 0:
+			return None
+		member = self._members[offsets[idx]]
+		if offset >= member.end:
+			return None
+		return member
+
+	def get_next_member(self, offset:int) -> LayoutMember|None:
+		offsets = self.offsets
+		idx = bisect.bisect_right(offsets, offset)
+		if idx == len(offsets):
+			return None
+		return self._members[offsets[idx]]
+
+	def add_member(self, offset:int, size:int, name:str|None=None) -> bool:
+		if offset < 0 or size <= 0:
+			return False
+
+		self.add_evidence(offset, None, size)
+		if name is not None:
+			name = to_identifier(name)
+		if name is not None and offset not in self.names and name not in self.name_offsets:
+			self.names[offset] = name
+			self.name_offsets[name] = offset
+			self.mark_dirty(offset, offset)
+		return True
+
+	def del_member(self, offset:int) -> bool:
+		member = self.get_member(offset)
+		if member is None:
+			return False
+
+		start = bisect.bisect_left(self.evidence_offsets, member.offset)
+		end = bisect.bisect_left(self.evidence_offsets, member.end)
+		removed = self.evidence_offsets[start:end]
+		del self.evidence_offsets[start:end]
+		self.mark_dirty(self.get_prev_typed(member.offset), member.end)
+
+		start = bisect.bisect_left(self.typed_offsets, member.offset)
+		end = bisect.bisect_left(self.typed_offsets, member.end)
+		del self.typed_offsets[start:end]
+		for o in removed:
+			for e in self.evidence.pop(o):
+				self._forwarded.discard(id(e))
+			if (name := self.names.pop(o, None)) is not None:
+				self.name_offsets.pop(name, None)
+			self.comments.pop(o, None)
+		return True
+
+	def is_name_used(self, name:str, offset:int) -> bool:
+		""" Checks if name is used by other member than member at offset """
+		named_offset = self.name_offsets.get(name)
+		if named_offset is not None:
+			return named_offset != offset
+
+		# default names are not recorded
+		if not name.startswith("field_"):
+			return False
+		try:
+			default_offset = int(name[6:], 16)
+		except ValueError:
+			return False
+		if default_offset == offset or default_offset in self.names:
+			return False
+		member = self.get_member(default_offset)
+		return member is not None and member.offset == default_offset
+
+	def set_member_name(self, offset:int, name:str) -> bool:
+		member = self.get_member(offset)
+		if member is None:
+			return False
+		name = to_identifier(name)
+		if self.is_name_used(name, member.offset):
+			return False
+
+		if (old_name := self.names.get(member.offset)) is not None:
+			self.name_offsets.pop(old_name, None)
+		self.names[member.offset] = name
+		self.name_offsets[name] = member.offset
+		member.name = name
+		return True
+
+	def set_member_type(self, offset:int, tif:Any, size:int) -> bool:
+		if offset < 0 or size <= 0:
+			return False
+
+		self.add_evidence(offset, tif, size)
+		return True
+
+	def set_member_comment(self, offset:int, comment:str) -> bool:
+		member = self.get_member(offset)
+		if member is None:
+			return False
+		self.comments[member.offset] = comment
+		member.comment = comment
+		return True
+
+
+# strucid -> layout of structures, that are not yet created in database
+LAYOUTS : dict[int, StructLayout] = {}
+
+def get_layout(strucid:int) -> StructLayout|None:
+	return LAYOUTS.get(strucid)
+
+def register_layout(strucid:int, layout:StructLayout):
+	LAYOUTS[strucid] = layout
+
+def unregister_layout(strucid:int):
+	LAYOUTS.pop(strucid, None)
@@ -5,6 +5,7 @@ import idc
 import ida_struct
 import pyphrank.settings as settings
 from pyphrank.containers.ida_struc_wrapper import IdaStrucWrapper
+from pyphrank.containers.struct_layout import StructLayout, get_layout, register_layout, unregister_layout
 import pyphrank.utils as utils
 
 
@@ -12,10 +13,14 @@ class Structure(IdaStrucWrapper):
 	def __init__ (self, strucid):
 		super().__init__(strucid)
 		assert not self.is_union(), "Error, should be struct"
+		# new structures are built in memory and flushed to database later
+		self.layout = get_layout(strucid)
 
 	@classmethod
 	def new(cls):
+		""" Create empty structure, members of which are kept in memory until flush """
 		strucid = idc.add_struc(idaapi.BADADDR, None, False)
+		register_layout(strucid, StructLayout())
 		return cls(strucid)
 
 	@classmethod
@@ -25,9 +30,144 @@ class Structure(IdaStrucWrapper):
 			return None
 		return cls(strucid)
 
+	def flush(self):
+		""" Create members of in-memory layout in database """
+		layout = self.layout
+		if layout is None:
+			return
+
+		members = list(layout.iterate_members())
+		self.drop_layout()
+		for member in members:
+			size = member.size
+			ret = idc.add_struc_member(self.strucid, member.name, member.offset, utils.size2dataflags(size), -1, size)
+			self.handle_addstrucmember_ret(ret)
+			if ret < 0:
+				continue
+
+			if member.tif is not None:
+				self.set_member_type(member.offset, member.tif)
+			if member.comment:
+				self.set_member_comment(member.offset, member.comment)
+
+		# recorded size is created once, after all members
+		if layout.size > layout.members_end:
+			self.expand(layout.size - self.size)
+
+	def drop_layout(self):
+		""" Stop keeping members in memory, database structure is used afterwards """
+		if self.layout is None:
+			return
+
+		for offset in self.layout.conflicts:
+			utils.log_warn(f"conflicting member types in {self.name} at {hex(offset)}, skipping them")
+		self.layout = None
+		unregister_layout(self.strucid)
+
+	def delete(self):
+		self.layout = None
+		unregister_layout(self.strucid)
+		super().delete()
+
+	@property
+	def size(self) -> int:
+		if self.layout is not None:
+			return self.layout.size
+		return super().size
+
+	def member_offsets(self, skip_holes=True):
+		if self.layout is None:
+			yield from super().member_offsets(skip_holes=skip_holes)
+			return
+
+		# in-memory layout has no holes
+		yield from list(self.layout.offsets)
+
 	def member_names(self):
 		for member_offset in self.member_offsets():
-			yield idc.get_member_name(self.strucid, member_offset), hex(member_offset)
+			yield self.get_member_name(member_offset), hex(member_offset)
+
+	def get_member_size(self, offset:int) -> int:
+		if self.layout is None:
+			return super().get_member_size(offset)
+
+		member = self.layout.get_member(offset)
+		if member is None:
+			return -1
+		return member.size
+
+	def get_member_name(self, offset:int) -> str:
+		if self.layout is None:
+			return super().get_member_name(offset)
+
+		member = self.layout.get_member(offset)
+		if member is None:
+			return ""
+		return member.name
+
+	def set_member_name(self, member_offset:int, member_name:str) -> int:
+		if self.layout is None:
+			return super().set_member_name(member_offset, member_name)
+
+		rv = self.layout.set_member_name(member_offset, member_name)
+		if not rv:
+			utils.log_warn(f"failed to set member name {str(member_name)} in {self.name} at {hex(member_offset)}")
+		return int(rv)
+
+	def get_member_comment(self, offset:int):
+		if self.layout is None:
+			return super().get_member_comment(offset)
+
+		member = self.layout.get_member(offset)
+		if member is None:
+			return None
+		return member.comment
+
+	def set_member_comment(self, offset:int, cmt:str):
+		if self.layout is None:
+			return super().set_member_comment(offset, cmt)
+
+		rv = self.layout.set_member_comment(offset, cmt)
+		if not rv:
+			utils.log_warn(f"failed to set member comment in {self.name} at {hex(offset)}")
+		return int(rv)
+
+	def get_member_type(self, member_offset:int) -> idaapi.tinfo_t|None:
+		if self.layout is None:
+			return super().get_member_type(member_offset)
+
+		if member_offset >= self.size:
+			raise BaseException("Offset too big")
+
+		member = self.layout.get_member(member_offset)
+		if member is None:
+			return None
+		return member.tif
+
+	def set_member_type(self, member_offset:int, member_type:idaapi.tinfo_t):
+		if self.layout is None:
+			return super().set_member_type(member_offset, member_type)
+
+		size = utils.get_tif_size(member_type)
+		rv = size != idaapi.BADSIZE and self.layout.set_member_type(member_offset, member_type, size)
+		if not rv:
+			utils.log_err(f"failed to change member type in {self.name} to {str(member_type)} at {hex(member_offset)}")
+		return int(rv)
+
+	def add_member(self, member_offset:int, name=None) -> bool:
+		if self.layout is None:
+			return super().add_member(member_offset, name=name)
+
+		rv = self.layout.add_member(member_offset, 1, name)
+		if not rv:
+			utils.log_err(f"failed to add member to {self.name} at {hex(member_offset)}")
+		return rv
+
+	def del_member(self, offset:int):
+		if self.layout is None:
+			return super().del_member(offset)
+
+		self.layout.del_member(offset)
 
 	def maximize_size(self, min_size:int):
 		if self.size < min_size:
@@ -40,12 +180,18 @@ class Structure(IdaStrucWrapper):
 
 		if current_size > new_size:
 			self.unset_members(new_size, current_size - new_size)
+			if self.layout is not None:
+				self.layout.set_size(new_size)
 			return
 
 		self.expand(new_size - current_size)
 
 	def expand(self, extra_size: int):
 		current_size = self.size
+		if self.layout is not None:
+			self.layout.set_size(current_size + extra_size)
+			return
+
 		membername = 'field_' + hex(extra_size + current_size - 1)[2:]
 		idc.add_struc_member(self.strucid, membername, current_size, utils.size2dataflags(1), -1, 1)
 		idc.expand_struc(self.strucid, current_size, extra_size - 1, False)
@@ -93,6 +239,9 @@ class Structure(IdaStrucWrapper):
 
 		if offset < 0 or offset >= self.size:
 			return False
+		if self.layout is not None:
+			return self.layout.get_member(offset) is not None
+
 		sptr = ida_struct.get_struc(self.strucid)
 		mptr = ida_struct.get_member(sptr, offset)
 		return mptr is not None
@@ -101,6 +250,12 @@ class Structure(IdaStrucWrapper):
 		if offset < 0 or offset > self.size:
 			return -1
 
+		if self.layout is not None:
+			member = self.layout.get_next_member(offset)
+			if member is None:
+				return -1
+			return member.offset
+
 		sptr = ida_struct.get_struc(self.strucid)
 		offset = ida_struct.get_struc_next_offset(sptr, offset)
 		while offset != idaapi.BADADDR and not self.get_member_name(offset):
@@ -114,6 +269,12 @@ class Structure(IdaStrucWrapper):
 		if offset < 0 or offset > self.size:
 			return -1
 
+		if self.layout is not None:
+			member = self.layout.get_member(offset)
+			if member is None:
+				return -1
+			return member.offset
+
 		sptr = ida_struct.get_struc(self.strucid)
 		member = ida_struct.get_member(sptr, offset)
 		if member is None:
@@ -124,4 +285,4 @@ class Structure(IdaStrucWrapper):
 		if offset < 0 or offset > self.size:
 			return False
 
-		return offset == self.get_member_start(offset)
\ No newline at end of file
+		return offset == self.get_member_start(offset)
@@ -8,11 +8,20 @@ import ida_struct
 import pyphrank.settings as settings
 import pyphrank.utils as utils
 from pyphrank.containers.structure import Structure
+from pyphrank.containers.struct_decls import StructDeclBatch
+from pyphrank.vtable_slots import VTABLE_SLOTS
 
 
 class Vtable(Structure):
 	REUSE_DELIM = "___V"
 
+	def __init__(self, strucid) -> None:
+		super().__init__(strucid)
+		# address of vtable in data, found lazily if unknown
+		self._ea : int|None = None
+		self._cpp_class = None
+		self._cpp_class_offset = 0
+
 	@classmethod
 	def from_data(cls, addr:int):
 		vfcs = Vtable.get_vtable_functions_at_addr(addr)
@@ -26,7 +35,9 @@ class Vtable(Structure):
 			return None
 
 		voidptr_tif = utils.str2tif("void*")
+		slots = {}
 		for func_addr in vfcs:
+			slots[vtbl.size] = func_addr
 			member_name = idaapi.get_name(func_addr)
 			if member_name is None:
 				member_name = "field_" + hex(vtbl.size)[2:]
@@ -35,8 +46,68 @@ class Vtable(Structure):
 			member_name = utils.get_next_available_membername(vtbl.strucid, member_name, Vtable.REUSE_DELIM)
 
 			vtbl.append_member(member_name, voidptr_tif, hex(func_addr))
+		vtbl._ea = addr
+		VTABLE_SLOTS.add_vtable(vtbl.strucid, slots)
 		return vtbl
 
+	@classmethod
+	def from_data_many(cls, addrs:list[int]) -> dict[int, Vtable]:
+		""" Create vtables at given addresses at once, returns address -> vtable """
+		vtables = {}
+		for addr in set(addrs):
+			vfcs = Vtable.get_vtable_functions_at_addr(addr)
+			if len(vfcs) != 0:
+				vtables[addr] = vfcs
+		return cls.from_functions_many(vtables)
+
+	@classmethod
+	def from_functions_many(cls, vtables:dict[int, list[int]]) -> dict[int, Vtable]:
+		""" Create vtables from address -> virtual functions at once """
+		batch = StructDeclBatch()
+		vtbl_names : dict[int, str] = {}
+		voidptr_tif = utils.str2tif("void*")
+		for addr in sorted(vtables.keys()):
+			vfcs = vtables[addr]
+
+			vtbl_name = "vtable_" + hex(addr)[2:]
+			vtbl_name = utils.get_next_available_strucname(vtbl_name)
+			members = []
+			comments = []
+			member_names = set()
+			for i, func_addr in enumerate(vfcs):
+				offset = i * settings.PTRSIZE
+				member_name = idaapi.get_name(func_addr)
+				if member_name is None:
+					member_name = "field_" + hex(offset)[2:]
+					utils.log_warn(f"failed to get function name {hex(func_addr)}")
+
+				base_name = member_name
+				counter = 0
+				while member_name in member_names:
+					member_name = base_name + Vtable.REUSE_DELIM + str(counter)
+					counter += 1
+				member_names.add(member_name)
+
+				members.append((offset, member_name, voidptr_tif, settings.PTRSIZE))
+				comments.append((offset, hex(func_addr)))
+
+			batch.add_struct(vtbl_name, members)
+			batch.add_comments(vtbl_name, comments)
+			vtbl_names[addr] = vtbl_name
+
+		strucids = batch.create()
+		vtbls = {}
+		for addr, vtbl_name in vtbl_names.items():
+			strucid = strucids[vtbl_name]
+			if strucid == -1:
+				utils.log_warn(f"failed to create vtable at {hex(addr)}")
+				continue
+			vtbl = cls(strucid)
+			vtbl._ea = addr
+			vtbls[addr] = vtbl
+			VTABLE_SLOTS.add_vtable(strucid, {i * settings.PTRSIZE: f for i, f in enumerate(vtables[addr])})
+		return vtbls
+
 	def add_member(self, member_offset: int, name=None) -> bool:
 		# vtbl is only created from data
 		return False
@@ -48,7 +119,90 @@ class Vtable(Structure):
 		if not cls.is_strucid_vtable(vtbl_strucid):
 			return None
 
-		return cls(vtbl_strucid)
+		vtbl = cls(vtbl_strucid)
+		vtbl._ea = addr
+		return vtbl
+
+	def get_ea(self) -> int:
+		if self._ea is None:
+			self._ea = self.find_ea()
+		return self._ea
+
+	def find_ea(self) -> int:
+		# vtable type is set at vtable address
+		for x in idautils.XrefsTo(self.strucid):
+			return x.frm
+
+		name = self.name
+		if name.startswith("vtable_"):
+			addr = utils.str2addr("0x" + name[7:].split("__")[0])
+			if addr != -1:
+				return addr
+		return idaapi.BADADDR
+
+	def set_class_offset(self, cpp_class, offset:int):
+		self._cpp_class = cpp_class
+		self._cpp_class_offset = offset
+
+	def delete(self):
+		if self.strucid != -1:
+			VTABLE_SLOTS.remove(self.strucid)
+		super().delete()
+
+	def index_slots(self):
+		""" Index vtables, that were created before slot index existed """
+		if VTABLE_SLOTS.is_indexed(self.strucid):
+			return
+
+		slots = {}
+		for moffset in self.member_offsets():
+			func_ea = self.parse_member_func_ea(moffset)
+			if func_ea != idaapi.BADADDR:
+				slots[moffset] = func_ea
+		VTABLE_SLOTS.add_vtable(self.strucid, slots)
+
+	def parse_member_func_ea(self, moffset:int) -> int:
+		# address of virtual function is kept in member comment
+		cmt = self.get_member_comment(moffset)
+		if cmt:
+			try:
+				return int(cmt, 16)
+			except ValueError:
+				pass
+		return idc.get_name_ea_simple(self.get_member_name(moffset))
+
+	def get_member_func_ea(self, moffset:int) -> int:
+		self.index_slots()
+		func_ea = VTABLE_SLOTS.get(self.strucid, moffset)
+		if func_ea is None or func_ea == -1:
+			return idaapi.BADADDR
+		return func_ea
+
+	def get_virtual_functions(self) -> list[int]:
+		return [self.get_member_func_ea(o) for o in self.member_offsets()]
+
+	def get_callers(self) -> set[int]:
+		""" Functions, that use vtable address """
+		callers = set()
+		for x in idautils.XrefsTo(self.get_ea()):
+			func_ea = utils.get_func_start(x.frm)
+			if func_ea != idaapi.BADADDR:
+				callers.add(func_ea)
+		return callers
+
+	def get_virtual_dtor(self) -> int:
+		for func_ea in self.get_virtual_functions():
+			name = idaapi.get_name(func_ea)
+			demangled = idaapi.demangle_name(name, idaapi.MNG_SHORT_FORM) if name else None
+			if demangled is not None and "::~" in demangled:
+				return func_ea
+		return idaapi.BADADDR
+
+	def get_virtual_dtor_calls(self) -> set[int]:
+		dtor = self.get_virtual_dtor()
+		if dtor == idaapi.BADADDR:
+			return set()
+		return set(utils.get_func_calls_from(dtor))
 
 	def get_member_name(self, moffset:int) -> str:
 		member_name = super().get_member_name(moffset)
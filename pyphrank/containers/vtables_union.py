@@ -6,6 +6,7 @@ import ida_struct
 
 from pyphrank.containers.union import Union
 from pyphrank.containers.vtable import Vtable
+from pyphrank.call_targets import CALL_TARGETS
 import pyphrank.utils as utils
 
 
@@ -62,4 +63,5 @@ class VtablesUnion(Union):
 				return
 
 		tif = vtbl.ptr_tinfo
-		self.append_member(vname, tif)
\ No newline at end of file
+		self.append_member(vname, tif)
+		CALL_TARGETS.invalidate()
\ No newline at end of file
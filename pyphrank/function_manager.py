@@ -142,6 +142,22 @@ class FunctionManager:
 
 		self.func_factory.clear_cfunc(func_ea)
 
+	def set_func_rettype(self, func_ea:int, rettype:idaapi.tinfo_t) -> bool:
+		func_details = self.get_func_details(func_ea)
+		if func_details is None:
+			utils.log_warn(f"failed to change return type (no func details) in {get_funcname(func_ea)}")
+			return False
+
+		func_details.rettype = rettype.copy()
+
+		new_func_tinfo = idaapi.tinfo_t()
+		if not new_func_tinfo.create_func(func_details) or not idaapi.apply_tinfo(func_ea, new_func_tinfo, 0):
+			utils.log_err(f"failed to change return type to {rettype} in {get_funcname(func_ea)}")
+			return False
+
+		self.func_factory.clear_cfunc(func_ea)
+		return True
+
 	def get_func_tinfo(self, func_ea:int) -> idaapi.tinfo_t:
 		tif = idaapi.tinfo_t()
 		if idaapi.get_tinfo(tif, func_ea) and tif.is_correct():
@@ -0,0 +1,310 @@
+"""
+Per function summaries of local variables and return values.
+Summaries are calculated from serialized type flow graphs (see tfg_serialization)
+and do not depend on IDA, so they can be calculated in other processes
+"""
+from __future__ import annotations
+
+
+# same as SExpr, Node and VarUse constants
+SEXPR_LITERAL = 0
+SEXPR_VAR_USE_CHAIN = 1
+SEXPR_FUNCTION = 2
+SEXPR_CALL = 4
+SEXPR_ASSIGN = 5
+SEXPR_PARTIAL = 11
+NODE_RETURN = 0
+NODE_EXPR = 1
+NODE_CALL_CAST = 2
+NODE_TYPE_CAST = 3
+USE_ADD = 0
+USE_PTR = 1
+
+
+class VarSummary:
+	""" Shape of local variable uses in function """
+	__slots__ = "reads", "writes", "write_types", "is_ptr", "call_casts", "type_casts", "moves", "is_returned", "is_exact"
+
+	def __init__(self) -> None:
+		# offsets of pointer reads and writes
+		self.reads : set[int] = set()
+		self.writes : set[int] = set()
+		# offset of pointer write -> type strings of literals, that are written there
+		self.write_types : dict[int, set[str]] = {}
+		# used as pointer (dereferenced or offsetted) anywhere
+		self.is_ptr = False
+		# (called address, argument id) for direct calls, var is passed to
+		self.call_casts : set[tuple[int, int]] = set()
+		# type strings, var is casted to
+		self.type_casts : set[str] = set()
+		# local variables ids, var is moved to
+		self.moves : set[int] = set()
+		self.is_returned = False
+		# members of var type are fully known from reads, writes and write types.
+		# Not exact with nested offsets, writes of non literals, type casts
+		# and passing shifted var, these need analysis of var uses
+		self.is_exact = True
+
+	def __eq__(self, other:object) -> bool:
+		if not isinstance(other, VarSummary):
+			return False
+		return all(getattr(self, a) == getattr(other, a) for a in self.__slots__)
+
+
+class FunctionSummary:
+	__slots__ = "func_ea", "lvars", "returns", "callees", "unknown_calls"
+
+	# return value sources
+	RETURN_LVAR = 0
+	RETURN_CALL = 1
+	RETURN_TYPE = 2
+	RETURN_UNKNOWN = 3
+
+	def __init__(self, func_ea:int) -> None:
+		self.func_ea = func_ea
+		# local variable id -> its uses, only for used variables
+		self.lvars : dict[int, VarSummary] = {}
+		# (return source kind, lvar id or called address or type string)
+		self.returns : set[tuple[int, int|str|None]] = set()
+		# directly called functions
+		self.callees : set[int] = set()
+		# function has calls, that are not resolved without types
+		self.unknown_calls = False
+
+	def get_lvar(self, lvar_id:int) -> VarSummary|None:
+		return self.lvars.get(lvar_id)
+
+	def is_lvar_used(self, lvar_id:int) -> bool:
+		return lvar_id in self.lvars
+
+	def get_lvar_summary(self, lvar_id:int) -> VarSummary:
+		lvar = self.lvars.get(lvar_id)
+		if lvar is None:
+			lvar = VarSummary()
+			self.lvars[lvar_id] = lvar
+		return lvar
+
+	def get_local_id(self, vuc:tuple) -> int|None:
+		varid, _ = vuc
+		if not isinstance(varid, tuple) or varid[0] != self.func_ea:
+			return None
+		return varid[1]
+
+	def add_vuc(self, vuc:tuple, is_write:bool=False):
+		lvar_id = self.get_local_id(vuc)
+		if lvar_id is None:
+			return
+
+		lvar = self.get_lvar_summary(lvar_id)
+		uses = vuc[1]
+		if len(uses) == 0:
+			return
+
+		lvar.is_ptr = True
+		if len(uses) > 1:
+			lvar.is_exact = False
+		offset = get_ptr_offset(uses)
+		if offset is None:
+			return
+		if is_write:
+			lvar.writes.add(offset)
+		else:
+			lvar.reads.add(offset)
+
+	def add_sexpr(self, sexpr:tuple|None):
+		""" Collects all var uses in sexpr as reads, except assign targets """
+		if sexpr is None or len(sexpr) == 0:
+			return
+
+		op, _, x, y = sexpr
+		if op == SEXPR_VAR_USE_CHAIN:
+			self.add_vuc(x)
+		elif op == SEXPR_FUNCTION or op == SEXPR_LITERAL:
+			return
+		elif op == SEXPR_ASSIGN:
+			self.add_assign(x, y)
+		elif op == SEXPR_CALL:
+			if x is not None and len(x) != 0 and x[0] == SEXPR_FUNCTION:
+				self.callees.add(x[2])
+			else:
+				self.unknown_calls = True
+				self.add_sexpr(x)
+		elif op == SEXPR_PARTIAL:
+			# y is (offset, size)
+			self.add_sexpr(x)
+		else:
+			if isinstance(x, tuple):
+				self.add_sexpr(x)
+			if isinstance(y, tuple):
+				self.add_sexpr(y)
+
+	def add_assign(self, target:tuple, value:tuple):
+		if target is not None and len(target) != 0 and target[0] == SEXPR_VAR_USE_CHAIN:
+			target_vuc = target[2]
+			self.add_vuc(target_vuc, is_write=True)
+			self.add_write_type(target_vuc, value)
+			# moving var to another local var
+			target_id = self.get_local_id(target_vuc)
+			if target_id is not None and len(target_vuc[1]) == 0 and value is not None and len(value) != 0 \
+					and value[0] == SEXPR_VAR_USE_CHAIN and len(value[2][1]) == 0:
+				value_id = self.get_local_id(value[2])
+				if value_id is not None:
+					self.get_lvar_summary(value_id).moves.add(target_id)
+		else:
+			self.add_sexpr(target)
+		self.add_sexpr(value)
+
+	def add_write_type(self, target_vuc:tuple, value:tuple|None):
+		if (lvar_id := self.get_local_id(target_vuc)) is None or len(target_vuc[1]) == 0:
+			return
+		lvar = self.get_lvar_summary(lvar_id)
+		if value is None or len(value) == 0 or value[0] != SEXPR_LITERAL or value[2] == "":
+			# type of written var, call or function is known only after analysis
+			lvar.is_exact = False
+			return
+		if (offset := get_ptr_offset(target_vuc[1])) is None:
+			return
+		lvar.write_types.setdefault(offset, set()).add(value[2])
+
+	def add_return(self, sexpr:tuple|None):
+		self.add_sexpr(sexpr)
+		if sexpr is None or len(sexpr) == 0:
+			self.returns.add((self.RETURN_UNKNOWN, None))
+			return
+
+		op, _, x, _ = sexpr
+		if op == SEXPR_VAR_USE_CHAIN and len(x[1]) == 0 and (lvar_id := self.get_local_id(x)) is not None:
+			self.get_lvar_summary(lvar_id).is_returned = True
+			self.returns.add((self.RETURN_LVAR, lvar_id))
+		elif op == SEXPR_CALL and x is not None and len(x) != 0 and x[0] == SEXPR_FUNCTION:
+			self.returns.add((self.RETURN_CALL, x[2]))
+		elif op == SEXPR_LITERAL and x != "":
+			self.returns.add((self.RETURN_TYPE, x))
+		else:
+			self.returns.add((self.RETURN_UNKNOWN, None))
+
+	def add_call_cast(self, sexpr:tuple|None, arg_id:int, func_call:tuple|None):
+		if func_call is not None and len(func_call) != 0 and func_call[0] == SEXPR_FUNCTION:
+			self.callees.add(func_call[2])
+			called = func_call[2]
+		else:
+			self.unknown_calls = True
+			self.add_sexpr(func_call)
+			called = -1
+
+		if sexpr is not None and len(sexpr) != 0 and sexpr[0] == SEXPR_VAR_USE_CHAIN \
+				and (lvar_id := self.get_local_id(sexpr[2])) is not None:
+			lvar = self.get_lvar_summary(lvar_id)
+			if len(sexpr[2][1]) == 0 and called != -1:
+				lvar.call_casts.add((called, arg_id))
+			else:
+				lvar.is_exact = False
+		self.add_sexpr(sexpr)
+
+	def add_type_cast(self, sexpr:tuple|None, cast_type:str):
+		if sexpr is not None and len(sexpr) != 0 and sexpr[0] == SEXPR_VAR_USE_CHAIN \
+				and (lvar_id := self.get_local_id(sexpr[2])) is not None:
+			lvar = self.get_lvar_summary(lvar_id)
+			# casts add members of casted type
+			lvar.is_exact = False
+			if len(sexpr[2][1]) == 0 and cast_type != "":
+				lvar.type_casts.add(cast_type)
+		self.add_sexpr(sexpr)
+
+	def compose(self, summaries:dict[int, FunctionSummary]) -> bool:
+		"""
+		Add uses of arguments in called functions to variables, that are passed to them.
+		Exactness is not composed, arguments are propagated to separately.
+		Returns True if anything changed
+		"""
+		changed = False
+		for lvar in self.lvars.values():
+			for callee, arg_id in lvar.call_casts:
+				if (callee_summary := summaries.get(callee)) is None:
+					continue
+				if (arg := callee_summary.get_lvar(arg_id)) is None:
+					continue
+
+				if arg.is_ptr and not lvar.is_ptr:
+					lvar.is_ptr = True
+					changed = True
+				if not arg.reads <= lvar.reads:
+					lvar.reads |= arg.reads
+					changed = True
+				if not arg.writes <= lvar.writes:
+					lvar.writes |= arg.writes
+					changed = True
+				for offset, types in arg.write_types.items():
+					lvar_types = lvar.write_types.setdefault(offset, set())
+					if not types <= lvar_types:
+						lvar_types |= types
+						changed = True
+		return changed
+
+	@classmethod
+	def from_serialized_tfg(cls, func_ea:int, tfg:tuple) -> FunctionSummary:
+		summary = cls(func_ea)
+		nodes, _ = tfg
+		for node_type, sexpr, y, z in nodes:
+			if node_type == NODE_EXPR:
+				summary.add_sexpr(sexpr)
+			elif node_type == NODE_RETURN:
+				summary.add_return(sexpr)
+			elif node_type == NODE_CALL_CAST:
+				summary.add_call_cast(sexpr, y, z)
+			elif node_type == NODE_TYPE_CAST:
+				summary.add_type_cast(sexpr, y)
+		return summary
+
+
+def get_ptr_offset(uses:tuple) -> int|None:
+	""" Same as VarUseChain.get_ptr_offset over serialized uses """
+	use_type, offset = uses[0]
+	if use_type == USE_PTR or use_type == USE_ADD:
+		return offset
+	return None
+
+def get_sexpr_callees(sexpr:tuple|None, callees:set[int]):
+	if sexpr is None or len(sexpr) == 0:
+		return
+
+	op, _, x, y = sexpr
+	if op == SEXPR_CALL and x is not None and len(x) != 0 and x[0] == SEXPR_FUNCTION:
+		callees.add(x[2])
+	if op in (SEXPR_LITERAL, SEXPR_VAR_USE_CHAIN, SEXPR_FUNCTION):
+		return
+	if isinstance(x, tuple):
+		get_sexpr_callees(x, callees)
+	if op != SEXPR_PARTIAL and isinstance(y, tuple):
+		get_sexpr_callees(y, callees)
+
+def get_tfg_callees(tfg:tuple) -> set[int]:
+	""" Directly called addresses, same as FunctionSummary.callees without calculating summary """
+	callees : set[int] = set()
+	nodes, _ = tfg
+	for node_type, sexpr, _, z in nodes:
+		get_sexpr_callees(sexpr, callees)
+		if node_type != NODE_CALL_CAST:
+			continue
+		if z is not None and len(z) != 0 and z[0] == SEXPR_FUNCTION:
+			callees.add(z[2])
+		else:
+			get_sexpr_callees(z, callees)
+	return callees
+
+def summarize_scc(tfgs:list[tuple[int, tuple]], callee_summaries:dict[int, FunctionSummary]) -> list[FunctionSummary]:
+	"""
+	Summaries of functions in one strongly connected component of call graph,
+	summaries of called functions outside of it should be already calculated
+	"""
+	summaries = {func_ea: FunctionSummary.from_serialized_tfg(func_ea, tfg) for func_ea, tfg in tfgs}
+	known = dict(callee_summaries)
+	known.update(summaries)
+	# recursive calls need several passes
+	changed = True
+	while changed:
+		changed = False
+		for summary in summaries.values():
+			if summary.compose(known):
+				changed = True
+	return list(summaries.values())
@@ -0,0 +1,104 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+import pyphrank.utils as utils
+from pyphrank.type_cache import register_close_invalidator
+
+if TYPE_CHECKING:
+	from pyphrank.type_flow_graph import TFG
+	from pyphrank.type_flow_graph_parts import Node
+
+
+# global variable address -> functions, that use it in their tfgs
+GVAR_FUNCTIONS : dict[int, set[int]] = {}
+# function with indexed tfg -> global variables, that it uses
+FUNC_GVARS : dict[int, set[int]] = {}
+# global variable address -> functions, that reference it by xrefs
+GVAR_XREFS : dict[int, set[int]] = {}
+
+
+def set_func_gvars(func_ea:int, gvars:set[int]):
+	""" Global variables, that are used in tfg of function """
+	for obj_ea in FUNC_GVARS.pop(func_ea, ()):
+		functions = GVAR_FUNCTIONS[obj_ea]
+		functions.discard(func_ea)
+		if len(functions) == 0:
+			GVAR_FUNCTIONS.pop(obj_ea)
+
+	FUNC_GVARS[func_ea] = gvars
+	for obj_ea in gvars:
+		GVAR_FUNCTIONS.setdefault(obj_ea, set()).add(func_ea)
+
+def get_gvar_functions(obj_ea:int) -> set[int]:
+	"""
+	Functions, that use global variable in their tfgs.
+	Functions without indexed tfgs are taken from xrefs, that are looked up once per variable
+	"""
+	xrefs = GVAR_XREFS.get(obj_ea)
+	if xrefs is None:
+		xrefs = utils.get_func_calls_to(obj_ea)
+		GVAR_XREFS[obj_ea] = xrefs
+
+	functions = {func_ea for func_ea in xrefs if func_ea not in FUNC_GVARS}
+	functions.update(GVAR_FUNCTIONS.get(obj_ea, ()))
+	return functions
+
+def invalidate_gvar_functions():
+	""" Should be called, when references change, e.g. after adding new code references """
+	GVAR_XREFS.clear()
+
+def clear_gvar_functions():
+	GVAR_FUNCTIONS.clear()
+	FUNC_GVARS.clear()
+	GVAR_XREFS.clear()
+
+register_close_invalidator(clear_gvar_functions)
+
+
+class GlobalVarIndex:
+	"""
+	Global variable -> functions -> nodes of their cached tfgs, that use it.
+	Functions are indexed, when their tfg is cached, and also added to
+	global variable functions, that Var.get_functions uses
+	"""
+	def __init__(self) -> None:
+		self.uses : dict[int, dict[int, list[Node]]] = {}
+		# indexed function -> global variables, that it uses
+		self.func_gvars : dict[int, set[int]] = {}
+
+	def __len__(self) -> int:
+		return len(self.uses)
+
+	def add_tfg(self, func_ea:int, tfg:TFG):
+		self.remove_func(func_ea)
+
+		gvars = set()
+		for node in tfg.iterate_nodes():
+			for var in node.sexpr.extract_vars():
+				if var.is_local():
+					continue
+				func_nodes = self.uses.setdefault(var.obj_ea, {}).setdefault(func_ea, [])
+				func_nodes.append(node)
+				gvars.add(var.obj_ea)
+		self.func_gvars[func_ea] = gvars
+		set_func_gvars(func_ea, set(gvars))
+
+	def remove_func(self, func_ea:int):
+		for obj_ea in self.func_gvars.pop(func_ea, ()):
+			funcs = self.uses[obj_ea]
+			funcs.pop(func_ea, None)
+			if len(funcs) == 0:
+				self.uses.pop(obj_ea)
+
+	def is_func_indexed(self, func_ea:int) -> bool:
+		return func_ea in self.func_gvars
+
+	def get_indexed_functions(self, obj_ea:int) -> set[int]:
+		return set(self.uses.get(obj_ea, {}).keys())
+
+	def get_func_nodes(self, obj_ea:int, func_ea:int) -> list[Node]:
+		return self.uses.get(obj_ea, {}).get(func_ea, [])
+
+	def clear(self):
+		self.uses.clear()
+		self.func_gvars.clear()
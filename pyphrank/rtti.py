@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import idaapi
+import idautils
+import idc
+
+import pyphrank.settings as settings
+import pyphrank.utils as utils
+
+
+# max count of vcall and vbase offsets before offset to top in itanium vtable
+ITANIUM_MAX_VOFFSETS = 64
+
+
+def read_ptr(ea:int) -> int:
+	if settings.PTRSIZE == 8:
+		return idaapi.get_qword(ea)
+	return idaapi.get_dword(ea)
+
+def to_signed(value:int, size:int) -> int:
+	if value >= 1 << (size * 8 - 1):
+		value -= 1 << (size * 8)
+	return value
+
+def get_cstr(ea:int) -> str|None:
+	s = idc.get_strlit_contents(ea, -1, idc.STRTYPE_C)
+	if s is None:
+		return None
+	return s.decode(errors="replace")
+
+def msvc_name2class_name(name:str) -> str:
+	""" .?AVBar@ns@@ -> ns::Bar """
+	for prefix in (".?AV", ".?AU"):
+		if name.startswith(prefix):
+			name = name[len(prefix):]
+			break
+	if name.endswith("@@"):
+		name = name[:-2]
+	return "::".join(reversed(name.split("@")))
+
+
+class RttiClass:
+	__slots__ = "name", "type_info", "bases", "vtables"
+
+	def __init__(self, name:str, type_info:int) -> None:
+		self.name = name
+		# address of type info (itanium) or type descriptor (msvc)
+		self.type_info = type_info
+		# direct bases as (offset, base type info, is virtual)
+		self.bases : list[tuple[int, int, bool]] = []
+		# offset in class -> address of virtual functions of vtable
+		self.vtables : dict[int, int] = {}
+
+	def __str__(self) -> str:
+		return f"RttiClass({self.name},bases={len(self.bases)},vtables={len(self.vtables)})"
+
+
+class RttiParser:
+	"""
+	Builds class hierarchy from RTTI data without decompilation.
+	Supports itanium type infos and msvc complete object locators
+	"""
+	ITANIUM_CLASS = "__class_type_info"
+	ITANIUM_SI_CLASS = "__si_class_type_info"
+	ITANIUM_VMI_CLASS = "__vmi_class_type_info"
+	# base class descriptor has pointer to its hierarchy descriptor
+	BCD_HASPCHD = 0x40
+
+	def __init__(self) -> None:
+		# type info address -> class
+		self.classes : dict[int, RttiClass] = {}
+		# vtable address -> (class, offset in class)
+		self.vtables : dict[int, tuple[RttiClass, int]] = {}
+		# msvc classes, which bases are already parsed
+		self._msvc_parsed : set[int] = set()
+		self.is_parsed = False
+
+	def parse(self) -> dict[int, RttiClass]:
+		self.is_parsed = True
+		for ea, name in idautils.Names():
+			if name.startswith("_ZTV"):
+				self.parse_itanium_vtable(ea)
+			elif name.startswith("??_7"):
+				self.parse_msvc_vtable(ea)
+		utils.log_info(f"found {len(self.classes)} classes in RTTI")
+		return self.classes
+
+	def get_class_by_vtable(self, vtbl_ea:int) -> tuple[RttiClass|None, int]:
+		return self.vtables.get(vtbl_ea, (None, 0))
+
+	def get_class(self, type_info:int) -> RttiClass|None:
+		return self.classes.get(type_info)
+
+	def add_vtable(self, cls:RttiClass, offset:int, vtbl_ea:int):
+		cls.vtables.setdefault(offset, vtbl_ea)
+		self.vtables.setdefault(vtbl_ea, (cls, offset))
+
+	def get_itanium_kind(self, type_info:int) -> str|None:
+		# type info vptr points into (or is relocated to) __cxxabiv1 vtable
+		vptr = read_ptr(type_info)
+		for ea in (vptr, vptr - 2 * settings.PTRSIZE):
+			name = idaapi.get_name(ea)
+			if not name:
+				continue
+			for kind in (self.ITANIUM_VMI_CLASS, self.ITANIUM_SI_CLASS, self.ITANIUM_CLASS):
+				if kind in name:
+					return kind
+		return None
+
+	def parse_itanium_type_info(self, type_info:int) -> RttiClass|None:
+		if (cls := self.classes.get(type_info)) is not None:
+			return cls
+
+		kind = self.get_itanium_kind(type_info)
+		if kind is None:
+			return None
+
+		ptrsize = settings.PTRSIZE
+		mangled = get_cstr(read_ptr(type_info + ptrsize))
+		if mangled is None:
+			return None
+		name = idaapi.demangle_name("_ZTS" + mangled, idaapi.MNG_SHORT_FORM)
+		if name is not None and name.startswith("typeinfo name for "):
+			name = name[len("typeinfo name for "):]
+		else:
+			name = mangled
+
+		cls = RttiClass(name, type_info)
+		self.classes[type_info] = cls
+		if kind == self.ITANIUM_SI_CLASS:
+			base = read_ptr(type_info + 2 * ptrsize)
+			if self.parse_itanium_type_info(base) is not None:
+				cls.bases.append((0, base, False))
+
+		elif kind == self.ITANIUM_VMI_CLASS:
+			base_count = idaapi.get_dword(type_info + 2 * ptrsize + 4)
+			base_ea = type_info + 2 * ptrsize + 8
+			for _ in range(base_count):
+				base = read_ptr(base_ea)
+				offset_flags = to_signed(read_ptr(base_ea + ptrsize), ptrsize)
+				base_ea += 2 * ptrsize
+				if self.parse_itanium_type_info(base) is None:
+					continue
+				# lower byte is flags, 1 is for virtual base
+				cls.bases.append((offset_flags >> 8, base, offset_flags & 1 != 0))
+		return cls
+
+	def find_itanium_vtable(self, ea:int) -> int:
+		"""
+		Address of offset to top of vtable, that starts at ea or later.
+		Vtables of classes with virtual bases start with vcall and vbase offsets.
+		Returns -1 if there is no type info after offsets
+		"""
+		ptrsize = settings.PTRSIZE
+		for i in range(ITANIUM_MAX_VOFFSETS + 1):
+			start = ea + i * ptrsize
+			# offsets are not named, next named address is another vtable group
+			if i != 0 and idaapi.has_name(idaapi.get_flags(start)):
+				break
+			if self.get_itanium_kind(read_ptr(start + ptrsize)) is not None:
+				return start
+		return -1
+
+	def parse_itanium_vtable(self, ea:int):
+		"""
+		Vtable group is primary vtable followed by secondary ones,
+		each starts with vcall and vbase offsets, offset to top and type info
+		"""
+		group_ea = ea
+		ea = self.find_itanium_vtable(ea)
+		if ea == -1:
+			utils.log_warn(f"failed to find type info in vtable {idaapi.get_name(group_ea)}")
+			return
+		if ea != group_ea:
+			utils.log_debug(f"{idaapi.get_name(group_ea)} has {(ea - group_ea) // settings.PTRSIZE} vcall and vbase offsets")
+
+		ptrsize = settings.PTRSIZE
+		type_info = read_ptr(ea + ptrsize)
+		cls = self.parse_itanium_type_info(type_info)
+		if cls is None:
+			return
+
+		while read_ptr(ea + ptrsize) == type_info:
+			offset_to_top = to_signed(read_ptr(ea), ptrsize)
+			vfuncs_ea = ea + 2 * ptrsize
+			self.add_vtable(cls, -offset_to_top, vfuncs_ea)
+
+			ea = vfuncs_ea
+			while utils.is_func_start(read_ptr(ea)):
+				ea += ptrsize
+			if ea == vfuncs_ea:
+				break
+
+			# secondary vtables of virtual bases have their own offsets
+			ea = self.find_itanium_vtable(ea)
+			if ea == -1:
+				break
+
+	def msvc_ptr(self, value:int) -> int:
+		# 64bit msvc rtti uses offsets from image base
+		if settings.PTRSIZE == 8:
+			return idaapi.get_imagebase() + value
+		return value
+
+	def parse_msvc_type_descriptor(self, type_descr:int) -> str|None:
+		name = get_cstr(type_descr + 2 * settings.PTRSIZE)
+		if name is None or not name.startswith(".?A"):
+			return None
+		return msvc_name2class_name(name)
+
+	def parse_msvc_vtable(self, ea:int):
+		col = read_ptr(ea - settings.PTRSIZE)
+		if not idaapi.is_loaded(col):
+			return
+
+		vtbl_offset = idaapi.get_dword(col + 4)
+		type_descr = self.msvc_ptr(idaapi.get_dword(col + 12))
+		chd = self.msvc_ptr(idaapi.get_dword(col + 16))
+		cls = self.parse_msvc_class(type_descr, chd)
+		if cls is not None:
+			self.add_vtable(cls, vtbl_offset, ea)
+
+	def parse_msvc_class(self, type_descr:int, chd:int|None) -> RttiClass|None:
+		""" Hierarchy descriptor might be unknown for bases in old 32bit rtti """
+		cls = self.classes.get(type_descr)
+		if cls is None:
+			name = self.parse_msvc_type_descriptor(type_descr)
+			if name is None:
+				return None
+			cls = RttiClass(name, type_descr)
+			self.classes[type_descr] = cls
+
+		if chd is None or type_descr in self._msvc_parsed:
+			return cls
+		self._msvc_parsed.add(type_descr)
+
+		# base class array starts with class itself, followed by all bases in preorder
+		bases_count = idaapi.get_dword(chd + 8)
+		bases_array = self.msvc_ptr(idaapi.get_dword(chd + 12))
+		bcds = [self.msvc_ptr(idaapi.get_dword(bases_array + i * 4)) for i in range(bases_count)]
+		i = 1
+		while i < len(bcds):
+			bcd = bcds[i]
+			base_descr = self.msvc_ptr(idaapi.get_dword(bcd))
+			contained_bases = idaapi.get_dword(bcd + 4)
+			mdisp = to_signed(idaapi.get_dword(bcd + 8), 4)
+			pdisp = to_signed(idaapi.get_dword(bcd + 12), 4)
+			base_chd = None
+			if settings.PTRSIZE == 8 or idaapi.get_dword(bcd + 20) & self.BCD_HASPCHD:
+				base_chd = self.msvc_ptr(idaapi.get_dword(bcd + 24))
+			if self.parse_msvc_class(base_descr, base_chd) is not None:
+				# pdisp is -1 for non virtual bases
+				cls.bases.append((mdisp, base_descr, pdisp != -1))
+			i += contained_bases + 1
+		return cls
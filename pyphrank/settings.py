@@ -26,6 +26,25 @@ def should_skip_by_prefix(fname:str) -> bool:
 			return True
 	return False
 
+# create new types in database by parsing their C declarations at once
+# instead of adding members one by one
+CREATE_TYPES_FROM_DECLS = True
+
+# maximum number of parsed type strings to keep in cache
+STR2TIF_CACHE_SIZE = 4096
+
+# number of processes, that calculate function summaries bottom-up over call graph,
+# 0 to calculate them in IDA process
+SUMMARY_WORKERS = 0
+
+# python interpreter for summary workers, empty to use sys.executable,
+# should be set if IDA executable is sys.executable
+SUMMARY_PYTHON = ""
+
+# file of tfg store (see TypeAnalyzer.dump_tfgs), that tfgs are read from
+# instead of decompiling functions, empty to not use store
+TFG_STORE_PATH = ""
+
 PTRSIZE = 8
 
 
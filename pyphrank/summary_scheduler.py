@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+
+from pyphrank.function_summary import FunctionSummary, summarize_scc
+import pyphrank.settings as settings
+import pyphrank.utils as utils
+
+
+def find_sccs(graph:dict[int, set[int]]) -> list[list[int]]:
+	"""
+	Strongly connected components of call graph (tarjan algorithm without recursion).
+	Components are returned callees first, calls outside of graph are ignored
+	"""
+	index : dict[int, int] = {}
+	lowlink : dict[int, int] = {}
+	on_stack : set[int] = set()
+	stack : list[int] = []
+	sccs : list[list[int]] = []
+
+	for root in sorted(graph.keys()):
+		if root in index:
+			continue
+
+		index[root] = lowlink[root] = len(index)
+		stack.append(root)
+		on_stack.add(root)
+		work = [(root, iter(sorted(graph[root])))]
+		while len(work) != 0:
+			node, callees = work[-1]
+			for callee in callees:
+				if callee not in graph:
+					continue
+				if callee not in index:
+					index[callee] = lowlink[callee] = len(index)
+					stack.append(callee)
+					on_stack.add(callee)
+					work.append((callee, iter(sorted(graph[callee]))))
+					break
+				if callee in on_stack:
+					lowlink[node] = min(lowlink[node], index[callee])
+			else:
+				work.pop()
+				if len(work) != 0:
+					parent = work[-1][0]
+					lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+				if lowlink[node] == index[node]:
+					scc = []
+					while True:
+						member = stack.pop()
+						on_stack.remove(member)
+						scc.append(member)
+						if member == node:
+							break
+					sccs.append(sorted(scc))
+	return sccs
+
+def get_scc_levels(sccs:list[list[int]], graph:dict[int, set[int]]) -> list[list[list[int]]]:
+	"""
+	Group components in levels, components of one level do not call each other
+	and only call components of previous levels
+	"""
+	func2level : dict[int, int] = {}
+	levels : list[list[list[int]]] = []
+	for scc in sccs:
+		members = set(scc)
+		level = 0
+		for func_ea in scc:
+			for callee in graph[func_ea]:
+				if callee in members or callee not in func2level:
+					continue
+				level = max(level, func2level[callee] + 1)
+
+		for func_ea in scc:
+			func2level[func_ea] = level
+		if level == len(levels):
+			levels.append([])
+		levels[level].append(scc)
+	return levels
+
+
+class SummaryScheduler:
+	"""
+	Calculates function summaries bottom-up over call graph components.
+	Independent components are summarized concurrently in worker processes,
+	that get serialized type flow graphs and do not use IDA
+	"""
+	def __init__(self, workers:int|None=None) -> None:
+		if workers is None:
+			workers = settings.SUMMARY_WORKERS
+		self.workers = workers
+
+	def get_executor(self) -> ProcessPoolExecutor|None:
+		if self.workers == 0:
+			return None
+
+		# IDA process can not be forked, workers are started with separate interpreter
+		ctx = multiprocessing.get_context("spawn")
+		ctx.set_executable(settings.SUMMARY_PYTHON or sys.executable)
+		return ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+
+	def get_callee_summaries(self, scc:list[int], graph:dict[int, set[int]], summaries:dict[int, FunctionSummary]) -> dict[int, FunctionSummary]:
+		callees = {}
+		for func_ea in scc:
+			for callee in graph[func_ea]:
+				if (summary := summaries.get(callee)) is not None:
+					callees[callee] = summary
+		return callees
+
+	def summarize_level(self, executor:ProcessPoolExecutor|None, level:list[list[int]], tfgs:dict[int, tuple], graph:dict[int, set[int]], summaries:dict[int, FunctionSummary]) -> list[FunctionSummary]:
+		jobs = []
+		for scc in level:
+			scc_tfgs = [(func_ea, tfgs[func_ea]) for func_ea in scc]
+			jobs.append((scc_tfgs, self.get_callee_summaries(scc, graph, summaries)))
+
+		if executor is None:
+			return [s for job in jobs for s in summarize_scc(*job)]
+
+		futures = [executor.submit(summarize_scc, *job) for job in jobs]
+		return [s for future in futures for s in future.result()]
+
+	def run(self, tfgs:dict[int, tuple], graph:dict[int, set[int]], known:dict[int, FunctionSummary]|None=None) -> dict[int, FunctionSummary]:
+		"""
+		Summarize functions with given serialized tfgs,
+		graph is function -> called functions, known are already calculated summaries of callees
+		"""
+		start = time.time()
+		graph = {func_ea: graph.get(func_ea, set()) for func_ea in tfgs.keys()}
+		levels = get_scc_levels(find_sccs(graph), graph)
+
+		summaries : dict[int, FunctionSummary] = dict(known or {})
+		executor = self.get_executor()
+		# levels are summarized completely or not at all
+		done_levels = 0
+		try:
+			for level in levels:
+				for summary in self.summarize_level(executor, level, tfgs, graph, summaries):
+					summaries[summary.func_ea] = summary
+				done_levels += 1
+
+		except (BrokenExecutor, OSError) as e:
+			utils.log_warn(f"summary workers failed ({e}), summarizing in current process")
+			if executor is not None:
+				executor.shutdown(wait=False, cancel_futures=True)
+				executor = None
+			for level in levels[done_levels:]:
+				for summary in self.summarize_level(None, level, tfgs, graph, summaries):
+					summaries[summary.func_ea] = summary
+
+		finally:
+			if executor is not None:
+				executor.shutdown()
+
+		summaries = {func_ea: summaries[func_ea] for func_ea in tfgs.keys()}
+		utils.log_info(f"summarized {len(summaries)} functions in {len(levels)} levels with {self.workers} workers in {time.time() - start:.2f}s")
+		return summaries
@@ -0,0 +1,97 @@
+"""
+Type flow graphs as plain tuples, that can be pickled and analyzed without IDA.
+
+	sexpr = (op, addr, x, y), UNKNOWN_SEXPR is () and missing sexpr is None
+	var use chain x = (varid, ((use type, offset), ...))
+	type literal x = type string, "" for UNKNOWN_TYPE, types are parsed lazily by type table
+	node = (node type, sexpr, y, z), type cast y is type string, call cast z is sexpr
+	tfg = (nodes, edges), entry is first node, edges are (parent index, child index)
+"""
+from __future__ import annotations
+
+from pyphrank.type_flow_graph import TFG
+from pyphrank.type_flow_graph_parts import SExpr, Node, Var, VarUse, VarUseChain, UNKNOWN_SEXPR
+from pyphrank.type_table import TYPE_TABLE
+
+
+def serialize_vuc(vuc:VarUseChain) -> tuple:
+	return (vuc.var.varid, vuc.uses_key())
+
+def deserialize_vuc(data:tuple) -> VarUseChain:
+	varid, uses = data
+	var = Var(*varid) if isinstance(varid, tuple) else Var(varid)
+	return VarUseChain(var, *[VarUse(offset, use_type) for use_type, offset in uses])
+
+def serialize_sexpr(sexpr:SExpr|None) -> tuple|None:
+	if sexpr is None:
+		return None
+	if sexpr is UNKNOWN_SEXPR:
+		return ()
+
+	op = sexpr.op
+	if op == SExpr.TYPE_LITERAL:
+		x, y = TYPE_TABLE.get_string(sexpr.literal_type_id), None
+	elif op == SExpr.TYPE_VAR_USE_CHAIN:
+		x, y = serialize_vuc(sexpr.var_use_chain), None # type:ignore
+	elif op == SExpr.TYPE_FUNCTION:
+		x, y = sexpr.func_addr, None
+	elif op in (SExpr.TYPE_PTR, SExpr.TYPE_PARTIAL):
+		x, y = serialize_sexpr(sexpr.x), sexpr.y
+	else:
+		x, y = serialize_sexpr(sexpr.x), serialize_sexpr(sexpr.y)
+	return (op, sexpr.addr, x, y)
+
+def deserialize_sexpr(data:tuple|None) -> SExpr|None:
+	if data is None:
+		return None
+	if len(data) == 0:
+		return UNKNOWN_SEXPR
+
+	op, addr, x, y = data
+	sexpr = SExpr(op, addr)
+	if op == SExpr.TYPE_LITERAL:
+		sexpr._x = TYPE_TABLE.add_string(x)
+	elif op == SExpr.TYPE_VAR_USE_CHAIN:
+		sexpr._x = deserialize_vuc(x)
+	elif op == SExpr.TYPE_FUNCTION:
+		sexpr._x = x
+	elif op in (SExpr.TYPE_PTR, SExpr.TYPE_PARTIAL):
+		sexpr._x = deserialize_sexpr(x)
+		sexpr._y = y
+	else:
+		sexpr._x = deserialize_sexpr(x)
+		sexpr._y = deserialize_sexpr(y)
+	return sexpr
+
+def serialize_node(node:Node) -> tuple:
+	sexpr = serialize_sexpr(node.sexpr)
+	if node.is_call_cast():
+		return (node.node_type, sexpr, node.arg_id, serialize_sexpr(node.func_call))
+	if node.is_type_cast():
+		return (node.node_type, sexpr, TYPE_TABLE.get_string(node.type_id), None)
+	return (node.node_type, sexpr, None, None)
+
+def deserialize_node(data:tuple) -> Node:
+	node_type, sexpr, y, z = data
+	if node_type == Node.CALL_CAST:
+		return Node(node_type, deserialize_sexpr(sexpr), y, deserialize_sexpr(z))
+	if node_type == Node.TYPE_CAST:
+		return Node(node_type, deserialize_sexpr(sexpr), TYPE_TABLE.add_string(y))
+	return Node(node_type, deserialize_sexpr(sexpr))
+
+def serialize_tfg(tfg:TFG) -> tuple:
+	nodes = list(tfg.iterate_nodes())
+	node_ids = {node: i for i, node in enumerate(nodes)}
+	edges = []
+	for node in nodes:
+		for child in node.children:
+			edges.append((node_ids[node], node_ids[child]))
+	return (tuple(serialize_node(n) for n in nodes), tuple(edges))
+
+def deserialize_tfg(data:tuple) -> TFG:
+	nodes_data, edges = data
+	nodes = [deserialize_node(n) for n in nodes_data]
+	for parent_id, child_id in edges:
+		nodes[parent_id].children.add(nodes[child_id])
+		nodes[child_id].parents.add(nodes[parent_id])
+	return TFG(nodes[0])
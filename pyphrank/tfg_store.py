@@ -0,0 +1,346 @@
+"""
+Binary store of serialized type flow graphs (see tfg_serialization).
+Store file is memory mapped and only requested functions are read from it.
+Equal sexprs, var use chains and strings are kept once for all functions.
+
+File layout (little endian):
+	header
+	functions, FUNC_FORMAT records sorted by address
+	nodes, NODE_FORMAT records, grouped by function
+	edges, EDGE_FORMAT records of function local node indexes, grouped by function
+	sexprs, SEXPR_FORMAT records
+	var use chains, VUC_FORMAT records
+	uses, USE_FORMAT records, grouped by var use chain
+	strings offsets, strings count + 1 of u64
+	strings, utf-8
+"""
+from __future__ import annotations
+
+import mmap
+import shutil
+import struct
+import tempfile
+
+from pyphrank.type_flow_graph_parts import SExpr, Node
+
+
+MAGIC = b"PHTF"
+VERSION = 2
+# magic, version, md5 of database input file,
+# then count and position in file of functions, nodes, edges, sexprs, var use chains, uses, strings
+TABLES_COUNT = 7
+DB_HASH_SIZE = 16
+HEADER_FORMAT = f"<4sI{DB_HASH_SIZE}s" + "QQ" * TABLES_COUNT
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# function address, first node, nodes count, first edge, edges count
+FUNC_FORMAT = "<QIIII"
+# node type, sexpr, call cast func_call sexpr, arg id or type string
+NODE_FORMAT = "<BqqQ"
+# parent node, child node
+EDGE_FORMAT = "<II"
+# op, addr, x, y, z (size of partial sexpr)
+SEXPR_FORMAT = "<Bqqqq"
+# variable address, lvar id (-1 for global), first use, uses count
+VUC_FORMAT = "<QqII"
+# use type, offset
+USE_FORMAT = "<Bq"
+STRING_OFFSET_FORMAT = "<Q"
+
+# op of UNKNOWN_SEXPR, serialized as empty tuple
+SEXPR_UNKNOWN = 0xFF
+
+# missing sexpr or node field
+NO_ID = -1
+NO_VALUE = 0
+
+
+def pad_db_hash(db_hash:bytes) -> bytes:
+	return db_hash[:DB_HASH_SIZE].ljust(DB_HASH_SIZE, b"\0")
+
+
+class RecordsFile:
+	""" Temporary file of fixed size records """
+	def __init__(self, record_format:str) -> None:
+		self.record = struct.Struct(record_format)
+		self.f = tempfile.TemporaryFile()
+		self.count = 0
+
+	def append(self, *values) -> int:
+		self.f.write(self.record.pack(*values))
+		self.count += 1
+		return self.count - 1
+
+	def size(self) -> int:
+		return self.count * self.record.size
+
+	def copy_to(self, f):
+		self.f.seek(0)
+		shutil.copyfileobj(self.f, f)
+
+	def close(self):
+		self.f.close()
+
+
+class TFGStoreWriter:
+	"""
+	Streams records of serialized tfgs to temporary files,
+	store is assembled on close, only functions index is kept in memory
+	"""
+	def __init__(self, fname:str, db_hash:bytes) -> None:
+		self.fname = fname
+		self.db_hash = pad_db_hash(db_hash)
+		self.funcs : dict[int, tuple] = {}
+		self.nodes = RecordsFile(NODE_FORMAT)
+		self.edges = RecordsFile(EDGE_FORMAT)
+		self.sexprs = RecordsFile(SEXPR_FORMAT)
+		self.vucs = RecordsFile(VUC_FORMAT)
+		self.uses = RecordsFile(USE_FORMAT)
+		self.string_offsets = RecordsFile(STRING_OFFSET_FORMAT)
+		self.string_offsets.append(0)
+		self.strings = tempfile.TemporaryFile()
+		self.strings_size = 0
+		# deduplication keys are packed records, not serialized sexprs
+		self.sexpr_ids : dict[bytes, int] = {}
+		self.vuc_ids : dict[tuple, int] = {}
+		self.string_ids : dict[str, int] = {}
+		self.closed = False
+
+	def __enter__(self) -> TFGStoreWriter:
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def add_string(self, s:str) -> int:
+		string_id = self.string_ids.get(s)
+		if string_id is None:
+			encoded = s.encode()
+			self.strings.write(encoded)
+			self.strings_size += len(encoded)
+			string_id = self.string_offsets.append(self.strings_size) - 1
+			self.string_ids[s] = string_id
+		return string_id
+
+	def add_vuc(self, vuc:tuple) -> int:
+		vuc_id = self.vuc_ids.get(vuc)
+		if vuc_id is not None:
+			return vuc_id
+
+		varid, uses = vuc
+		if isinstance(varid, tuple):
+			var_ea, lvar_id = varid
+		else:
+			var_ea, lvar_id = varid, -1
+
+		vuc_id = self.vucs.append(var_ea, lvar_id, self.uses.count, len(uses))
+		for use_type, offset in uses:
+			self.uses.append(use_type, offset)
+		self.vuc_ids[vuc] = vuc_id
+		return vuc_id
+
+	def add_sexpr(self, sexpr:tuple|None) -> int:
+		if sexpr is None:
+			return NO_ID
+
+		if len(sexpr) == 0:
+			record = (SEXPR_UNKNOWN, -1, NO_VALUE, NO_VALUE, NO_VALUE)
+		else:
+			op, addr, x, y = sexpr
+			if op == SExpr.TYPE_LITERAL:
+				record = (op, addr, self.add_string(x), NO_VALUE, NO_VALUE)
+			elif op == SExpr.TYPE_VAR_USE_CHAIN:
+				record = (op, addr, self.add_vuc(x), NO_VALUE, NO_VALUE)
+			elif op == SExpr.TYPE_FUNCTION:
+				record = (op, addr, x, NO_VALUE, NO_VALUE)
+			elif op == SExpr.TYPE_PTR:
+				record = (op, addr, self.add_sexpr(x), y, NO_VALUE)
+			elif op == SExpr.TYPE_PARTIAL:
+				record = (op, addr, self.add_sexpr(x), y[0], y[1])
+			else:
+				record = (op, addr, self.add_sexpr(x), self.add_sexpr(y), NO_VALUE)
+
+		packed = self.sexprs.record.pack(*record)
+		sexpr_id = self.sexpr_ids.get(packed)
+		if sexpr_id is None:
+			sexpr_id = self.sexprs.append(*record)
+			self.sexpr_ids[packed] = sexpr_id
+		return sexpr_id
+
+	def add_tfg(self, func_ea:int, tfg:tuple):
+		if func_ea in self.funcs:
+			raise ValueError(f"tfg of {hex(func_ea)} is already added")
+
+		nodes, edges = tfg
+		self.funcs[func_ea] = (self.nodes.count, len(nodes), self.edges.count, len(edges))
+		for node_type, sexpr, y, z in nodes:
+			if node_type == Node.TYPE_CAST:
+				y = self.add_string(y)
+			elif node_type != Node.CALL_CAST:
+				y = NO_VALUE
+			self.nodes.append(node_type, self.add_sexpr(sexpr), self.add_sexpr(z), y)
+		for parent_id, child_id in edges:
+			self.edges.append(parent_id, child_id)
+
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+
+		func_record = struct.Struct(FUNC_FORMAT)
+		funcs = [func_record.pack(func_ea, *self.funcs[func_ea]) for func_ea in sorted(self.funcs.keys())]
+		tables = [self.nodes, self.edges, self.sexprs, self.vucs, self.uses, self.string_offsets]
+
+		header = [len(funcs), HEADER_SIZE]
+		position = HEADER_SIZE + len(funcs) * func_record.size
+		for table in tables:
+			header += [table.count, position]
+			position += table.size()
+		# strings count is one less than offsets
+		header[-2] -= 1
+
+		with open(self.fname, "wb") as f:
+			f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.db_hash, *header))
+			f.writelines(funcs)
+			for table in tables:
+				table.copy_to(f)
+			self.strings.seek(0)
+			shutil.copyfileobj(self.strings, f)
+
+		for table in tables:
+			table.close()
+		self.strings.close()
+
+
+class TFGStore:
+	""" Memory mapped store, functions are read on request """
+	def __init__(self, fname:str, db_hash:bytes) -> None:
+		self.fname = fname
+		self.f = open(fname, "rb")
+		self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, store_db_hash, *header = struct.unpack_from(HEADER_FORMAT, self.mm, 0)
+		if magic != MAGIC or version != VERSION:
+			self.close()
+			raise ValueError(f"{fname} is not tfg store of version {VERSION}")
+		if store_db_hash != pad_db_hash(db_hash):
+			self.close()
+			raise ValueError(f"{fname} is tfg store of another database")
+
+		counts = header[0::2]
+		self.positions = header[1::2]
+		self.funcs_count = counts[0]
+		self.strings_position = self.positions[6] + (counts[6] + 1) * struct.calcsize(STRING_OFFSET_FORMAT)
+		self.func_size = struct.calcsize(FUNC_FORMAT)
+		self.node_size = struct.calcsize(NODE_FORMAT)
+		self.edge_size = struct.calcsize(EDGE_FORMAT)
+		self.sexpr_size = struct.calcsize(SEXPR_FORMAT)
+		self.vuc_size = struct.calcsize(VUC_FORMAT)
+		self.use_size = struct.calcsize(USE_FORMAT)
+		self.string_offset_size = struct.calcsize(STRING_OFFSET_FORMAT)
+
+	def __enter__(self) -> TFGStore:
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def __len__(self) -> int:
+		return self.funcs_count
+
+	def __contains__(self, func_ea:int) -> bool:
+		return self.find_func(func_ea) is not None
+
+	def close(self):
+		if not self.mm.closed:
+			self.mm.close()
+		self.f.close()
+
+	def read_func(self, i:int) -> tuple:
+		return struct.unpack_from(FUNC_FORMAT, self.mm, self.positions[0] + i * self.func_size)
+
+	def find_func(self, func_ea:int) -> tuple|None:
+		""" Binary search in sorted functions """
+		lo, hi = 0, self.funcs_count
+		while lo < hi:
+			mid = (lo + hi) // 2
+			record = self.read_func(mid)
+			if record[0] == func_ea:
+				return record
+			if record[0] < func_ea:
+				lo = mid + 1
+			else:
+				hi = mid
+		return None
+
+	def iterate_functions(self):
+		for i in range(self.funcs_count):
+			yield self.read_func(i)[0]
+
+	def get_string(self, string_id:int) -> str:
+		start, end = struct.unpack_from("<QQ", self.mm, self.positions[6] + string_id * self.string_offset_size)
+		position = self.strings_position
+		return self.mm[position + start:position + end].decode()
+
+	def get_vuc(self, vuc_id:int) -> tuple:
+		var_ea, lvar_id, uses_start, uses_count = struct.unpack_from(VUC_FORMAT, self.mm, self.positions[4] + vuc_id * self.vuc_size)
+		varid = var_ea if lvar_id == -1 else (var_ea, lvar_id)
+		uses = []
+		for i in range(uses_start, uses_start + uses_count):
+			uses.append(struct.unpack_from(USE_FORMAT, self.mm, self.positions[5] + i * self.use_size))
+		return (varid, tuple(uses))
+
+	def get_sexpr(self, sexpr_id:int, cache:dict[int, tuple|None]) -> tuple|None:
+		if sexpr_id == NO_ID:
+			return None
+		if sexpr_id in cache:
+			return cache[sexpr_id]
+
+		op, addr, x, y, z = struct.unpack_from(SEXPR_FORMAT, self.mm, self.positions[3] + sexpr_id * self.sexpr_size)
+		if op == SEXPR_UNKNOWN:
+			sexpr = ()
+		elif op == SExpr.TYPE_LITERAL:
+			sexpr = (op, addr, self.get_string(x), None)
+		elif op == SExpr.TYPE_VAR_USE_CHAIN:
+			sexpr = (op, addr, self.get_vuc(x), None)
+		elif op == SExpr.TYPE_FUNCTION:
+			sexpr = (op, addr, x, None)
+		elif op == SExpr.TYPE_PTR:
+			sexpr = (op, addr, self.get_sexpr(x, cache), y)
+		elif op == SExpr.TYPE_PARTIAL:
+			sexpr = (op, addr, self.get_sexpr(x, cache), (y, z))
+		else:
+			sexpr = (op, addr, self.get_sexpr(x, cache), self.get_sexpr(y, cache))
+		cache[sexpr_id] = sexpr
+		return sexpr
+
+	def get_tfg(self, func_ea:int) -> tuple|None:
+		""" Serialized tfg of function, None if function is not in store """
+		record = self.find_func(func_ea)
+		if record is None:
+			return None
+
+		_, nodes_start, nodes_count, edges_start, edges_count = record
+		cache : dict[int, tuple|None] = {}
+		nodes = []
+		for i in range(nodes_start, nodes_start + nodes_count):
+			node_type, sexpr_id, z_id, y = struct.unpack_from(NODE_FORMAT, self.mm, self.positions[1] + i * self.node_size)
+			sexpr = self.get_sexpr(sexpr_id, cache)
+			if node_type == Node.CALL_CAST:
+				nodes.append((node_type, sexpr, y, self.get_sexpr(z_id, cache)))
+			elif node_type == Node.TYPE_CAST:
+				nodes.append((node_type, sexpr, self.get_string(y), None))
+			else:
+				nodes.append((node_type, sexpr, None, None))
+
+		edges = []
+		for i in range(edges_start, edges_start + edges_count):
+			edges.append(struct.unpack_from(EDGE_FORMAT, self.mm, self.positions[2] + i * self.edge_size))
+		return (tuple(nodes), tuple(edges))
+
+
+def dump_tfgs(fname:str, tfgs, db_hash:bytes) -> int:
+	""" Write (function address, serialized tfg) pairs to store, returns functions count """
+	with TFGStoreWriter(fname, db_hash) as writer:
+		for func_ea, tfg in tfgs:
+			writer.add_tfg(func_ea, tfg)
+		return len(writer.funcs)
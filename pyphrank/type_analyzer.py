@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import json
+import os
+import time
 import idc
 import idaapi
 
@@ -8,10 +11,22 @@ from pyphrank.type_flow_graph_parts import Var, SExpr, VarUseChain, Node, UNKNOW
 from pyphrank.containers.structure import Structure
 from pyphrank.ast_analyzer import TFG, chain_nodes
 from pyphrank.analysis_state import AnalysisState
+from pyphrank.analysis_diff import AnalysisDiff
+from pyphrank.write_queue import WriteQueue
+from pyphrank.type_cache import get_type_caches
+from pyphrank.call_targets import CALL_TARGETS, NO_TARGETS
+from pyphrank.vtable_slots import VTABLE_SLOTS
+from pyphrank.call_graph import export_call_graph
+from pyphrank.gvar_index import GlobalVarIndex, invalidate_gvar_functions
+from pyphrank.function_summary import FunctionSummary, get_tfg_callees
+from pyphrank.summary_scheduler import SummaryScheduler, find_sccs
+from pyphrank.tfg_serialization import serialize_tfg, deserialize_tfg
+from pyphrank.tfg_store import TFGStore, dump_tfgs
 from pyphrank.container_manager import ContainerManager
 from pyphrank.type_constructors.type_constructor_interface import ITypeConstructor
 from pyphrank.type_constructors.vtable_constructor import VtableConstructor
 from pyphrank.type_constructors.struct_constructor import StructConstructor
+import pyphrank.settings as settings
 import pyphrank.utils as utils
 
 
@@ -59,12 +74,54 @@ def shrink_tfg(aa:TFG):
 
 		aa.entry = new_entry
 
+def get_next_uses(aa:TFG, uses:set[Node]) -> dict[Node, set[Node]]:
+	"""
+	Node -> closest uses, that are reachable from it through nodes without uses.
+	Nodes without uses are grouped in strongly connected components,
+	so every node of tfg is visited once
+	"""
+	nodes = list(dict.fromkeys(aa.iterate_nodes()))
+	node_ids = {node: i for i, node in enumerate(nodes)}
+	graph : dict[int, set[int]] = {}
+	for i, node in enumerate(nodes):
+		if node not in uses:
+			graph[i] = {node_ids[c] for c in node.children if c not in uses}
+
+	# components are returned successors first
+	reachable : dict[int, set[Node]] = {}
+	for scc in find_sccs(graph):
+		scc_uses = set()
+		for i in scc:
+			for child in nodes[i].children:
+				if child in uses:
+					scc_uses.add(child)
+				# children from the same component are not reached yet
+				elif (child_uses := reachable.get(node_ids[child])) is not None:
+					scc_uses.update(child_uses)
+		for i in scc:
+			reachable[i] = scc_uses
+
+	next_uses : dict[Node, set[Node]] = {}
+	for node in nodes:
+		node_uses = set()
+		for child in node.children:
+			if child in uses:
+				node_uses.add(child)
+			else:
+				node_uses.update(reachable[node_ids[child]])
+		next_uses[node] = node_uses
+	return next_uses
+
 
 class TypeAnalyzer:
 	def __init__(self) -> None:
 		self.func_manager = FunctionManager()
 		self.container_manager = ContainerManager()
 		self.tfg_cache : dict[int,TFG ]= {}
+		# uses of global variables in cached tfgs
+		self.gvar_index = GlobalVarIndex()
+		# opened on first use, False if there is no store
+		self.tfg_store : TFGStore|None|bool = None
 
 		self.state = AnalysisState()
 
@@ -75,30 +132,144 @@ class TypeAnalyzer:
 
 	def cache_tfg(self, addr:int, analysis:TFG):
 		self.tfg_cache[addr] = analysis
+		self.gvar_index.add_tfg(addr, analysis)
+		self.state.drop_summary(addr)
+
+	def get_tfg_store(self) -> TFGStore|None:
+		if self.tfg_store is None:
+			self.tfg_store = False
+			if settings.TFG_STORE_PATH != "" and os.path.exists(settings.TFG_STORE_PATH):
+				try:
+					self.tfg_store = TFGStore(settings.TFG_STORE_PATH, utils.get_input_file_md5())
+				except (OSError, ValueError) as e:
+					utils.log_warn(f"failed to open tfg store {settings.TFG_STORE_PATH}: {e}")
+
+		if self.tfg_store is False:
+			return None
+		return self.tfg_store # type:ignore
+
+	def get_stored_tfg(self, func_ea:int) -> TFG|None:
+		if (store := self.get_tfg_store()) is None:
+			return None
+		if (data := store.get_tfg(func_ea)) is None:
+			return None
+		return deserialize_tfg(data)
 
 	def get_tfg(self, func_ea:int, nocache=False) -> TFG:
 		if (cached := self.tfg_cache.get(func_ea)) is None or nocache:
-			aa = self.func_manager.get_tfg(func_ea)
-			shrink_tfg(aa)
-			self.tfg_cache[func_ea] = aa
+			# stored tfgs are already shrinked, nocache rebuilds from database
+			if nocache or (aa := self.get_stored_tfg(func_ea)) is None:
+				aa = self.func_manager.get_tfg(func_ea)
+				shrink_tfg(aa)
+			self.cache_tfg(func_ea, aa)
 		else:
 			aa = cached
 
 		return aa
 
+	def dump_tfgs(self, fname:str, funcs:list[int]|None=None) -> int:
+		"""
+		Write tfgs of functions, all functions of database by default, to tfg store.
+		Returns count of written functions
+		"""
+		start = time.time()
+		if funcs is None:
+			funcs = list(utils.iterate_all_functions())
+
+		def iterate_tfgs():
+			for func_ea in funcs:
+				if utils.is_func_import(func_ea):
+					continue
+				# tfgs are not cached, they are discarded after serialization
+				if (aa := self.tfg_cache.get(func_ea)) is None:
+					aa = self.func_manager.get_tfg(func_ea)
+					shrink_tfg(aa)
+				yield func_ea, serialize_tfg(aa)
+
+		# current store might be the same file and still be open
+		tmp_fname = fname + ".tmp"
+		count = dump_tfgs(tmp_fname, iterate_tfgs(), utils.get_input_file_md5())
+		if isinstance(self.tfg_store, TFGStore) and os.path.abspath(self.tfg_store.fname) == os.path.abspath(fname):
+			self.tfg_store.close()
+			self.tfg_store = None
+		os.replace(tmp_fname, fname)
+		utils.log_info(f"dumped tfgs of {count} functions to {fname} in {time.time() - start:.2f}s")
+		return count
+
+	def get_func_summary(self, func_ea:int) -> FunctionSummary:
+		if (summary := self.state.get_summary(func_ea)) is None:
+			summary = FunctionSummary.from_serialized_tfg(func_ea, serialize_tfg(self.get_tfg(func_ea)))
+			self.state.set_summary(func_ea, summary)
+		return summary
+
+	def get_composed_summary(self, func_ea:int) -> FunctionSummary:
+		""" Summary of function with uses of arguments in called functions """
+		if (summary := self.state.get_composed_summary(func_ea)) is None:
+			self.compute_summaries(self.get_callees_closure(func_ea), workers=0)
+			summary = self.state.get_composed_summary(func_ea)
+		return summary # type:ignore
+
+	def get_callees_closure(self, func_ea:int) -> list[int]:
+		""" Function and functions, that it calls directly or indirectly, without composed summaries """
+		funcs = [func_ea]
+		visited = {func_ea}
+		queue = [func_ea]
+		while len(queue) != 0:
+			for callee in sorted(self.get_func_summary(queue.pop()).callees):
+				if callee in visited or utils.is_func_import(callee) or self.state.get_composed_summary(callee) is not None:
+					continue
+				visited.add(callee)
+				funcs.append(callee)
+				queue.append(callee)
+		return funcs
+
+	def compute_summaries(self, funcs:list[int], workers:int|None=None):
+		"""
+		Calculate composed summaries of functions bottom-up over call graph.
+		Tfgs are collected here, summaries are calculated in worker processes
+		"""
+		tfgs = {}
+		for func_ea in funcs:
+			if utils.is_func_import(func_ea) or self.state.get_composed_summary(func_ea) is not None:
+				continue
+			tfgs[func_ea] = serialize_tfg(self.get_tfg(func_ea))
+
+		graph = {func_ea: get_tfg_callees(tfg) for func_ea, tfg in tfgs.items()}
+		known = {}
+		for callees in graph.values():
+			for callee in callees:
+				if (summary := self.state.get_composed_summary(callee)) is not None:
+					known[callee] = summary
+		summaries = SummaryScheduler(workers).run(tfgs, graph, known)
+		for func_ea, summary in summaries.items():
+			self.state.set_composed_summary(func_ea, summary)
+
+	def is_var_unused(self, var:Var) -> bool:
+		""" Local var without uses, known from function summary without collecting its uses """
+		if not var.is_local() or utils.is_func_import(var.func_ea):
+			return False
+		return not self.get_func_summary(var.func_ea).is_lvar_used(var.lvar_id)
+
 	def get_db_var_type(self, var:Var) -> idaapi.tinfo_t:
 		if var.is_local():
 			return self.func_manager.get_cfunc_lvar_type(var.func_ea, var.lvar_id)
 		else:
 			return utils.addr2tif(var.obj_ea)
 
-	def set_db_var_type(self, var:Var, var_type:idaapi.tinfo_t):
+	def set_db_var_type(self, var:Var, var_type:idaapi.tinfo_t) -> bool:
 		if var.is_local():
-			self.func_manager.set_lvar_tinfo(var.func_ea, var.lvar_id, var_type)
+			return self.func_manager.set_lvar_tinfo(var.func_ea, var.lvar_id, var_type)
 		else:
 			rv = idc.SetType(var.obj_ea, str(var_type) + ';')
 			if rv == 0:
 				utils.log_warn(f"setting {hex(var.obj_ea)} to {var_type} failed")
+			return bool(rv)
+
+	def add_db_cref(self, frm:int, to:int) -> bool:
+		rv = idaapi.add_cref(frm, to, idaapi.fl_CN)
+		if not rv:
+			utils.log_warn(f"failed to add code reference from {hex(frm)} to {hex(to)}")
+		return rv
 
 	def skip_analysis(self):
 		# delete new temporarily created types
@@ -106,7 +277,7 @@ class TypeAnalyzer:
 
 		self.state.clear()
 
-	def apply_analysis(self):
+	def get_new_crefs(self) -> list[tuple[int, int]]:
 		touched_functions = set()
 		for var in self.state.vars.keys():
 			touched_functions.update(var.get_functions())
@@ -116,27 +287,101 @@ class TypeAnalyzer:
 			func_aa = self.get_tfg(func_ea)
 			for func_call in func_aa.iterate_implicit_calls():
 				frm = func_call.addr
-				if frm == idaapi.BADADDR:
-					continue
-
-				call_ea = self.get_call_address(func_call.function)
-				if call_ea == -1:
+				if frm == -1:
 					continue
 
-				new_xrefs.append((frm, call_ea))
+				for call_ea in self.get_call_targets(func_call.function):
+					new_xrefs.append((frm, call_ea))
+		return new_xrefs
 
-		for frm, to in new_xrefs:
-			rv = idaapi.add_cref(frm, to, idaapi.fl_CN)
-			if not rv:
-				utils.log_warn(f"failed to add code reference from {hex(frm)} to {hex(to)}")
+	def get_analysis_diff(self) -> AnalysisDiff:
+		diff = AnalysisDiff()
+		diff.new_crefs = self.get_new_crefs()
 
 		for var, new_type_tif in self.state.vars.items():
 			if new_type_tif is utils.UNKNOWN_TYPE:
 				continue
 
-			self.set_db_var_type(var, new_type_tif)
+			old_type_tif = self.get_db_var_type(var)
+			if old_type_tif is not utils.UNKNOWN_TYPE and old_type_tif == new_type_tif:
+				continue
+			diff.var_types[var] = (old_type_tif, new_type_tif)
 
-		for struct in self.container_manager.new_types.values():
+		for func_ea, new_type_tif in self.state.retvals.items():
+			if new_type_tif is utils.UNKNOWN_TYPE:
+				continue
+
+			func_tif = self.func_manager.get_func_tinfo(func_ea)
+			if func_tif is utils.UNKNOWN_TYPE or not func_tif.is_func():
+				old_type_tif = utils.UNKNOWN_TYPE
+			else:
+				old_type_tif = func_tif.get_rettype()
+			if old_type_tif is not utils.UNKNOWN_TYPE and old_type_tif == new_type_tif:
+				continue
+			diff.retvals[func_ea] = (old_type_tif, new_type_tif)
+
+		diff.new_structs = list(self.container_manager.new_types.values())
+		return diff
+
+	def get_write_queue(self, diff:AnalysisDiff) -> WriteQueue:
+		"""
+		Writes are ordered by function, so that changes to one function
+		are done together and decompiler caches are reused
+		"""
+		def var_write_key(var:Var):
+			if var.is_local():
+				return (0, var.func_ea, 0, var.lvar_id)
+			return (1, var.obj_ea, 0, 0)
+
+		# return type is changed after local variables, because it resets decompiled function
+		writes = []
+		for var, (_, new_type_tif) in diff.var_types.items():
+			writes.append((var_write_key(var), self.set_db_var_type, var, new_type_tif))
+		for func_ea, (_, new_type_tif) in diff.retvals.items():
+			writes.append(((0, func_ea, 1, 0), self.func_manager.set_func_rettype, func_ea, new_type_tif))
+		writes.sort(key=lambda w: w[0])
+
+		queue = WriteQueue()
+		# new types are created first, so that variables get complete types
+		queue.add(self.container_manager.flush_containers)
+		queue.add(VTABLE_SLOTS.save)
+		for frm, to in sorted(diff.new_crefs):
+			queue.add(self.add_db_cref, frm, to)
+
+		for _, write, target, new_type_tif in writes:
+			queue.add(write, target, new_type_tif)
+		return queue
+
+	def apply_analysis(self, dry_run=False) -> AnalysisDiff:
+		"""
+		Apply analysis results to the database and return applied changes.
+		In dry run database is not modified and analysis state is kept,
+		so analysis can be applied after diff is reviewed.
+		"""
+		# read phase, database is not modified
+		start = time.time()
+		diff = self.get_analysis_diff()
+		read_time = time.time() - start
+		if dry_run:
+			utils.log_info(f"analysis diff {diff} calculated in {read_time}")
+			return diff
+
+		# write phase
+		start = time.time()
+		queue = self.get_write_queue(diff)
+		writes_count = len(queue)
+		failed = queue.drain()
+		if len(diff.new_crefs) != 0:
+			invalidate_gvar_functions()
+		write_time = time.time() - start
+		utils.log_info(
+			f"analysis applied, read phase took {read_time}, "\
+			f"write phase took {write_time} for {writes_count} writes ({failed} failed)"
+		)
+		for cache in get_type_caches():
+			utils.log_debug(str(cache))
+
+		for struct in diff.new_structs:
 			offsets = [o for o in struct.member_offsets()]
 			if len(offsets) == 0:
 				utils.log_err(f"{struct.name} has no members, this is analysis error")
@@ -146,6 +391,26 @@ class TypeAnalyzer:
 		self.state.clear()
 		# new types are already created, simply skip them without deleting
 		self.container_manager.clear()
+		return diff
+
+	def analyze_everything(self, funcs:list[int]|None=None):
+		"""
+		Analyze arguments and return values of functions, all functions of database by default.
+		Summaries are calculated bottom-up over call graph first, so that types
+		are propagated to called functions from their composed summaries
+		"""
+		start = time.time()
+		if funcs is None:
+			funcs = list(utils.iterate_all_functions())
+		funcs = [func_ea for func_ea in funcs if not utils.is_func_import(func_ea)]
+		self.compute_summaries(funcs)
+
+		for func_ea in funcs:
+			for i in range(self.func_manager.get_args_count(func_ea)):
+				self.analyze_var(Var(func_ea, i))
+			if len(self.get_func_summary(func_ea).returns) != 0:
+				self.analyze_retval(func_ea)
+		utils.log_info(f"analyzed {len(funcs)} functions in {time.time() - start:.2f}s")
 
 	def analyze_var(self, var:Var) -> idaapi.tinfo_t:
 		current_lvar_tinfo = self.state.get_var(var, default=None)
@@ -154,10 +419,14 @@ class TypeAnalyzer:
 
 		var_tinfo = self.analyze_by_heuristics(var)
 		if var_tinfo is not utils.UNKNOWN_TYPE:
-			self.state.vars[var] = var_tinfo
+			self.state.set_var(var, var_tinfo)
 			return var_tinfo
 
-		self.state.vars[var] = utils.UNKNOWN_TYPE # to break recursion
+		self.state.set_var(var, utils.UNKNOWN_TYPE) # to break recursion
+
+		if self.is_var_unused(var):
+			utils.log_warn(f"found no var uses for {var}")
+			return utils.UNKNOWN_TYPE
 
 		var_uses = self.get_all_var_uses(var)
 		if var_uses.uses_len(var) == 0:
@@ -174,17 +443,17 @@ class TypeAnalyzer:
 			utils.log_err(f"argument {var} has moves to it, will most likely result in incorrect analysis")
 
 		if len(moves_types) != 0 and (var_tinfo := utils.select_type(*moves_types)) is not utils.UNKNOWN_TYPE:
-			self.state.vars[var] = var_tinfo
+			self.state.set_var(var, var_tinfo)
 			self.propagate_var(var)
 			return var_tinfo
 
 		if self.analyze_unknown_type_by_var_uses(var, var_uses):
-			self.state.vars[var] = utils.UNKNOWN_TYPE
+			self.state.set_var(var, utils.UNKNOWN_TYPE)
 			return utils.UNKNOWN_TYPE
 
 		var_tinfo = self.analyze_existing_type_by_var_uses(var, var_uses)
 		if var_tinfo is not utils.UNKNOWN_TYPE:
-			self.state.vars[var] = var_tinfo
+			self.state.set_var(var, var_tinfo)
 			return var_tinfo
 
 		for cont in self.constructors:
@@ -194,7 +463,7 @@ class TypeAnalyzer:
 			self.container_manager.add_struct(lvar_struct)
 			var_tinfo = lvar_struct.ptr_tinfo
 			self.add_type_uses_to_var(var, var_uses, var_tinfo)
-			self.state.vars[var] = var_tinfo
+			self.state.set_var(var, var_tinfo)
 			return var_tinfo
 
 		return utils.UNKNOWN_TYPE
@@ -203,19 +472,62 @@ class TypeAnalyzer:
 		rv = self.state.retvals.get(func_ea)
 		if rv is not None:
 			return rv
-		self.state.retvals[func_ea] = utils.UNKNOWN_TYPE # to break recursion
+		self.state.set_retval(func_ea, utils.UNKNOWN_TYPE) # to break recursion
 
-		aa = self.get_tfg(func_ea)
-		r_types = [self.analyze_sexpr_type(r) for r in aa.iterate_return_sexprs()]
-		if len(r_types) == 0:
+		returns = self.get_func_summary(func_ea).returns
+		if len(returns) == 0:
 			utils.log_err(f"trying to get return type without returns in {idaapi.get_name(func_ea)}")
 			return utils.UNKNOWN_TYPE
 
+		if any(kind == FunctionSummary.RETURN_UNKNOWN for kind, _ in returns):
+			aa = self.get_tfg(func_ea)
+			r_types = [self.analyze_sexpr_type(r) for r in aa.iterate_return_sexprs()]
+		else:
+			# returns of variables, calls and literals are known from summary
+			r_types = [self.analyze_summary_return(func_ea, kind, value) for kind, value in sorted(returns, key=lambda r: (r[0], str(r[1])))]
+
 		retval_type = utils.select_type(*r_types)
-		self.state.retvals[func_ea] = retval_type
+		self.state.set_retval(func_ea, retval_type)
 		return retval_type
 
+	def analyze_summary_return(self, func_ea:int, kind:int, value) -> idaapi.tinfo_t:
+		if kind == FunctionSummary.RETURN_LVAR:
+			return self.analyze_var(Var(func_ea, value))
+		elif kind == FunctionSummary.RETURN_CALL:
+			return self.analyze_retval(value)
+		elif kind == FunctionSummary.RETURN_TYPE:
+			return utils.str2tif(value)
+		return utils.UNKNOWN_TYPE
+
+	def get_sexpr_type_version(self, sexpr:SExpr) -> tuple[int, int, int]:
+		"""
+		Version of analysis data, that sexpr type depends on.
+		Var use chain type depends only on var type, structures its uses pass through
+		and vtable overrides, other sexprs may depend on anything in analysis state
+		"""
+		if (vuc := sexpr.var_use_chain) is not None:
+			var_tif = self.state.get_var(vuc.var)
+			return self.state.get_var_version(vuc.var), vuc.get_transform_id(var_tif), CALL_TARGETS.generation
+		return self.state.version, self.container_manager.version, CALL_TARGETS.generation
+
 	def analyze_sexpr_type(self, sexpr:SExpr) -> idaapi.tinfo_t:
+		# only var uses and implicit calls are expensive to calculate
+		if (vuc := sexpr.var_use_chain) is not None:
+			key = (vuc.var, vuc.uses_key())
+		elif sexpr.is_implicit_call():
+			key = sexpr
+		else:
+			return self.calculate_sexpr_type(sexpr)
+
+		cached = self.state.sexpr_types.get(key)
+		if cached is not None and cached[0] == self.get_sexpr_type_version(sexpr):
+			return cached[1]
+
+		stype = self.calculate_sexpr_type(sexpr)
+		self.state.sexpr_types[key] = (self.get_sexpr_type_version(sexpr), stype)
+		return stype
+
+	def calculate_sexpr_type(self, sexpr:SExpr) -> idaapi.tinfo_t:
 		if sexpr.var_use_chain is not None:
 			vuc = sexpr.var_use_chain
 			tif = self.analyze_var(vuc.var)
@@ -233,9 +545,9 @@ class TypeAnalyzer:
 			return self.analyze_retval(sexpr.function.func_addr)
 
 		elif sexpr.is_implicit_call():
-			addr = self.get_call_address(sexpr.function) # type:ignore
-			if addr != -1:
-				return self.analyze_retval(addr)
+			targets = self.get_call_targets(sexpr.function) # type:ignore
+			if len(targets) != 0:
+				return utils.select_type(*[self.analyze_retval(addr) for addr in sorted(targets)])
 
 			stype = self.analyze_sexpr_type(sexpr.function) # type:ignore
 			if stype.is_funcptr():
@@ -263,24 +575,26 @@ class TypeAnalyzer:
 			self.propagate_type_to_var(target_var, var_type)
 
 		for call_cast in var_uses.iterate_call_cast_nodes():
-			call_ea = self.get_call_address(call_cast.func_call)
-			if call_ea == -1:
-				continue
-
-			if utils.is_func_import(call_ea):
-				continue
-
 			if not call_cast.sexpr.is_var():
 				continue
 
-			arg_var = Var(call_ea, call_cast.arg_id)
-			self.propagate_type_to_var(arg_var, var_type)
+			for call_ea in self.get_call_targets(call_cast.func_call):
+				if utils.is_func_import(call_ea):
+					continue
+
+				arg_var = Var(call_ea, call_cast.arg_id)
+				self.propagate_type_by_summary(arg_var, var_type)
 
 	def propagate_type_to_var(self, var:Var, new_type:idaapi.tinfo_t):
 		current_type = self.state.get_var(var)
+		if current_type is utils.UNKNOWN_TYPE and self.is_var_unused(var):
+			# nothing to propagate further or to add to type
+			self.state.set_var(var, new_type)
+			return
+
 		if current_type is utils.UNKNOWN_TYPE:
 			lvar_uses = self.get_all_var_uses(var)
-			self.state.vars[var] = new_type
+			self.state.set_var(var, new_type)
 			self.propagate_var(var)
 			self.add_type_uses_to_var(var, lvar_uses, new_type)
 			return
@@ -292,41 +606,86 @@ class TypeAnalyzer:
 				f"because variable has different type {current_type}"
 			)
 
-	def get_func_var_uses(self, func_ea:int, var:Var, nocache=False) -> TFG:
-		aa = self.get_tfg(func_ea, nocache=nocache).copy()
-		node_replacements : dict[Node, list[Node]] = {}
-		for node in aa.iterate_nodes():
-			sexpr = node.sexpr
-			if var not in sexpr.extract_vars():
-				node_replacements[node] = [NOP_NODE.copy()]
-				continue
+	def propagate_type_by_summary(self, var:Var, new_type:idaapi.tinfo_t):
+		"""
+		Same as propagate_type_to_var for local variable of called function, but uses
+		of variable, including uses in functions it is passed to, are taken from
+		composed summary instead of analyzing called functions again.
+		Variables with not exact summary are analyzed by their uses
+		"""
+		current_type = self.state.get_var(var)
+		if current_type is not utils.UNKNOWN_TYPE:
+			if current_type != new_type:
+				utils.log_warn(
+					f"failed to propagate {new_type} "\
+					f"to {var} "\
+					f"because variable has different type {current_type}"
+				)
+			return
 
-			if sexpr.is_var_use(var):
-				continue
+		var_summary = self.get_composed_summary(var.func_ea).get_lvar(var.lvar_id)
+		if var_summary is not None and not var_summary.is_exact:
+			self.propagate_type_to_var(var, new_type)
+			return
 
-			if node.is_expr() and sexpr.is_assign():
-				# writing into var or moving to var is OK
-				if sexpr.target.is_var_use(var):
-					continue
+		self.state.set_var(var, new_type)
+		if var_summary is None:
+			return
 
-				if sexpr.value.is_var_use(var):
-					# moving from var is OK
-					if sexpr.value.is_var(var):
-						continue
+		strucid = utils.tif2strucid(new_type)
+		if utils.is_struct_ptr(new_type) and strucid != -1:
+			for offset in sorted(var_summary.reads | var_summary.writes):
+				write_types = [utils.str2tif(t) for t in sorted(var_summary.write_types.get(offset, ()))]
+				self.container_manager.add_member_type(strucid, offset, utils.select_type(*write_types))
+
+		for lvar_id in sorted(var_summary.moves):
+			self.propagate_type_by_summary(Var(var.func_ea, lvar_id), new_type)
+		# uses of arguments are already composed, but arguments get types too
+		for callee, arg_id in sorted(var_summary.call_casts):
+			if not utils.is_func_import(callee):
+				self.propagate_type_by_summary(Var(callee, arg_id), new_type)
+
+	def get_var_node_replacement(self, node:Node, var:Var) -> list[Node]|None:
+		"""
+		Nodes, that replace node in var uses, chained one after another.
+		None if node is kept as it is
+		"""
+		sexpr = node.sexpr
+		if var not in sexpr.extract_vars():
+			return [NOP_NODE.copy()]
+
+		if sexpr.is_var_use(var):
+			return None
+
+		if node.is_expr() and sexpr.is_assign():
+			# writing into var or moving to var is OK
+			if sexpr.target.is_var_use(var):
+				return None
 
-					# otherwise var read is OK, no need to know where this is read
-					new_node = Node(Node.EXPR, sexpr.value)
-					node_replacements[node] = [new_node]
-					continue
+			if sexpr.value.is_var_use(var):
+				# moving from var is OK
+				if sexpr.value.is_var(var):
+					return None
 
-			new_nodes = []
-			for vuc in sexpr.extract_var_use_chains():
-				if vuc.var != var:
-					continue
-				new_node = Node(Node.EXPR, SExpr.create_var_use_chain(vuc))
-				new_nodes.append(new_node)
-			chain_nodes(*new_nodes)
-			node_replacements[node] = new_nodes
+				# otherwise var read is OK, no need to know where this is read
+				return [Node(Node.EXPR, sexpr.value)]
+
+		new_nodes = []
+		for vuc in sexpr.extract_var_use_chains():
+			if vuc.var != var:
+				continue
+			new_node = Node(Node.EXPR, SExpr.create_var_use_chain(vuc))
+			new_nodes.append(new_node)
+		chain_nodes(*new_nodes)
+		return new_nodes
+
+	def get_func_var_uses(self, func_ea:int, var:Var, nocache=False) -> TFG:
+		aa = self.get_tfg(func_ea, nocache=nocache).copy()
+		node_replacements : dict[Node, list[Node]] = {}
+		for node in aa.iterate_nodes():
+			new_nodes = self.get_var_node_replacement(node, var)
+			if new_nodes is not None:
+				node_replacements[node] = new_nodes
 
 		for node, new_nodes in node_replacements.items():
 			first = new_nodes[0]
@@ -346,15 +705,54 @@ class TypeAnalyzer:
 		shrink_tfg(aa)
 		return aa
 
+	def get_func_gvar_uses(self, func_ea:int, var:Var, nocache=False) -> TFG:
+		"""
+		Same as get_func_var_uses, but only nodes with global var uses are copied.
+		Nodes are taken from global vars index, other nodes of tfg are skipped
+		"""
+		aa = self.get_tfg(func_ea, nocache=nocache)
+		var_nodes = self.gvar_index.get_func_nodes(var.obj_ea, func_ea)
+		node_replacements : dict[Node, list[Node]] = {}
+		for node in var_nodes:
+			new_nodes = self.get_var_node_replacement(node, var)
+			if new_nodes is None:
+				new_nodes = [node.copy()]
+			node_replacements[node] = new_nodes
+
+		next_uses = get_next_uses(aa, set(node_replacements.keys()))
+		def link_next_uses(new_node:Node, node:Node):
+			for child in next_uses[node]:
+				first = node_replacements[child][0]
+				new_node.children.add(first)
+				first.parents.add(new_node)
+
+		if aa.entry in node_replacements:
+			entry = node_replacements[aa.entry][0]
+		else:
+			entry = NOP_NODE.copy()
+			link_next_uses(entry, aa.entry)
+
+		for node, new_nodes in node_replacements.items():
+			link_next_uses(new_nodes[-1], node)
+
+		var_uses = TFG(entry)
+		shrink_tfg(var_uses)
+		return var_uses
+
 	def get_all_var_uses(self, var:Var, nocache=False) -> TFG:
+		if var.is_local():
+			get_func_var_uses = self.get_func_var_uses
+		else:
+			get_func_var_uses = self.get_func_gvar_uses
+
 		funcs = var.get_functions()
 		if len(funcs) == 1:
 			func_ea = funcs.pop()
-			return self.get_func_var_uses(func_ea, var, nocache=nocache)
+			return get_func_var_uses(func_ea, var, nocache=nocache)
 
 		new_entry = NOP_NODE.copy()
 		for func_ea in funcs:
-			va = self.get_func_var_uses(func_ea, var, nocache=nocache)
+			va = get_func_var_uses(func_ea, var, nocache=nocache)
 			new_entry.children.add(va.entry)
 			va.entry.parents.add(new_entry)
 		return TFG(new_entry)
@@ -401,11 +799,8 @@ class TypeAnalyzer:
 
 			# casting to unknown is unknown
 			if node.is_call_cast():
-				addr = self.analyze_call_address(node.func_call)
-				if addr == -1:
-					return True
-				arg = Var(addr, node.arg_id)
-				if self.analyze_var(arg) is utils.UNKNOWN_TYPE:
+				targets = self.analyze_call_targets(node.func_call)
+				if all(self.analyze_var(Var(addr, node.arg_id)) is utils.UNKNOWN_TYPE for addr in targets):
 					return True
 
 			# moving unknown to var is unknown
@@ -466,8 +861,10 @@ class TypeAnalyzer:
 			write_type = utils.select_type(*write_types)
 			if write_type is utils.UNKNOWN_TYPE:
 				return utils.UNKNOWN_TYPE
-			write_type.create_ptr(write_type)
-			return write_type
+			# analyzed types are shared, so create new one instead of modifying
+			ptr_type = idaapi.tinfo_t()
+			ptr_type.create_ptr(write_type)
+			return ptr_type
 
 		if var_uses.casts_len(var) != 1:
 			return utils.UNKNOWN_TYPE
@@ -497,9 +894,9 @@ class TypeAnalyzer:
 
 		# single cast and writes into casted type
 		if arg_type.is_ptr():
-			arg_size = arg_type.get_pointed_object().get_size()
+			arg_size = utils.get_tif_size(arg_type.get_pointed_object())
 		else:
-			arg_size = arg_type.get_size()
+			arg_size = utils.get_tif_size(arg_type)
 
 		if arg_size == idaapi.BADSIZE:
 			utils.log_warn(f"failed to calculate size of argument {str(arg_type)}")
@@ -573,16 +970,14 @@ class TypeAnalyzer:
 					self.add_type_cast(vuc, cast_type, var_type)
 					continue
 
-				cast_var_uses = self.get_all_var_uses(cast_var)
 				# if single call xref to addr
 				if not utils.is_method(address) and len(utils.get_func_calls_to(address)) == 1:
-					self.propagate_type_to_var(cast_var, var_type)
-					self.add_type_uses_to_var(cast_var, cast_var_uses, var_type)
+					self.propagate_type_by_summary(cast_var, var_type)
 					continue
 
 				# if existing type
 				if (cast_type := self.analyze_var(cast_var)) is not utils.UNKNOWN_TYPE:
-					self.state.vars[cast_var] = cast_type
+					self.state.set_var(cast_var, cast_type)
 					self.add_type_cast(vuc, cast_type, var_type)
 					continue
 
@@ -630,46 +1025,94 @@ class TypeAnalyzer:
 		return None
 
 	def analyze_call_address(self, func_call:SExpr) -> int:
-		if func_call.is_function():
-			return func_call.func_addr
+		""" Same as get_call_address, but analyzes called var first """
+		if (vuc := func_call.var_use_chain) is not None:
+			self.analyze_var(vuc.var)
+		return self.get_call_address(func_call)
 
-		if (vuc := func_call.var_use_chain) is None:
-			return -1
-
-		if (var_tif := self.analyze_var(vuc.var)) is utils.UNKNOWN_TYPE:
-			return -1
-
-		member = vuc.transform_type(var_tif)
-		if isinstance(member, utils.ShiftedStruct):
-			addr = utils.str2addr(member.comment)
-			if addr == -1:
-				addr = utils.str2addr(member.name)
-		else:
-			addr = -1
-			utils.log_warn(f"failed to get final member from {var_tif} {vuc}")
-
-		return addr
+	def analyze_call_targets(self, func_call:SExpr) -> frozenset[int]:
+		""" Same as get_call_targets, but analyzes called var first """
+		if (vuc := func_call.var_use_chain) is not None:
+			self.analyze_var(vuc.var)
+		return self.get_call_targets(func_call)
 
 	def get_call_address(self, func_call:SExpr) -> int:
+		""" Called address, -1 if call is not resolved or has several possible targets """
+		targets = self.get_call_targets(func_call)
+		if len(targets) != 1:
+			return -1
+		return next(iter(targets))
+
+	def get_call_targets(self, func_call:SExpr) -> frozenset[int]:
+		"""
+		Resolves possible called addresses by called var type.
+		Results are cached per call site (address of called expression)
+		until type of called var, containers or vtable overrides change
+		"""
 		if func_call.is_function():
-			return func_call.func_addr
+			return frozenset((func_call.func_addr,))
 
 		if (vuc := func_call.var_use_chain) is None:
-			return -1
+			return NO_TARGETS
 
-		if (var_tif := self.state.get_var(vuc.var)) is utils.UNKNOWN_TYPE:
-			return -1
+		call_ea = func_call.addr
+		version = self.get_sexpr_type_version(func_call)
+		if call_ea != -1 and (targets := self.state.get_call_targets(call_ea, version)) is not None:
+			return targets
 
-		member = vuc.transform_type(var_tif)
-		if isinstance(member, utils.ShiftedStruct):
-			addr = utils.str2addr(member.comment)
-			if addr == -1:
-				addr = utils.str2addr(member.name)
+		if (var_tif := self.state.get_var(vuc.var)) is utils.UNKNOWN_TYPE:
+			targets = NO_TARGETS
 		else:
-			addr = -1
+			targets = self.get_member_call_targets(vuc, var_tif)
+
+		if call_ea != -1:
+			self.state.set_call_targets(call_ea, version, targets)
+		return targets
+
+	def get_virtual_call_edges(self) -> list[tuple[int, int, int]]:
+		"""
+		All calls, that were resolved by analysis, as (caller, call site, called address).
+		Analysis state is cleared on apply, so edges should be taken before it
+		"""
+		edges = []
+		for call_ea, target in self.state.iterate_call_targets():
+			caller = utils.get_func_start(call_ea)
+			if caller == idaapi.BADADDR:
+				continue
+			edges.append((caller, call_ea, target))
+		edges.sort()
+		return edges
+
+	def save_virtual_call_edges(self, fname:str):
+		edges = [{"caller": hex(caller), "call": hex(call_ea), "to": hex(target)} for caller, call_ea, target in self.get_virtual_call_edges()]
+		with open(fname, 'w') as f:
+			json.dump(edges, f, indent=1)
+
+	def export_call_graph(self, fname:str) -> tuple[int, int]:
+		""" Export call graph of database together with calls, that are resolved by current analysis """
+		return export_call_graph(fname, self.state.iterate_call_targets())
+
+	def get_member_call_targets(self, vuc:VarUseChain, var_tif:idaapi.tinfo_t) -> frozenset[int]:
+		"""
+		Addresses of functions in member, that is called through var use chain.
+		Vtable slots include overrides from derived classes
+		"""
+		member = vuc.transform_type(var_tif)
+		if not isinstance(member, utils.ShiftedStruct):
 			utils.log_warn(f"failed to get final member from {var_tif} {vuc}")
-
-		return addr
+			return NO_TARGETS
+
+		targets = CALL_TARGETS.get_targets(member.strucid, member.offset)
+		if targets is not None:
+			return targets
+
+		# not indexed, address might be in member comment or name
+		addr = utils.str2addr(member.comment)
+		if addr == -1:
+			addr = utils.str2addr(member.name)
+		if addr == -1:
+			return NO_TARGETS
+		return frozenset((addr,))
 
 	def is_var_possible_ptr(self, var:Var, var_uses:TFG) -> bool:
 		for node in var_uses.iterate_nodes():
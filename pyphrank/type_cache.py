@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable
+
+import idaapi
+
+import pyphrank.settings as settings
+
+
+class TypeCache:
+	"""
+	Cache of type lookups, that is cleared on any change of local types or structures.
+	If maxsize is set, least recently used entries are evicted
+	"""
+	def __init__(self, name:str, maxsize:int=0) -> None:
+		self.name = name
+		self.maxsize = maxsize
+		self.entries : OrderedDict[Any, Any] = OrderedDict()
+		# keys of failed lookups, that might succeed after new types are created
+		self.failed : set[Any] = set()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self) -> int:
+		return len(self.entries)
+
+	def get(self, key:Any) -> Any:
+		""" Returns None if not cached """
+		rv = self.entries.get(key)
+		if rv is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+			if self.maxsize != 0:
+				self.entries.move_to_end(key)
+		return rv
+
+	def add(self, key:Any, value:Any, failed:bool=False):
+		self.entries[key] = value
+		if failed:
+			self.failed.add(key)
+		if self.maxsize != 0 and len(self.entries) > self.maxsize:
+			evicted, _ = self.entries.popitem(last=False)
+			self.failed.discard(evicted)
+
+	def drop_failed(self, name:str):
+		""" Drop failed lookups of type strings, that mention name """
+		for key in [k for k in self.failed if isinstance(k, str) and name in k]:
+			self.failed.discard(key)
+			self.entries.pop(key, None)
+
+	def drop_type(self, ordinal:int, name:str):
+		""" Drop lookups of local type by ordinal and of type strings, that mention its name """
+		for key in [k for k in self.entries if k == ordinal or (isinstance(k, str) and name in k)]:
+			self.failed.discard(key)
+			del self.entries[key]
+
+	def clear(self):
+		self.entries.clear()
+		self.failed.clear()
+
+	def hit_rate(self) -> float:
+		total = self.hits + self.misses
+		if total == 0:
+			return 0.
+		return self.hits / total
+
+	def __str__(self) -> str:
+		return f"{self.name}(size={len(self)},hits={self.hits},misses={self.misses},hit_rate={self.hit_rate():.2f})"
+
+
+# type name or local type ordinal -> strucid, -1 if there is no such structure
+STRUCID_CACHE = TypeCache("strucid_cache")
+# type string -> parsed type, UNKNOWN_TYPE if failed to parse
+STR2TIF_CACHE = TypeCache("str2tif_cache", maxsize=settings.STR2TIF_CACHE_SIZE)
+
+# caches of other modules, that are derived from types
+TYPE_INVALIDATORS : list[Callable[[], None]] = []
+# called with ordinal and name of changed local type
+LOCAL_TYPE_INVALIDATORS : list[Callable[[int, str], None]] = []
+# called with strucid, when members of structure change
+STRUC_INVALIDATORS : list[Callable[[int], None]] = []
+# called with strucid of deleted structure
+DELETE_INVALIDATORS : list[Callable[[int], None]] = []
+# called, when database is closed
+CLOSE_INVALIDATORS : list[Callable[[], None]] = []
+
+def register_invalidator(invalidator:Callable[[], None]):
+	""" Invalidator is called on any change of local types or structures """
+	TYPE_INVALIDATORS.append(invalidator)
+
+def register_local_type_invalidator(invalidator:Callable[[int, str], None]):
+	""" Invalidator is called with ordinal and name of changed or deleted local type """
+	LOCAL_TYPE_INVALIDATORS.append(invalidator)
+
+def register_struc_invalidator(invalidator:Callable[[int], None]):
+	""" Invalidator is called with strucid of changed structure """
+	STRUC_INVALIDATORS.append(invalidator)
+
+def register_delete_invalidator(invalidator:Callable[[int], None]):
+	""" Invalidator is called with strucid of deleted structure """
+	DELETE_INVALIDATORS.append(invalidator)
+
+def register_close_invalidator(invalidator:Callable[[], None]):
+	""" Invalidator is called, when database is closed """
+	CLOSE_INVALIDATORS.append(invalidator)
+
+def get_type_caches() -> list[TypeCache]:
+	return [STRUCID_CACHE, STR2TIF_CACHE]
+
+def invalidate_type_caches():
+	for cache in get_type_caches():
+		cache.clear()
+	for invalidator in TYPE_INVALIDATORS:
+		invalidator()
+
+def invalidate_local_type(ordinal:int, name:str):
+	for cache in get_type_caches():
+		cache.drop_type(ordinal, name)
+	for invalidator in LOCAL_TYPE_INVALIDATORS:
+		invalidator(ordinal, name)
+
+def invalidate_struc(strucid:int):
+	for invalidator in STRUC_INVALIDATORS:
+		invalidator(strucid)
+
+
+class TypeChangeHooks(idaapi.IDB_Hooks):
+	""" Invalidates type caches, when types in database change """
+	def local_types_changed(self, *args):
+		# kind of change, ordinal and name of local type are passed since IDA 8
+		if len(args) < 3 or not args[2]:
+			invalidate_type_caches()
+			return 0
+
+		ltc, ordinal, name = args[:3]
+		if ltc == idaapi.LTC_ADDED:
+			# new type does not change existing types, only failed lookups of it
+			for cache in get_type_caches():
+				cache.drop_failed(name)
+		elif ltc in (idaapi.LTC_EDITED, idaapi.LTC_DELETED, idaapi.LTC_ALIASED):
+			invalidate_local_type(ordinal, name)
+		else:
+			invalidate_type_caches()
+		return 0
+
+	def struc_created(self, struc_id, *args):
+		# new structure does not change existing types, only failed lookups of it
+		name = idaapi.get_struc_name(struc_id)
+		if name:
+			for cache in get_type_caches():
+				cache.drop_failed(name)
+		return 0
+
+	def struc_deleted(self, struc_id, *args):
+		invalidate_type_caches()
+		invalidate_struc(struc_id)
+		for invalidator in DELETE_INVALIDATORS:
+			invalidator(struc_id)
+		return 0
+
+	def struc_renamed(self, *args):
+		invalidate_type_caches()
+		return 0
+
+	def struc_expanded(self, sptr, *args):
+		invalidate_struc(sptr.id)
+		return 0
+
+	def struc_member_created(self, sptr, *args):
+		invalidate_struc(sptr.id)
+		return 0
+
+	def struc_member_deleted(self, sptr, *args):
+		invalidate_struc(sptr.id)
+		return 0
+
+	def struc_member_renamed(self, sptr, *args):
+		invalidate_struc(sptr.id)
+		return 0
+
+	def struc_member_changed(self, sptr, *args):
+		invalidate_struc(sptr.id)
+		return 0
+
+	def closebase(self, *args):
+		invalidate_type_caches()
+		for invalidator in CLOSE_INVALIDATORS:
+			invalidator()
+		return 0
+
+
+HOOKS : TypeChangeHooks|None = None
+
+def install_hooks():
+	""" Hooks are installed once, when type caches are created """
+	global HOOKS
+	if HOOKS is not None:
+		return
+
+	HOOKS = TypeChangeHooks()
+	HOOKS.hook()
+
+
+install_hooks()
@@ -6,8 +6,15 @@ import pyphrank.utils as utils
 from pyphrank.containers.cpp_class import CDtor, CppClass
 from pyphrank.containers.vtable import Vtable
 from pyphrank.containers.vtables_union import VtablesUnion
+from pyphrank.type_constructors.vtable_analyzer import VtableAnalyzer
+from pyphrank.containers.struct_decls import to_identifier
+from pyphrank.rtti import RttiParser, RttiClass
+from pyphrank.type_constructors.this_ptr_summary import ThisPtrSummary
 from pyphrank.type_analyzer import TypeAnalyzer
 from pyphrank.type_flow_graph_parts import Var
+from pyphrank.write_queue import WriteQueue
+from pyphrank.call_targets import CALL_TARGETS
+from pyphrank.vtable_slots import VTABLE_SLOTS
 
 class ClassConstructionContext(object):
 	def __init__(self) -> None:
@@ -56,6 +63,15 @@ class CppClassAnalyzer(TypeAnalyzer):
 
 		self._cctx = ClassConstructionContext()
 		self.vtbl_analyzer = VtableAnalyzer()
+		self.rtti = RttiParser()
+		# classes, that are created from RTTI, hierarchy of them is known without decompilation
+		self._rtti_classes : dict[CppClass, RttiClass] = {}
+
+		self._summaries : dict[int, ThisPtrSummary] = {}
+		self._callers : dict[int, set[int]] = {}
+		self._searched_funcs : set[int] = set()
+		self._func_queue : list[int] = []
+		self._is_searching = False
 
 		self.user_ctors : set[int] = set()
 		if ctors is not None:
@@ -70,7 +86,7 @@ class CppClassAnalyzer(TypeAnalyzer):
 
 		for (funcea, arg_id), original_func_type in self._original_func_types.items():
 			try:
-				self.set_func_argvar_type(funcea, arg_id, original_func_type)
+				self.func_manager.set_arg_type(funcea, arg_id, original_func_type)
 			except idaapi.DecompilationFailure:
 				args = (idaapi.get_name(funcea), "skipping reverting arg type to", original_func_type)
 				print("[*] WARNING", "failed to decompile function", *args)
@@ -91,6 +107,13 @@ class CppClassAnalyzer(TypeAnalyzer):
 		self._created_unions.clear()
 		self._original_func_types.clear()
 		self._cctx.clear()
+		self.vtbl_analyzer.clear()
+		self.rtti = RttiParser()
+		self._rtti_classes.clear()
+		self._summaries.clear()
+		self._callers.clear()
+		self._searched_funcs.clear()
+		self._func_queue.clear()
 
 	def post_analysis(self):
 		self.create_classes()
@@ -103,8 +126,7 @@ class CppClassAnalyzer(TypeAnalyzer):
 		# try:
 
 		self.vtbl_analyzer.analyze_everything()
-		print("[*] INFO: found", len(self.vtbl_analyzer.new_types), "vtables")
-		for vtbl in self.vtbl_analyzer.new_types:
+		for vtbl in list(self.vtbl_analyzer.vtables.values()):
 			self.search_vtable(vtbl)
 
 		self.post_analysis()
@@ -121,55 +143,71 @@ class CppClassAnalyzer(TypeAnalyzer):
 		self.search_vtable(vtbl)
 		self.post_analysis()
 
-	def get_lvar_uses_in_calls(self, lvar_id):
-		for func_call in self.calls:
-			func_ea = func_call.get_ea()
-			if func_ea is None:
-				continue
-
-			for arg in func_call._call_expr.a:
-				argid, arg_offset = utils.get_var_offset(arg)
-				if argid != lvar_id:
-					continue
+	def get_this_summary(self, func_ea:int) -> ThisPtrSummary:
+		summary = self._summaries.get(func_ea)
+		if summary is None:
+			summary = ThisPtrSummary.from_tfg(func_ea, self.get_tfg(func_ea))
+			self._summaries[func_ea] = summary
+		return summary
 
-				yield arg_offset, func_ea
+	def get_callers(self, func_ea:int) -> set[int]:
+		callers = self._callers.get(func_ea)
+		if callers is None:
+			callers = utils.get_func_calls_to(func_ea)
+			self._callers[func_ea] = callers
+		return callers
 
 	def search_func(self, func_addr):
-		if func_addr in self._cctx._cdtors:
-			return
+		self._func_queue.append(func_addr)
+		self.process_func_queue()
 
-		if not self.is_function_start(func_addr):
+	def process_func_queue(self):
+		""" Every function is searched once, so discovery is linear in call graph size """
+		if self._is_searching:
 			return
 
-		vtbls = set()
-		func_fav = self.get_tfg(func_addr)
-		var = Var(func_addr, 0)
-		for w in func_fav.iterate_var_assigns(var):
-			intval = utils.get_int(w.value)
-			if intval is None:
-				continue
+		self._is_searching = True
+		try:
+			while len(self._func_queue) != 0:
+				self.search_func_once(self._func_queue.pop())
+		finally:
+			self._is_searching = False
 
-			vtbl = self.vtbl_analyzer.analyze_var(Var(intval))
-			if vtbl is None:
-				continue
+	def search_func_once(self, func_addr):
+		if func_addr in self._searched_funcs:
+			return
+		self._searched_funcs.add(func_addr)
 
-			vtbls.add(vtbl)
+		if not utils.is_func_start(func_addr):
+			return
 
-		if len(vtbls) == 0:
+		summary = self.get_this_summary(func_addr)
+		vtbl_writes = self.get_vtbl_writes(summary)
+		if len(vtbl_writes) == 0:
 			return
 
-		cdtor = CDtor(func_addr)
+		cdtor = CDtor(func_addr, vtbl_writes)
 		self._cctx.add_cdtor(cdtor)
-		for v in vtbls:
-			self.search_vtable(v)
-
-		for _, callee_addr in self.get_lvar_uses_in_calls(0):
-			self.search_func(callee_addr)
-
-		for caller_addr in utils.get_func_calls_to(func_addr):
-			if any(w[1] == caller_addr for w in self.get_lvar_uses_in_calls(0)):
-				continue
-			self.search_func(caller_addr)
+		for vtbls in vtbl_writes.values():
+			for v in vtbls:
+				self.search_vtable(v)
+
+		callees = summary.get_callees()
+		self._func_queue.extend(callees)
+		self._func_queue.extend(c for c in self.get_callers(func_addr) if c not in callees)
+
+	def get_vtbl_writes(self, summary:ThisPtrSummary) -> dict[int, list[Vtable]]:
+		""" Offset in this -> vtables written there """
+		vtbl_writes = {}
+		for offset, addrs in summary.writes.items():
+			vtbls = []
+			for addr in addrs:
+				vtbl = self.vtbl_analyzer.analyze_var(Var(addr))
+				if vtbl is not None and vtbl not in vtbls:
+					vtbls.append(vtbl)
+			if len(vtbls) != 0:
+				vtbl_writes[offset] = vtbls
+		return vtbl_writes
 
 	def search_vtable(self, vtbl):
 		if isinstance(vtbl, int):
@@ -186,12 +224,12 @@ class CppClassAnalyzer(TypeAnalyzer):
 
 		self._cctx.add_vtbl(vtbl)
 
-		for caller in vtbl.get_callers():
-			if caller == vtbl.get_virtual_dtor():
-				continue
-			self.search_func(caller)
+		virtual_dtor = vtbl.get_virtual_dtor()
+		self._func_queue.extend(c for c in vtbl.get_callers() if c != virtual_dtor)
+		self.process_func_queue()
 
 	def create_classes(self):
+		self.create_rtti_classes()
 		for cdtor in self._cctx.cdtors():
 			self.analyze_cdtor(cdtor)
 
@@ -214,7 +252,7 @@ class CppClassAnalyzer(TypeAnalyzer):
 			if cdtor.get_ea() in vtable0.get_virtual_dtor_calls():
 				cdtor._is_dtor = True
 
-		if self.get_func_nargs(cdtor.get_ea()) != 1:
+		if self.func_manager.get_nargs(cdtor.get_ea()) != 1:
 			cdtor._is_ctor = True
 
 		if cdtor.get_ea() in self.user_ctors:
@@ -228,22 +266,41 @@ class CppClassAnalyzer(TypeAnalyzer):
 		if cdtor._is_dtor and cdtor._is_ctor:
 			raise BaseException("Function is both ctor and dtor")
 
-	def create_cpp_class(self):
-		class_name = "cpp_class_" + str(len(self._created_classes))
+	def create_rtti_classes(self):
+		""" Create classes for vtables known from RTTI, cdtors are used only to fill members then """
+		if not self.rtti.is_parsed:
+			self.rtti.parse()
+
+		created : dict[int, CppClass] = {}
+		for vtbl in self._cctx.get_vtables():
+			rtti_class, offset = self.rtti.get_class_by_vtable(vtbl.get_ea())
+			if rtti_class is None:
+				continue
+
+			cpp_class = created.get(rtti_class.type_info)
+			if cpp_class is None:
+				cpp_class = self.create_cpp_class(to_identifier(rtti_class.name))
+				created[rtti_class.type_info] = cpp_class
+				self._rtti_classes[cpp_class] = rtti_class
+
+			cpp_class.add_vtable(offset, vtbl)
+			vtbl.set_class_offset(cpp_class, offset)
+
+	def create_cpp_class(self, class_name:str|None=None):
+		if class_name is None:
+			class_name = "cpp_class_" + str(len(self._created_classes))
 		class_name = utils.get_next_available_strucname(class_name)
 		cpp_class = CppClass.create(class_name)
 		self._created_classes.append(cpp_class)
 		return cpp_class
 
 	def create_class_per_cdtor(self, cdtor: CDtor):
-		fav = self.get_tfg(cdtor.get_ea())
-		var = Var(cdtor.get_ea(), 0)
-		writes = [w for w in fav.iterate_var_assigns(var)]
+		writes = self.get_this_summary(cdtor.get_ea()).writes
 		if len(writes) == 0:
 			print("[*] WARNING", "no writes to thisptr found in cdtor at", idaapi.get_name(cdtor.get_ea()))
 			return
 
-		min_offset = min([w.offset for w in writes])
+		min_offset = min(writes.keys())
 		if min_offset < 0 and cdtor._is_ctor:
 			raise BaseException("Negative offset found in constructor " + idaapi.get_name(cdtor.get_ea()))
 
@@ -317,7 +374,14 @@ class CppClassAnalyzer(TypeAnalyzer):
 			cdtor._is_ctor = True
 
 	def analyze_inheritance(self):
+		# type info -> class, same for all classes
+		rtti_parents = {r.type_info: c for c, r in self._rtti_classes.items()}
 		for c in self._created_classes:
+			rtti_class = self._rtti_classes.get(c)
+			if rtti_class is not None:
+				self.analyze_rtti_inheritance(c, rtti_class, rtti_parents)
+				continue
+
 			for cdtor in c._cdtors:
 				self.analyze_cdtor_inheritance(c, cdtor)
 
@@ -332,6 +396,23 @@ class CppClassAnalyzer(TypeAnalyzer):
 
 		self.set_vtables()
 
+	def analyze_rtti_inheritance(self, cpp_class: CppClass, rtti_class: RttiClass, parents: dict[int, CppClass]):
+		for offset, base_type_info, is_virtual in rtti_class.bases:
+			# offsets of virtual bases are only known at runtime
+			if is_virtual:
+				continue
+
+			parent = parents.get(base_type_info)
+			if parent is None:
+				continue
+
+			if parent.size + offset > cpp_class.size:
+				utils.log_warn(f"{parent.name} at {hex(offset)} does not fit into {cpp_class.name}, skipping RTTI base")
+				continue
+
+			cpp_class.add_parent(offset, parent)
+			parent.add_child(cpp_class)
+
 	def analyze_cdtor_inheritance(self, cpp_class: CppClass, cdtor: CDtor):
 		for offset, vtbls in cdtor.vtbl_writes():
 			for vtbl in vtbls:
@@ -354,7 +435,7 @@ class CppClassAnalyzer(TypeAnalyzer):
 				cpp_class.add_parent(offset, parent)
 				parent.add_child(cpp_class)
 
-		for offset, func_call_ea in self.get_lvar_uses_in_calls(0):
+		for offset, func_call_ea in self.get_this_summary(cdtor.get_ea()).calls:
 			parent_cdtor = self._cctx.get_cdtor(func_call_ea)
 			if parent_cdtor is None:
 				continue
@@ -408,52 +489,95 @@ class CppClassAnalyzer(TypeAnalyzer):
 					self._created_unions.append(vu)
 
 	def finalize_classes(self):
+		self.add_vtable_overrides()
+		retypes = self.collect_this_retypes()
+		self.apply_this_retypes(retypes)
+
+		# prototypes are final here, so pointer types are taken once per function
+		funcptr_types : dict[int, idaapi.tinfo_t] = {}
 		for cpp_class in self._created_classes:
-			self.update_func_types_in_class(cpp_class)
 			for vtbl in cpp_class._vtables.values():
-				self.get_func_tinfo
-
 				for member_offset in vtbl.member_offsets():
-					member_name = vtbl.get_member_name(member_offset)
-					func_addr = idc.get_name_ea_simple(member_name)
-					func_ptr_tif = self.get_funcptr_tinfo(func_addr)
+					func_ea = vtbl.get_member_func_ea(member_offset)
+					if func_ea == idaapi.BADADDR:
+						continue
+
+					func_ptr_tif = funcptr_types.get(func_ea)
+					if func_ptr_tif is None:
+						func_ptr_tif = self.func_manager.get_funcptr_tinfo(func_ea)
+						funcptr_types[func_ea] = func_ptr_tif
 					if func_ptr_tif is utils.UNKNOWN_TYPE:
 						continue
 					vtbl.set_member_type(member_offset, func_ptr_tif)
+		VTABLE_SLOTS.save()
 
-	def update_func_types_in_class(self, cpp_class):
-		new_arg_tinfo = cpp_class.get_shifted_member_ptr_tinfo(0)
-		for cdtor in cpp_class._cdtors:
-			self.change_this_in_func(new_arg_tinfo, cdtor.get_ea())
-
-		for vtbl_offset, vtbl in cpp_class._vtables.items():
-			new_arg_tinfo = cpp_class.get_shifted_member_ptr_tinfo(vtbl_offset)
-			parent_vtbl = cpp_class.get_parent_vtable(vtbl_offset)
-			self.change_this_in_vtable(new_arg_tinfo, vtbl, parent_vtbl)
-
-	def change_this_in_vtable(self, new_arg_tinfo, vtbl:Vtable, parent_vtbl=None):
-		for member_offset in vtbl.member_offsets():
-			fname = vtbl.get_member_name(member_offset)
-
-			# do not set if found in parent, will be updated later in parent
-			if parent_vtbl is not None and parent_vtbl.size > member_offset:
-				fname_parent = parent_vtbl.get_member_name(member_offset)
-				if fname_parent == fname:
-					continue
+	def add_vtable_overrides(self):
+		""" Virtual calls through base vtables can call functions from derived ones """
+		for cpp_class in self._created_classes:
+			for vtbl_offset, vtbl in cpp_class._vtables.items():
+				parent_vtbl = cpp_class.get_parent_vtable(vtbl_offset)
+				if parent_vtbl is not None:
+					CALL_TARGETS.add_override(parent_vtbl.strucid, vtbl.strucid)
+
+	def collect_this_retypes(self) -> dict[int, idaapi.tinfo_t]:
+		"""
+		Function address -> new type of this for cdtors and virtual functions.
+		Function, that is shared between vtables, is retyped once, first class wins
+		"""
+		retypes : dict[int, idaapi.tinfo_t] = {}
+		def add_retype(func_ea:int, this_tif:idaapi.tinfo_t):
+			current = retypes.setdefault(func_ea, this_tif)
+			if current is not this_tif and current != this_tif:
+				utils.log_debug(f"skipping this of {idaapi.get_name(func_ea)} changing to {this_tif}, already {current}")
 
-			fea = idc.get_name_ea_simple(fname)
-			if fea == idaapi.BADADDR:
-				raise BaseException("Bad name " + fname)
-			self.change_this_in_func(new_arg_tinfo, fea)
+		for cpp_class in self._created_classes:
+			this_tif = cpp_class.get_shifted_member_ptr_tinfo(0)
+			for cdtor in cpp_class._cdtors:
+				add_retype(cdtor.get_ea(), this_tif)
 
-	def change_this_in_func(self, new_arg_tinfo, func):
-		if self.get_func_nargs(func) == 0:
-			return
+			for vtbl_offset, vtbl in cpp_class._vtables.items():
+				this_tif = cpp_class.get_shifted_member_ptr_tinfo(vtbl_offset)
+				parent_vtbl = cpp_class.get_parent_vtable(vtbl_offset)
+				for member_offset in vtbl.member_offsets():
+					func_ea = vtbl.get_member_func_ea(member_offset)
+					if func_ea == idaapi.BADADDR:
+						utils.log_warn(f"failed to get virtual function of {vtbl.name} at {hex(member_offset)}")
+						continue
 
-		original_func_arg = self.get_func_arg_type(func, 0)
-		try:
-			self.set_func_argvar_type(func, 0, new_arg_tinfo)
-			self._original_func_types[(func, 0)] = original_func_arg
-		except idaapi.DecompilationFailure:
-			args = (idaapi.get_name(func), "skipping this arg changing to", new_arg_tinfo)
-			print("[*] WARNING", "failed to decompile function", *args)
\ No newline at end of file
+					# do not set if found in parent, will be set from parent class
+					if parent_vtbl is not None and parent_vtbl.size > member_offset and \
+							parent_vtbl.get_member_func_ea(member_offset) == func_ea:
+						continue
+					add_retype(func_ea, this_tif)
+		return retypes
+
+	def apply_this_retypes(self, retypes:dict[int, idaapi.tinfo_t]):
+		""" All prototypes are applied in one pass, decompiler caches are invalidated once per function """
+		queue = WriteQueue()
+		for func_ea in sorted(retypes.keys()):
+			queue.add(self.change_this_in_func, func_ea, retypes[func_ea])
+		failed = queue.drain()
+		if failed != 0:
+			utils.log_warn(f"failed to change this in {failed} functions out of {len(retypes)}")
+
+		for func_ea in retypes.keys():
+			if (func_ea, 0) not in self._original_func_types:
+				continue
+			idaapi.mark_cfunc_dirty(func_ea)
+			self.func_manager.func_factory.clear_cfunc(func_ea)
+
+	def change_this_in_func(self, func_ea:int, this_tif:idaapi.tinfo_t) -> bool:
+		""" Applies new prototype without invalidating decompiler caches """
+		func_details = self.func_manager.get_func_details(func_ea)
+		if func_details is None or len(func_details) == 0:
+			return False
+
+		original_this_tif = func_details[0].type.copy()
+		func_details[0].type = this_tif.copy()
+		new_func_tinfo = idaapi.tinfo_t()
+		if not new_func_tinfo.create_func(func_details) or not idaapi.apply_tinfo(func_ea, new_func_tinfo, 0):
+			utils.log_warn(f"failed to change this to {this_tif} in {idaapi.get_name(func_ea)}")
+			return False
+
+		self._original_func_types.setdefault((func_ea, 0), original_this_tif)
+		return True
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from pyphrank.type_flow_graph import TFG
+from pyphrank.type_flow_graph_parts import Var, VarUseChain, SExpr
+import pyphrank.utils as utils
+
+
+def get_this_offset(vuc:VarUseChain) -> int|None:
+	""" Offset from this pointer, if use chain is this or this + offset """
+	if len(vuc) == 0:
+		return 0
+	if len(vuc) == 1 and vuc.uses[0].is_add():
+		return vuc.uses[0].offset
+	return None
+
+def get_write_offset(vuc:VarUseChain) -> int|None:
+	""" Offset of written member, if use chain is *(this + offset) """
+	uses = vuc.uses
+	if len(uses) == 1 and uses[0].is_ptr():
+		return uses[0].offset
+	if len(uses) == 2 and uses[0].is_add() and uses[1].is_ptr() and uses[1].offset == 0:
+		return uses[0].offset
+	return None
+
+def get_global_address(sexpr:SExpr) -> int|None:
+	""" Address, if expression is constant address of global object (&obj + offset) """
+	vuc = sexpr.var_use_chain
+	if vuc is None or not vuc.var.is_global():
+		return None
+
+	addr = vuc.var.obj_ea
+	if len(vuc) == 0:
+		# arrays are used by their address
+		if not utils.addr2tif(addr).is_array():
+			return None
+		return addr
+
+	if not vuc.uses[0].is_ref():
+		return None
+	for use in vuc.uses[1:]:
+		if not use.is_add():
+			return None
+		addr += use.offset
+	return addr
+
+
+class ThisPtrSummary:
+	"""
+	Uses of this pointer (first argument) in function,
+	computed once from its type flow graph
+	"""
+	__slots__ = "func_ea", "calls", "writes"
+
+	def __init__(self, func_ea:int) -> None:
+		self.func_ea = func_ea
+		# (offset from this, called function) for this passed to direct calls
+		self.calls : list[tuple[int, int]] = []
+		# written offset -> constant addresses written there, in order of writes
+		self.writes : dict[int, list[int]] = {}
+
+	@classmethod
+	def from_tfg(cls, func_ea:int, tfg:TFG) -> ThisPtrSummary:
+		summary = cls(func_ea)
+		this = Var(func_ea, 0)
+		for node in tfg.iterate_call_cast_nodes():
+			vuc = node.sexpr.var_use_chain
+			if vuc is None or vuc.var != this:
+				continue
+
+			offset = get_this_offset(vuc)
+			if offset is None or not node.func_call.is_function():
+				continue
+
+			call = (offset, node.func_call.func_addr)
+			if call not in summary.calls:
+				summary.calls.append(call)
+
+		for asg in tfg.iterate_var_writes(this):
+			offset = get_write_offset(asg.target.var_use_chain)
+			if offset is None:
+				continue
+
+			# every written offset is kept, even if written value is not constant
+			values = summary.writes.setdefault(offset, [])
+			addr = get_global_address(asg.value)
+			if addr is not None and addr not in values:
+				values.append(addr)
+		return summary
+
+	def get_callees(self) -> set[int]:
+		return set(callee for _, callee in self.calls)
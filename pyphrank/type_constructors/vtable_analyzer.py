@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import time
+
+import idaapi
+import idautils
+import idc
+
+from pyphrank.containers.vtable import Vtable
+from pyphrank.type_flow_graph_parts import Var
+from pyphrank.vtable_scanner import VtableScanner
+from pyphrank.rtti import RttiParser
+import pyphrank.settings as settings
+import pyphrank.utils as utils
+
+
+def get_rtti_vtable_addrs() -> list[int]:
+	""" Addresses of virtual functions of vtables, that are named by RTTI """
+	addrs = []
+	parser = RttiParser()
+	for ea, name in idautils.Names():
+		# itanium vtable starts with vcall and vbase offsets, offset to top and typeinfo pointer
+		if name.startswith("_ZTV"):
+			if (start := parser.find_itanium_vtable(ea)) != -1:
+				addrs.append(start + 2 * settings.PTRSIZE)
+		# msvc vftable points to virtual functions directly
+		elif name.startswith("??_7"):
+			addrs.append(ea)
+	return addrs
+
+def remove_overlapping(sizes:dict[int, int], preferred:set[int]) -> list[int]:
+	"""
+	Remove vtable candidates, that overlap previous ones, sizes are in bytes.
+	Preferred candidates replace not preferred ones on overlap
+	"""
+	kept : list[int] = []
+	end = -1
+	for addr in sorted(sizes.keys()):
+		if addr >= end:
+			kept.append(addr)
+			end = addr + sizes[addr]
+			continue
+
+		if addr in preferred and kept[-1] not in preferred:
+			kept[-1] = addr
+			end = addr + sizes[addr]
+	return kept
+
+
+class VtableAnalyzer:
+	""" Finds vtables in whole database and creates them in bulk """
+	def __init__(self, minsize:int=2) -> None:
+		self.minsize = minsize
+		# vtable address -> vtable, both existing and created
+		self.vtables : dict[int, Vtable] = {}
+		self.new_types : list[Vtable] = []
+		self._scanner : VtableScanner|None = None
+
+	@property
+	def scanner(self) -> VtableScanner:
+		if self._scanner is None:
+			self._scanner = VtableScanner(self.minsize)
+		return self._scanner
+
+	def clear(self):
+		self.vtables.clear()
+		self.new_types.clear()
+		self._scanner = None
+
+	def collect_candidates(self) -> dict[int, list[int]]:
+		""" Returns vtable address -> virtual functions of non overlapping candidates """
+		candidates = {}
+		rtti_addrs = set()
+		for addr in get_rtti_vtable_addrs():
+			vfcs = self.scanner.read_vtable(addr)
+			if len(vfcs) >= self.minsize:
+				candidates[addr] = vfcs
+				rtti_addrs.add(addr)
+
+		for addr, vfcs in self.scanner.scan().items():
+			candidates.setdefault(addr, vfcs)
+
+		sizes = {addr: len(vfcs) * settings.PTRSIZE for addr, vfcs in candidates.items()}
+		return {addr: candidates[addr] for addr in remove_overlapping(sizes, rtti_addrs)}
+
+	def add_vtable(self, addr:int, vtbl:Vtable, is_new:bool):
+		self.vtables[addr] = vtbl
+		if not is_new:
+			# vtables from previous analyses might be not indexed yet
+			vtbl.index_slots()
+			return
+
+		self.new_types.append(vtbl)
+		if settings.SHOULD_SET_VTABLE_TYPES and idc.SetType(addr, vtbl.name + ';') == 0:
+			utils.log_warn(f"failed to set vtable type {vtbl.name} at {hex(addr)}")
+
+	def analyze_everything(self):
+		start = time.time()
+		candidates = self.collect_candidates()
+		scan_time = time.time() - start
+
+		new_vtables = {}
+		for addr, vfcs in candidates.items():
+			if addr in self.vtables:
+				continue
+
+			vtbl = Vtable.get_vtable_at_address(addr)
+			if vtbl is not None:
+				self.add_vtable(addr, vtbl, is_new=False)
+			else:
+				new_vtables[addr] = vfcs
+
+		for addr, vtbl in Vtable.from_functions_many(new_vtables).items():
+			self.add_vtable(addr, vtbl, is_new=True)
+
+		total_time = time.time() - start
+		rate = len(candidates) / total_time if total_time != 0 else 0
+		utils.log_info(
+			f"found {len(candidates)} vtables ({len(new_vtables)} new) in {total_time:.2f}s, "\
+			f"scan took {scan_time:.2f}s, {rate:.0f} vtables per second"
+		)
+
+	def analyze_var(self, var:Var) -> Vtable|None:
+		if not var.is_global():
+			return None
+
+		addr = var.obj_ea
+		vtbl = self.vtables.get(addr)
+		if vtbl is not None:
+			return vtbl
+
+		vtbl = Vtable.get_vtable_at_address(addr)
+		if vtbl is not None:
+			self.add_vtable(addr, vtbl, is_new=False)
+			return vtbl
+
+		vtbl = Vtable.from_data(addr)
+		if vtbl is None:
+			return None
+
+		self.add_vtable(addr, vtbl, is_new=True)
+		return vtbl
@@ -9,4 +9,7 @@ class VtableConstructor(ITypeConstructor):
 		pass
 
 	def from_data(self, addr:int) ->  Vtable|None:
-		return Vtable.from_data(addr)
\ No newline at end of file
+		return Vtable.from_data(addr)
+
+	def from_data_many(self, addrs:list[int]) -> dict[int, Vtable]:
+		return Vtable.from_data_many(addrs)
@@ -2,6 +2,9 @@ from __future__ import annotations
 from typing import Any
 
 import idaapi
+from pyphrank.gvar_index import get_gvar_functions
+from pyphrank.type_table import TYPE_TABLE
+from pyphrank.type_cache import register_invalidator, register_local_type_invalidator, register_struc_invalidator
 import pyphrank.utils as utils
 
 
@@ -75,7 +78,7 @@ class Var:
 		if self.is_local():
 			functions = {self.func_ea}
 		else:
-			functions = utils.get_func_calls_to(self.obj_ea)
+			functions = get_gvar_functions(self.obj_ea)
 		return functions
 
 
@@ -190,6 +193,93 @@ class VarUse:
 		return f"{use_type_str}({str(self.offset)})"
 
 
+def get_transform_key(tif:idaapi.tinfo_t):
+	"""
+	Hashable key of transformed type. Pointers to structures are keyed
+	by strucid and pointer depth to skip printing type, other types by type string
+	"""
+	ptr_depth = 0
+	obj = tif
+	while obj.is_ptr() and not obj.is_shifted_ptr():
+		obj = obj.get_pointed_object()
+		ptr_depth += 1
+
+	if obj.is_struct() or obj.is_union():
+		strucid = utils.tif2strucid(obj)
+		if strucid != -1:
+			return (strucid, ptr_depth)
+	return str(tif)
+
+def copy_transform(result:idaapi.tinfo_t|utils.ShiftedStruct) -> idaapi.tinfo_t|utils.ShiftedStruct:
+	if isinstance(result, utils.ShiftedStruct):
+		return utils.ShiftedStruct(result.strucid, result.offset)
+	if result is utils.UNKNOWN_TYPE:
+		return result
+	return result.copy()
+
+
+class TransformCache:
+	"""
+	Cache of type transformations by var uses.
+	Transformation result depends on structures it passes through,
+	so cached results are invalidated, when any of these structures change
+	"""
+	def __init__(self) -> None:
+		# key -> (id of cached result, result)
+		self.transforms : dict[tuple, tuple[int, idaapi.tinfo_t|utils.ShiftedStruct]] = {}
+		self.struc_keys : dict[int, set[tuple]] = {}
+		# keys of transformations of types, that are keyed by type string
+		self.string_keys : set[tuple] = set()
+		self.last_id = 0
+
+	def get(self, key:tuple):
+		""" Returns copy of cached result, None if not cached """
+		rv = self.transforms.get(key)
+		if rv is None:
+			return None
+		return copy_transform(rv[1])
+
+	def get_id(self, key:tuple) -> int:
+		"""
+		Id of cached result, result calculated again after invalidation gets new id.
+		-1 if not cached
+		"""
+		rv = self.transforms.get(key)
+		if rv is None:
+			return -1
+		return rv[0]
+
+	def add(self, key:tuple, result:idaapi.tinfo_t|utils.ShiftedStruct, strucids:set[int]):
+		self.last_id += 1
+		self.transforms[key] = (self.last_id, copy_transform(result))
+		if isinstance(key[0], str):
+			self.string_keys.add(key)
+		for strucid in strucids:
+			self.struc_keys.setdefault(strucid, set()).add(key)
+
+	def invalidate_struct(self, strucid:int):
+		for key in self.struc_keys.pop(strucid, ()):
+			self.transforms.pop(key, None)
+
+	def invalidate_local_type(self, ordinal:int, name:str):
+		if (strucid := idaapi.get_struc_id(name)) != idaapi.BADADDR:
+			self.invalidate_struct(strucid)
+		for key in [k for k in self.string_keys if name in k[0]]:
+			self.string_keys.discard(key)
+			self.transforms.pop(key, None)
+
+	def clear(self):
+		self.transforms.clear()
+		self.struc_keys.clear()
+		self.string_keys.clear()
+
+
+TRANSFORM_CACHE = TransformCache()
+register_invalidator(TRANSFORM_CACHE.clear)
+register_local_type_invalidator(TRANSFORM_CACHE.invalidate_local_type)
+register_struc_invalidator(TRANSFORM_CACHE.invalidate_struct)
+
+
 class VarUseChain:
 	def __init__(self, var:Var, *uses:VarUse):
 		self.var = var
@@ -201,15 +291,45 @@ class VarUseChain:
 	def __len__(self) -> int:
 		return len(self.uses)
 
+	def uses_key(self) -> tuple[tuple[int, int], ...]:
+		""" Hashable representation of uses """
+		return tuple((u.use_type, u.offset) for u in self.uses)
+
 	def transform_type(self, tif:idaapi.tinfo_t) -> idaapi.tinfo_t|utils.ShiftedStruct:
+		if len(self.uses) == 0:
+			return tif
+
+		key = (get_transform_key(tif), self.uses_key())
+		if (cached := TRANSFORM_CACHE.get(key)) is not None:
+			return cached
+
+		# structures, that transformation passes through
+		strucids = set()
 		for i, use in enumerate(self.uses):
+			if isinstance(tif, utils.ShiftedStruct):
+				strucids.add(tif.strucid)
+			else:
+				if (strucid := utils.tif2strucid(tif)) != -1:
+					strucids.add(strucid)
+				# shifted pointer is resolved through its base structure
+				base, _ = utils.get_shifted_base(tif)
+				if base is not None and (strucid := utils.tif2strucid(base)) != -1:
+					strucids.add(strucid)
+
 			tif = use.do_transform(tif)
 			if tif is utils.UNKNOWN_TYPE:
 				utils.log_debug(f"failed to calculate next step on {i} of uses {self.uses_str()}")
 				break
 
+		TRANSFORM_CACHE.add(key, tif, strucids)
 		return tif
 
+	def get_transform_id(self, tif:idaapi.tinfo_t) -> int:
+		""" Changes, when any structure, that transformation of tif passes through, changes """
+		if len(self.uses) == 0:
+			return 0
+		return TRANSFORM_CACHE.get_id((get_transform_key(tif), self.uses_key()))
+
 	def is_possible_ptr(self) -> bool:
 		return self.get_ptr_offset() is not None
 
@@ -396,7 +516,7 @@ class SExpr:
 	@classmethod
 	def create_type_literal(cls, literal_type:idaapi.tinfo_t, addr=-1):
 		obj = cls(cls.TYPE_LITERAL, addr=addr)
-		obj._x = literal_type
+		obj._x = TYPE_TABLE.add_type(literal_type)
 		return obj
 
 	@classmethod
@@ -494,6 +614,10 @@ class SExpr:
 
 	@property
 	def literal_tinfo(self) -> idaapi.tinfo_t:
+		return TYPE_TABLE.get_type(self._x)
+
+	@property
+	def literal_type_id(self) -> int:
 		return self._x
 
 	@property
@@ -514,6 +638,9 @@ class Node:
 	CALL_CAST = 2
 	TYPE_CAST = 3
 	def __init__(self, node_type, sexpr:SExpr, y=None, z=None) -> None:
+		# type casts keep type id from type table
+		if node_type == self.TYPE_CAST and not isinstance(y, int):
+			y = TYPE_TABLE.add_type(y)
 		self.node_type = node_type
 		self.sexpr = sexpr
 		self.y = y
@@ -605,7 +732,11 @@ class Node:
 
 	@property
 	def tif(self) -> idaapi.tinfo_t:
-		return self.y
+		return TYPE_TABLE.get_type(self.y) # type: ignore
+
+	@property
+	def type_id(self) -> int:
+		return self.y # type: ignore
 
 
 NOP_NODE = Node(Node.EXPR, UNKNOWN_SEXPR)
\ No newline at end of file
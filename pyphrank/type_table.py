@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import idaapi
+
+import pyphrank.utils as utils
+from pyphrank.type_cache import register_invalidator, register_local_type_invalidator, register_close_invalidator
+
+
+# type id of UNKNOWN_TYPE
+UNKNOWN_TYPE_ID = 0
+
+
+def get_local_type_key(tif:idaapi.tinfo_t) -> tuple[int, int]|None:
+	""" (ordinal, pointers count) of local type or pointer to it, None for other types """
+	ptr_count = 0
+	while tif.is_ptr():
+		if tif.is_const() or tif.is_volatile():
+			return None
+		tif = tif.get_pointed_object()
+		ptr_count += 1
+
+	if tif.is_const() or tif.is_volatile():
+		return None
+	ordinal = tif.get_ordinal()
+	if ordinal == 0:
+		return None
+	return (ordinal, ptr_count)
+
+
+class TypeTable:
+	"""
+	Types of lifted graphs, interned by type string into small integer ids.
+	Local types and pointers to them are interned by ordinal without printing them.
+	Types, that are added as strings, are parsed on first request
+	"""
+	def __init__(self) -> None:
+		self.strings : list[str] = [""]
+		# UNKNOWN_TYPE is not stored, table is created before utils are imported
+		self.types : list[idaapi.tinfo_t|None] = [None]
+		self.string_ids : dict[str, int] = {"": UNKNOWN_TYPE_ID}
+		self.local_type_ids : dict[tuple[int, int], int] = {}
+
+	def __len__(self) -> int:
+		return len(self.strings)
+
+	def add_string(self, type_str:str) -> int:
+		type_id = self.string_ids.get(type_str)
+		if type_id is None:
+			type_id = len(self.strings)
+			self.strings.append(type_str)
+			self.types.append(None)
+			self.string_ids[type_str] = type_id
+		return type_id
+
+	def add_type(self, tif:idaapi.tinfo_t|None) -> int:
+		if tif is utils.UNKNOWN_TYPE or tif is None:
+			return UNKNOWN_TYPE_ID
+
+		key = get_local_type_key(tif)
+		if key is not None and (type_id := self.local_type_ids.get(key)) is not None:
+			return type_id
+
+		type_id = self.add_string(str(tif))
+		if self.types[type_id] is None:
+			self.types[type_id] = tif.copy()
+		if key is not None:
+			self.local_type_ids[key] = type_id
+		return type_id
+
+	def get_type(self, type_id:int) -> idaapi.tinfo_t:
+		if type_id == UNKNOWN_TYPE_ID:
+			return utils.UNKNOWN_TYPE
+
+		# interned types are shared like other analyzed types, callers copy them before changing
+		tif = self.types[type_id]
+		if tif is None:
+			tif = utils.str2tif(self.strings[type_id])
+			self.types[type_id] = tif
+		return tif
+
+	def get_string(self, type_id:int) -> str:
+		return self.strings[type_id]
+
+	def serialize(self) -> tuple[str, ...]:
+		""" Type strings in order of ids """
+		return tuple(self.strings)
+
+	@classmethod
+	def from_serialized(cls, strings:tuple[str, ...]) -> TypeTable:
+		table = cls()
+		for type_str in strings[1:]:
+			table.add_string(type_str)
+		return table
+
+	def drop_local_types(self):
+		""" Ordinals might point to other types after local types change """
+		self.local_type_ids.clear()
+
+	def drop_local_type(self, ordinal:int, name:str):
+		for key in [k for k in self.local_type_ids if k[0] == ordinal]:
+			del self.local_type_ids[key]
+
+	def drop_types(self):
+		""" Keep ids and strings, but parse types again, e.g. in another database """
+		self.types = [None] * len(self.strings)
+		self.drop_local_types()
+
+	def clear(self):
+		self.strings = [""]
+		self.types = [None]
+		self.string_ids = {"": UNKNOWN_TYPE_ID}
+		self.local_type_ids.clear()
+
+
+TYPE_TABLE = TypeTable()
+register_invalidator(TYPE_TABLE.drop_local_types)
+register_local_type_invalidator(TYPE_TABLE.drop_local_type)
+# cached tfgs keep type ids, so only parsed types are dropped
+register_close_invalidator(TYPE_TABLE.drop_types)
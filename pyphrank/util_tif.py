@@ -3,7 +3,9 @@ from __future__ import annotations
 import idaapi
 import ida_struct
 import idc
-from functools import lru_cache as _lru_cache
+
+from pyphrank.containers.struct_layout import get_layout
+from pyphrank.type_cache import STRUCID_CACHE, STR2TIF_CACHE
 
 
 UNKNOWN_TYPE = idaapi.tinfo_t()
@@ -41,6 +43,15 @@ def str2strucid(s:str) -> int:
 	if s.startswith("struct "):
 		s = s[7:]
 
+	rv = STRUCID_CACHE.get(s)
+	if rv is not None:
+		return rv
+
+	rv = _str2strucid(s)
+	STRUCID_CACHE.add(s, rv, failed=rv == -1)
+	return rv
+
+def _str2strucid(s:str) -> int:
 	rv = idaapi.get_struc_id(s)
 	if rv != idaapi.BADADDR:
 		return rv
@@ -55,6 +66,19 @@ def tif2strucid(tif:idaapi.tinfo_t) -> int:
 		return -1
 
 	tif = get_final_tif(tif)
+	# local types are cached by ordinal to skip printing type
+	ordinal = tif.get_ordinal()
+	if ordinal != 0:
+		rv = STRUCID_CACHE.get(ordinal)
+		if rv is not None:
+			return rv
+
+	rv = _tif2strucid(tif)
+	if ordinal != 0:
+		STRUCID_CACHE.add(ordinal, rv)
+	return rv
+
+def _tif2strucid(tif:idaapi.tinfo_t) -> int:
 	if not is_tif_correct(tif):
 		return -1
 
@@ -78,8 +102,18 @@ def addr2tif(addr:int) -> idaapi.tinfo_t:
 	return str2tif(addr_type)
 
 
-@_lru_cache
 def str2tif(type_str:str) -> idaapi.tinfo_t:
+	tif = STR2TIF_CACHE.get(type_str)
+	if tif is None:
+		tif = _str2tif(type_str)
+		STR2TIF_CACHE.add(type_str, tif, failed=tif is UNKNOWN_TYPE)
+
+	if tif is UNKNOWN_TYPE:
+		return UNKNOWN_TYPE
+	# cached types are shared, so every caller gets own copy
+	return tif.copy()
+
+def _str2tif(type_str:str) -> idaapi.tinfo_t:
 	if type_str[-1] != ';':
 		type_str = type_str + ';'
 
@@ -120,6 +154,12 @@ def get_shifted_base(shifted:idaapi.tinfo_t):
 		return None, -1
 	return pi.parent, pi.delta
 
+def get_tif_size(tif:idaapi.tinfo_t) -> int:
+	""" Type size, that accounts for structures not yet created in database """
+	if tif.is_struct() and (layout := get_layout(tif2strucid(tif))) is not None:
+		return layout.size
+	return tif.get_size()
+
 def is_struct_ptr(tif:idaapi.tinfo_t) -> bool:
 	if not tif.is_ptr():
 		return False
@@ -135,7 +175,10 @@ class ShiftedStruct:
 		self.offset = offset
 
 	def bad_offset(self) -> bool:
-		struc_sz = ida_struct.get_struc_size(self.strucid)
+		if (layout := get_layout(self.strucid)) is not None:
+			struc_sz = layout.size
+		else:
+			struc_sz = ida_struct.get_struc_size(self.strucid)
 		if self.offset < 0 or self.offset >= struc_sz:
 			return True
 		return False
@@ -144,6 +187,10 @@ class ShiftedStruct:
 	def name(self) -> str:
 		if self.bad_offset():
 			return ""
+		if (layout := get_layout(self.strucid)) is not None:
+			member = layout.get_member(self.offset)
+			return "" if member is None else member.name
+
 		name = idc.get_member_name(self.strucid, self.offset)
 		if name is None:
 			name = ""
@@ -153,6 +200,12 @@ class ShiftedStruct:
 	def tif(self) -> idaapi.tinfo_t:
 		if self.bad_offset():
 			return UNKNOWN_TYPE
+		if (layout := get_layout(self.strucid)) is not None:
+			member = layout.get_member(self.offset)
+			if member is None or member.tif is None:
+				return UNKNOWN_TYPE
+			return member.tif
+
 		sptr = ida_struct.get_struc(self.strucid)
 		mptr = ida_struct.get_member(sptr, self.offset)
 		# member is unset
@@ -169,6 +222,10 @@ class ShiftedStruct:
 	def comment(self) -> str:
 		if self.bad_offset():
 			return ""
+		if (layout := get_layout(self.strucid)) is not None:
+			member = layout.get_member(self.offset)
+			return "" if member is None else member.comment
+
 		cmt = idc.get_member_cmt(self.strucid, self.offset, 0)
 		if cmt is None:
 			cmt = ""
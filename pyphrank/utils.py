@@ -72,6 +72,13 @@ def get_pointer_size() -> int:
 	else:
 		return 2
 
+def get_input_file_md5() -> bytes:
+	""" Identifies database, empty if md5 of input file is unknown """
+	md5 = idaapi.retrieve_input_file_md5()
+	if md5 is None:
+		return b""
+	return bytes(md5)
+
 def str2addr(s:str) -> int:
 	base = 10
 	if s.startswith("0x"):
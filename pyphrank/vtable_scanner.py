@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import idaapi
+import idc
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+import pyphrank.settings as settings
+import pyphrank.utils as utils
+
+
+def find_vtable_runs(is_func, has_xref, minsize:int=2) -> list[tuple[int, int]]:
+	"""
+	Find vtables in sequence of pointer slots, returns (start, end) slot indexes.
+	Vtable is a run of function pointers, that starts at referenced slot
+	and ends before next referenced slot or at first non function pointer
+	"""
+	if np is not None:
+		is_func = np.asarray(is_func, dtype=bool)
+		has_xref = np.asarray(has_xref, dtype=bool)
+		starts = np.flatnonzero(is_func & has_xref)
+		breaks = np.append(np.flatnonzero(~is_func | has_xref), len(is_func))
+		ends = breaks[np.searchsorted(breaks, starts, side="right")]
+		good = (ends - starts) >= minsize
+		return list(zip(starts[good].tolist(), ends[good].tolist()))
+
+	runs = []
+	start = -1
+	for i, (f, x) in enumerate(zip(is_func, has_xref)):
+		if start != -1 and (not f or x):
+			if i - start >= minsize:
+				runs.append((start, i))
+			start = -1
+		if f and x:
+			start = i
+	if start != -1 and len(is_func) - start >= minsize:
+		runs.append((start, len(is_func)))
+	return runs
+
+
+def iterate_data_segments():
+	for segstart, segend in utils.iterate_segments():
+		if idc.get_segm_attr(segstart, idc.SEGATTR_TYPE) != idc.SEG_DATA:
+			continue
+		yield segstart, segend
+
+
+class VtableScanner:
+	""" Finds all vtables in data segments by reading whole segments at once """
+	def __init__(self, minsize:int=2) -> None:
+		self.minsize = minsize
+		self.func_starts = sorted(utils.iterate_all_functions())
+		self.func_starts_set = set(self.func_starts)
+		if np is not None:
+			self.func_starts_arr = np.array(self.func_starts, dtype=np.uint64)
+
+	def read_pointers(self, start:int, end:int) -> list[int]:
+		ptrsize = settings.PTRSIZE
+		data = idaapi.get_bytes(start, end - start)
+		if data is None:
+			return []
+
+		byteorder = "big" if idaapi.inf_is_be() else "little"
+		if np is not None:
+			dtype = np.dtype(np.uint64 if ptrsize == 8 else np.uint32).newbyteorder(">" if byteorder == "big" else "<")
+			return np.frombuffer(data, dtype=dtype, count=len(data) // ptrsize)
+		return [int.from_bytes(data[i:i + ptrsize], byteorder) for i in range(0, len(data) - ptrsize + 1, ptrsize)]
+
+	def read_xrefs(self, start:int, is_func):
+		"""
+		Which of pointer slots are referenced. Only slots with function pointers
+		can start vtables, so data references are looked up only for them
+		"""
+		ptrsize = settings.PTRSIZE
+		if np is not None:
+			has_xref = np.zeros(len(is_func), dtype=bool)
+			candidates = np.flatnonzero(is_func).tolist()
+		else:
+			has_xref = [False] * len(is_func)
+			candidates = [i for i, f in enumerate(is_func) if f]
+
+		for i in candidates:
+			if idaapi.get_first_dref_to(start + i * ptrsize) != idaapi.BADADDR:
+				has_xref[i] = True
+		return has_xref
+
+	def scan_segment(self, segstart:int, segend:int) -> dict[int, list[int]]:
+		ptrsize = settings.PTRSIZE
+		start = (segstart + ptrsize - 1) // ptrsize * ptrsize
+		ptrs = self.read_pointers(start, segend)
+		if len(ptrs) == 0:
+			return {}
+
+		if np is not None:
+			is_func = np.isin(ptrs, self.func_starts_arr)
+		else:
+			is_func = [p in self.func_starts_set for p in ptrs]
+		has_xref = self.read_xrefs(start, is_func)
+
+		vtbls = {}
+		for run_start, run_end in find_vtable_runs(is_func, has_xref, self.minsize):
+			vtbls[start + run_start * ptrsize] = [int(p) for p in ptrs[run_start:run_end]]
+		return vtbls
+
+	def read_vtable(self, addr:int) -> list[int]:
+		""" Read virtual functions at known vtable address, that might have no references """
+		ptrsize = settings.PTRSIZE
+		read_pointer_func = idaapi.get_qword if ptrsize == 8 else idaapi.get_dword
+		vfcs = []
+		while idaapi.is_loaded(addr):
+			# next vtable starts on next referenced slot
+			if len(vfcs) != 0 and idaapi.has_xref(idaapi.get_flags(addr)):
+				break
+
+			ptr = read_pointer_func(addr)
+			if ptr not in self.func_starts_set:
+				break
+			vfcs.append(ptr)
+			addr += ptrsize
+		return vfcs
+
+	def scan(self) -> dict[int, list[int]]:
+		""" Returns vtable address -> virtual functions for all data segments """
+		vtbls = {}
+		for segstart, segend in iterate_data_segments():
+			vtbls.update(self.scan_segment(segstart, segend))
+		return vtbls
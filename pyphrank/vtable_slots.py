@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from array import array
+
+import idaapi
+
+from pyphrank.type_cache import register_delete_invalidator, register_close_invalidator
+
+
+def pack_slots(slots:dict[int, int]) -> bytes:
+	""" offset -> address into flat array of (offset, address) pairs """
+	data = array('Q')
+	for offset in sorted(slots.keys()):
+		data.append(offset)
+		data.append(slots[offset])
+	return data.tobytes()
+
+def unpack_slots(blob:bytes) -> dict[int, int]:
+	data = array('Q')
+	data.frombytes(blob)
+	return {data[i]: data[i + 1] for i in range(0, len(data) - 1, 2)}
+
+
+class VtableSlotIndex:
+	"""
+	(vtable strucid, member offset) -> address of virtual function.
+	Slots are kept in memory and persisted in netnode blob per vtable,
+	so they are not parsed from member comments or names again.
+	Slots are persisted only on save, in write phase of analysis
+	"""
+	NETNODE_NAME = "$ pyphrank vtable slots"
+	BLOB_TAG = 'S'
+
+	def __init__(self) -> None:
+		# strucid -> member offset -> address, None if vtable is not indexed
+		self.slots : dict[int, dict[int, int]|None] = {}
+		# strucids of vtables, that are indexed, but not persisted yet
+		self.unsaved : set[int] = set()
+
+	def __len__(self) -> int:
+		return len(self.slots)
+
+	def get_node(self) -> idaapi.netnode:
+		return idaapi.netnode(self.NETNODE_NAME, 0, True)
+
+	def add_vtable(self, strucid:int, slots:dict[int, int]):
+		self.slots[strucid] = dict(slots)
+		self.unsaved.add(strucid)
+
+	def save(self):
+		""" Persist vtables, that were indexed since last save """
+		if len(self.unsaved) == 0:
+			return
+
+		node = self.get_node()
+		for strucid in sorted(self.unsaved):
+			slots = self.slots.get(strucid)
+			if slots is not None:
+				node.setblob(pack_slots(slots), strucid, self.BLOB_TAG)
+		self.unsaved.clear()
+
+	def get_slots(self, strucid:int) -> dict[int, int]|None:
+		""" Returns None if vtable is not indexed """
+		if strucid in self.slots:
+			return self.slots[strucid]
+
+		blob = self.get_node().getblob(strucid, self.BLOB_TAG)
+		slots = unpack_slots(blob) if blob is not None else None
+		self.slots[strucid] = slots
+		return slots
+
+	def is_indexed(self, strucid:int) -> bool:
+		return self.get_slots(strucid) is not None
+
+	def get(self, strucid:int, offset:int) -> int|None:
+		"""
+		Returns address of virtual function at offset, -1 if there is no such slot
+		and None if vtable is not indexed
+		"""
+		slots = self.get_slots(strucid)
+		if slots is None:
+			return None
+		return slots.get(offset, -1)
+
+	def remove(self, strucid:int):
+		self.slots.pop(strucid, None)
+		if strucid in self.unsaved:
+			self.unsaved.discard(strucid)
+			return
+		self.get_node().delblob(strucid, self.BLOB_TAG)
+
+	def move(self, old_strucid:int, new_strucid:int):
+		""" Vtable structure got new strucid, its slots are moved to it """
+		slots = self.get_slots(old_strucid)
+		self.remove(old_strucid)
+		if slots is not None:
+			self.add_vtable(new_strucid, slots)
+
+	def clear(self):
+		""" Clears only memory, persisted slots are loaded on next use """
+		self.slots.clear()
+		self.unsaved.clear()
+
+
+VTABLE_SLOTS = VtableSlotIndex()
+register_delete_invalidator(VTABLE_SLOTS.remove)
+register_close_invalidator(VTABLE_SLOTS.clear)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from typing import Callable
+
+import idaapi
+
+import pyphrank.utils as utils
+
+
+class WriteQueue:
+	"""
+	Ordered queue of database writes.
+	Writes are collected first and then executed all at once
+	on IDA main thread, because database is not thread safe
+	"""
+	def __init__(self) -> None:
+		self.writes : list[tuple[Callable, tuple]] = []
+
+	def __len__(self) -> int:
+		return len(self.writes)
+
+	def add(self, write:Callable, *args):
+		self.writes.append((write, args))
+
+	def drain(self) -> int:
+		""" Execute all writes in order, returns number of failed writes """
+		failed = 0
+		def do_writes():
+			nonlocal failed
+			for write, args in self.writes:
+				if write(*args) is False:
+					failed += 1
+			return 1
+
+		rv = idaapi.execute_sync(do_writes, idaapi.MFF_WRITE)
+		if rv == -1:
+			utils.log_err(f"failed to execute {len(self.writes)} writes on main thread")
+			failed = len(self.writes)
+		self.writes.clear()
+		return failed
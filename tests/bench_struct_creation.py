@@ -0,0 +1,74 @@
+"""
+Compares creating vtables and new structures member by member
+with creating them from declarations at once.
+Run as IDA script: idat -A -S"bench_struct_creation.py [max vtables]" binary.i64
+"""
+import time
+
+import idaapi
+import idc
+import phrank
+
+
+def find_vtable_addrs(max_count:int) -> list[int]:
+	addrs = []
+	for segstart, segend in phrank.iterate_segments():
+		if idc.get_segm_attr(segstart, idc.SEGATTR_TYPE) != idc.SEG_DATA:
+			continue
+
+		for addr in range(segstart, segend, phrank.settings.PTRSIZE):
+			if idaapi.get_first_dref_to(addr) == idaapi.BADADDR:
+				continue
+			if len(phrank.Vtable.get_vtable_functions_at_addr(addr)) == 0:
+				continue
+			addrs.append(addr)
+			if len(addrs) == max_count:
+				return addrs
+	return addrs
+
+def bench_struct_flush(structs_count:int, members_count:int, from_decls:bool) -> float:
+	cm = phrank.ContainerManager()
+	int_tif = phrank.str2tif("int")
+	for _ in range(structs_count):
+		struct = phrank.Structure.new()
+		cm.add_struct(struct)
+		for i in range(members_count):
+			cm.add_member_type(struct.strucid, i * 8, int_tif)
+
+	phrank.settings.CREATE_TYPES_FROM_DECLS = from_decls
+	start = time.time()
+	cm.flush_containers()
+	flush_time = time.time() - start
+	cm.delete_containers()
+	return flush_time
+
+def main():
+	idaapi.auto_wait()
+	max_count = int(idc.ARGV[1]) if len(idc.ARGV) > 1 else 1000
+	addrs = find_vtable_addrs(max_count)
+	print(f"found {len(addrs)} vtables")
+
+	start = time.time()
+	vtbls = [phrank.Vtable.from_data(addr) for addr in addrs]
+	incremental_time = time.time() - start
+	for vtbl in vtbls:
+		if vtbl is not None:
+			vtbl.delete()
+
+	start = time.time()
+	vtbls = phrank.Vtable.from_data_many(addrs)
+	bulk_time = time.time() - start
+	for vtbl in vtbls.values():
+		vtbl.delete()
+
+	print(f"incremental vtables creation took {incremental_time}")
+	print(f"vtables creation from declarations took {bulk_time} ({len(vtbls)} created)")
+
+	structs_count = max(len(addrs), 100)
+	print(f"incremental flush of {structs_count} structures took {bench_struct_flush(structs_count, 16, False)}")
+	print(f"flush of {structs_count} structures from declarations took {bench_struct_flush(structs_count, 16, True)}")
+	idaapi.qexit(0)
+
+
+if __name__ == "__main__":
+	main()
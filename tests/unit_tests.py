@@ -4,9 +4,27 @@ import phrank
 import time
 import os
 import sys
+import tempfile
 
 from typing import Callable
 
+from pyphrank.call_graph_format import CallEdge, CallGraphWriter
+from pyphrank.call_targets import CallTargets
+from pyphrank.container_manager import ContainerManager
+from pyphrank.containers.struct_decls import StructDeclBatch
+from pyphrank.containers.struct_layout import StructLayout
+from pyphrank.function_summary import FunctionSummary
+from pyphrank.gvar_index import GlobalVarIndex
+from pyphrank.rtti import msvc_name2class_name
+from pyphrank.summary_scheduler import find_sccs, get_scc_levels
+from pyphrank.tfg_serialization import serialize_tfg, deserialize_tfg
+from pyphrank.tfg_store import dump_tfgs
+from pyphrank.type_constructors.this_ptr_summary import ThisPtrSummary
+from pyphrank.type_constructors.vtable_analyzer import remove_overlapping
+from pyphrank.type_table import TypeTable
+from pyphrank.vtable_scanner import find_vtable_runs
+from pyphrank.vtable_slots import pack_slots, unpack_slots
+
 
 def make_ptr_write(offset, value=None):
 	target = phrank.SExpr.create_var_use_chain(-1, phrank.VarUseChain(phrank.Var(0x123456, 0), phrank.VarUse(offset, phrank.VarUse.VAR_PTR)))
@@ -42,6 +60,17 @@ def test_basic_struct_content() -> bool:
 	sa.container_manager.delete_containers()
 	return True
 
+def test_new_struct_member_name() -> bool:
+	"""testing naming member of new struct, e.g. on writes of function pointers"""
+	struc = phrank.Structure.new()
+	cm = ContainerManager()
+	cm.add_struct(struc)
+	cm.add_member_name(struc.strucid, 8, "A::vfunc")
+	# names are the same, as in structure declaration
+	rv = struc.member_exists(8) and struc.get_member_name(8) == "A__vfunc"
+	cm.delete_containers()
+	return rv
+
 def test_var_uses_collection() -> bool:
 	var = phrank.Var(0x123456, 0)
 	mock_analysis = phrank.TFG(phrank.ASTCtx(0x123456))
@@ -55,6 +84,291 @@ def test_var_uses_collection() -> bool:
 	else:
 		return True
 
+def test_retval_only_diff() -> bool:
+	"""testing analysis diff with only return type change is not empty"""
+	diff = phrank.AnalysisDiff()
+	if not diff.is_empty():
+		return False
+	diff.retvals[0x123456] = (phrank.UNKNOWN_TYPE, phrank.str2tif("int"))
+	return not diff.is_empty() and len(diff.to_dict()["retvals"]) == 1
+
+def test_struct_layout_members() -> bool:
+	"""testing in-memory structure layout member resolution from evidence"""
+	layout = StructLayout()
+	if not layout.add_member(0, 1, "field_0") or not layout.add_member(8, 1, "field_8"):
+		return False
+	# duplicate name is rejected
+	if layout.set_member_name(8, "field_0"):
+		return False
+	if layout.get_next_member(0).offset != 8 or layout.size != 9:
+		return False
+	# wider type absorbs overlapped unknown members
+	layout.set_member_type(0, phrank.str2tif("char[12]"), 12)
+	if len(layout) != 1 or layout.get_member(10).offset != 0 or layout.size != 12:
+		return False
+	# typed member can not overlap other typed evidence
+	layout.set_member_type(8, phrank.str2tif("int"), 4)
+	if layout.conflicts != [0] or layout.get_member(8).offset != 8 or layout.get_member(0).tif is not None:
+		return False
+	# pointer wins over integral of the same size regardless of order
+	layout = StructLayout()
+	layout.set_member_type(0, phrank.str2tif("__int64"), 8)
+	layout.set_member_type(0, phrank.str2tif("void*"), 8)
+	if not layout.get_member(0).tif.is_ptr():
+		return False
+	# recorded size does not create members
+	layout.set_size(0x20)
+	if layout.size != 0x20 or len(layout) != 1 or layout.get_member(0x1f) is not None:
+		return False
+	return True
+
+def test_struct_layout_incremental() -> bool:
+	"""testing resolving layout between evidence gives the same members as resolving it at once"""
+	def members(layout):
+		return [(m.offset, m.size, str(m.tif)) for m in layout.iterate_members()]
+
+	layout = StructLayout()
+	for offset in range(0, 0x40, 4):
+		layout.add_evidence(offset, None, 8)
+		layout.get_member(offset)
+	layout.set_member_type(0x10, phrank.str2tif("int"), 4)
+	layout.get_member(0x10)
+	layout.set_member_type(0x20, phrank.str2tif("void*"), 8)
+	if not layout.set_member_name(0x20, "ptr") or layout.set_member_name(0x10, "ptr"):
+		return False
+
+	incremental = members(layout)
+	layout.resolve()
+	return incremental == members(layout) and layout.get_member(0x20).name == "ptr"
+
+def test_struct_decl_rendering() -> bool:
+	"""testing rendering of structure declaration with holes and recorded size"""
+	batch = StructDeclBatch()
+	batch.add_struct("decl_test", [(0, "field_0", None, 8), (12, "a::b", phrank.str2tif("int"), 4)], 0x20)
+	decl = batch.decls["decl_test"]
+	if "__int64 field_0;" not in decl or "char gap8[4];" not in decl:
+		return False
+	if "int a__b;" not in decl or "char gap10[16];" not in decl:
+		return False
+	return batch.sizes["decl_test"] == 0x20
+
+def test_str2tif_cache() -> bool:
+	"""testing cached types are not shared and parse failures are cached"""
+	tif = phrank.str2tif("int")
+	tif.create_ptr(phrank.str2tif("char"))
+	if str(phrank.str2tif("int")) != "int":
+		return False
+	if phrank.str2tif("not a type at all") is not phrank.UNKNOWN_TYPE:
+		return False
+	return phrank.str2tif("not a type at all") is phrank.UNKNOWN_TYPE
+
+def test_vtable_runs() -> bool:
+	"""testing vtable detection in pointer slots"""
+	is_func = [True, True, True, False, True, True, True, True, True]
+	has_xref = [True, False, False, False, True, False, True, False, True]
+	runs = find_vtable_runs(is_func, has_xref, minsize=2)
+	return runs == [(0, 3), (4, 6), (6, 8)]
+
+def test_vtable_candidates_overlap() -> bool:
+	"""testing overlapping vtable candidates removal"""
+	sizes = {0x100: 0x20, 0x110: 0x10, 0x120: 0x8, 0x200: 0x10, 0x208: 0x10}
+	kept = remove_overlapping(sizes, preferred={0x208})
+	return kept == [0x100, 0x120, 0x208]
+
+def test_msvc_rtti_names() -> bool:
+	"""testing msvc type descriptor names to class names"""
+	if msvc_name2class_name(".?AVBar@ns@@") != "ns::Bar":
+		return False
+	return msvc_name2class_name(".?AUFoo@@") == "Foo"
+
+def test_this_ptr_summary() -> bool:
+	"""testing this pointer summary collects vtable writes and calls with this"""
+	func_ea = 0x123456
+	this = phrank.Var(func_ea, 0)
+	target = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(8, phrank.VarUse.VAR_PTR)))
+	value = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(phrank.Var(0x5000), phrank.VarUse(0, phrank.VarUse.VAR_REF), phrank.VarUse(0x10, phrank.VarUse.VAR_ADD)))
+	write = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_assign(target, value))
+	this_arg = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(0x18, phrank.VarUse.VAR_ADD)))
+	call = phrank.Node(phrank.Node.CALL_CAST, this_arg, 0, phrank.SExpr.create_function(0x7000))
+	write.children.add(call)
+	call.parents.add(write)
+
+	summary = ThisPtrSummary.from_tfg(func_ea, phrank.TFG(write))
+	return summary.writes == {8: [0x5010]} and summary.calls == [(0x18, 0x7000)]
+
+def test_vtable_slots_packing() -> bool:
+	"""testing vtable slots are packed to netnode blob and back"""
+	slots = {0: 0x401000, 8: 0x401020, 0x18: 0x401100}
+	return unpack_slots(pack_slots(slots)) == slots
+
+def test_call_graph_roundtrip() -> bool:
+	"""testing exported call graph is loaded back the same"""
+	fname = tempfile.mktemp()
+	edges = {
+		0x1000: [CallEdge(0x1004, 0x3000), CallEdge(0x1010, 0x5000, 1, 90, 0x8000)],
+		0x3000: [CallEdge(0x3008, 0x1000)],
+	}
+	with CallGraphWriter(fname, [0x1000, 0x2000, 0x3000]) as writer:
+		for func_ea in sorted(edges.keys()):
+			writer.add_node_edges(func_ea, edges[func_ea])
+
+	graph = phrank.CallGraph.load(fname)
+	os.remove(fname)
+	if graph.get_edges(0x2000) != [] or list(graph.target_ids) != [2, 0xFFFFFFFF, 0]:
+		return False
+	return all(graph.get_edges(func_ea) == func_edges for func_ea, func_edges in edges.items())
+
+def test_call_targets_overrides() -> bool:
+	"""testing vtables of derived classes are found once for base vtable"""
+	targets = CallTargets()
+	targets.add_override(0x10, 0x20)
+	generation = targets.generation
+	targets.add_override(0x20, 0x30)
+	# cached call targets are outdated by new overrides
+	if targets.generation == generation:
+		return False
+	targets.add_override(0x10, 0x30)
+	return targets.get_vtables(0x10) == [0x10, 0x20, 0x30] and targets.get_vtables(0x30) == [0x30]
+
+def test_function_summary() -> bool:
+	"""testing function summary of this writes, calls and returns"""
+	func_ea = 0x123456
+	this = phrank.Var(func_ea, 0)
+	target = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(8, phrank.VarUse.VAR_PTR)))
+	write = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_assign(target, phrank.SExpr.create_type_literal(phrank.str2tif("int"))))
+	this_arg = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this))
+	call = phrank.Node(phrank.Node.CALL_CAST, this_arg, 0, phrank.SExpr.create_function(0x7000))
+	ret = phrank.Node(phrank.Node.RETURN, this_arg)
+	for parent, child in ((write, call), (call, ret)):
+		parent.children.add(child)
+		child.parents.add(parent)
+
+	data = serialize_tfg(phrank.TFG(write))
+	if serialize_tfg(deserialize_tfg(data)) != data:
+		return False
+
+	summary = FunctionSummary.from_serialized_tfg(func_ea, data)
+	this_summary = summary.get_lvar(0)
+	if this_summary is None or this_summary.writes != {8} or this_summary.call_casts != {(0x7000, 0)}:
+		return False
+	if this_summary.write_types != {8: {"int"}}:
+		return False
+	if summary.returns != {(FunctionSummary.RETURN_LVAR, 0)} or summary.is_lvar_used(1):
+		return False
+
+	# caller gets uses of argument, that it passes this to
+	caller = FunctionSummary(0x5000)
+	caller.get_lvar_summary(0).call_casts.add((func_ea, 0))
+	if not caller.compose({func_ea: summary}) or caller.compose({func_ea: summary}):
+		return False
+	return caller.get_lvar(0).writes == {8} and caller.get_lvar(0).write_types == {8: {"int"}}
+
+def test_summary_members() -> bool:
+	"""testing members from exact function summary are the same as from var uses"""
+	func_ea = 0x123456
+	this = phrank.Var(func_ea, 0)
+	target = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(8, phrank.VarUse.VAR_PTR)))
+	write = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_assign(target, phrank.SExpr.create_type_literal(phrank.str2tif("int"))))
+	read = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(0x10, phrank.VarUse.VAR_PTR))))
+	write.children.add(read)
+	read.parents.add(write)
+	var_uses = phrank.TFG(write)
+	summary = FunctionSummary.from_serialized_tfg(func_ea, serialize_tfg(var_uses))
+	if not summary.get_lvar(0).is_exact:
+		return False
+
+	def get_members(struc:phrank.Structure) -> list[tuple[int, str]]:
+		return [(o, str(struc.get_member_type(o))) for o in struc.member_offsets()]
+
+	ta = phrank.TypeAnalyzer()
+
+	old_struc = phrank.Structure.new()
+	new_struc = phrank.Structure.new()
+	ta.container_manager.add_struct(old_struc)
+	ta.container_manager.add_struct(new_struc)
+	ta.add_type_uses_to_var(this, var_uses, old_struc.ptr_tinfo)
+	ta.state.set_composed_summary(func_ea, summary)
+	ta.propagate_type_by_summary(this, new_struc.ptr_tinfo)
+	rv = get_members(old_struc) == get_members(new_struc)
+	ta.skip_analysis()
+	if not rv:
+		return False
+
+	# writes of non literals are known only from var uses
+	value = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(phrank.Var(func_ea, 1)))
+	write = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_assign(target, value))
+	summary = FunctionSummary.from_serialized_tfg(func_ea, serialize_tfg(phrank.TFG(write)))
+	return not summary.get_lvar(0).is_exact
+
+def test_call_graph_sccs() -> bool:
+	"""testing call graph components order"""
+	graph = {1: {2}, 2: {3}, 3: {2, 4}, 4: set(), 5: {1, 4, 0x1000}}
+	sccs = find_sccs(graph)
+	if sccs != [[4], [2, 3], [1], [5]]:
+		return False
+	return get_scc_levels(sccs, graph) == [[[4]], [[2, 3]], [[1]], [[5]]]
+
+def test_gvar_index() -> bool:
+	"""testing global var uses index of cached tfg"""
+	func_ea = 0x123456
+	gvar = phrank.Var(0x7000)
+	lvar = phrank.Var(func_ea, 0)
+	gvar_read = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_var_use_chain(phrank.VarUseChain(gvar)))
+	lvar_read = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_var_use_chain(phrank.VarUseChain(lvar)))
+	gvar_read.children.add(lvar_read)
+	lvar_read.parents.add(gvar_read)
+
+	index = GlobalVarIndex()
+	index.add_tfg(func_ea, phrank.TFG(gvar_read))
+	if index.get_func_nodes(gvar.obj_ea, func_ea) != [gvar_read] or index.get_indexed_functions(gvar.obj_ea) != {func_ea}:
+		return False
+	# functions of global var are known from indexed tfgs
+	if func_ea not in gvar.get_functions():
+		return False
+
+	index.remove_func(func_ea)
+	return len(index) == 0 and not index.is_func_indexed(func_ea)
+
+def test_tfg_store_roundtrip() -> bool:
+	"""testing reading serialized tfgs from tfg store"""
+	func_ea = 0x123456
+	this = phrank.Var(func_ea, 0)
+	target = phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this, phrank.VarUse(8, phrank.VarUse.VAR_PTR)))
+	write = phrank.Node(phrank.Node.EXPR, phrank.SExpr.create_assign(target, phrank.SExpr.create_type_literal(phrank.str2tif("int"))))
+	cast = phrank.Node(phrank.Node.TYPE_CAST, phrank.SExpr.create_var_use_chain(phrank.VarUseChain(this)), phrank.str2tif("char*"))
+	write.children.add(cast)
+	cast.parents.add(write)
+	data = serialize_tfg(phrank.TFG(write))
+
+	with tempfile.TemporaryDirectory() as tmpdir:
+		fname = os.path.join(tmpdir, "tfgs.bin")
+		db_hash = phrank.get_input_file_md5()
+		if dump_tfgs(fname, [(func_ea, data)], db_hash) != 1:
+			return False
+		with phrank.TFGStore(fname, db_hash) as store:
+			if store.get_tfg(func_ea) != data or store.get_tfg(func_ea + 1) is not None:
+				return False
+
+		try:
+			phrank.TFGStore(fname, b"another database")
+		except ValueError:
+			return True
+		return False
+
+def test_type_table() -> bool:
+	"""testing interning types in type table"""
+	table = TypeTable()
+	int_id = table.add_type(phrank.str2tif("int"))
+	if int_id == 0 or table.add_type(phrank.str2tif("int")) != int_id or table.add_type(phrank.UNKNOWN_TYPE) != 0:
+		return False
+
+	ptr_id = table.add_string("char*")
+	if not table.get_type(ptr_id).is_ptr() or table.get_type(0) is not phrank.UNKNOWN_TYPE:
+		return False
+
+	loaded = TypeTable.from_serialized(table.serialize())
+	return loaded.get_string(int_id) == "int" and str(loaded.get_type(ptr_id)) == str(table.get_type(ptr_id))
+
 def run_test(test_func:Callable[[], bool]):
 	code = test_func.__code__
 	func_descr = f"{os.path.basename(code.co_filename)}/{test_func.__name__}@{code.co_firstlineno}"